@@ -0,0 +1,86 @@
+import os
+import threading
+
+from llm_backend import get_llm_backend
+from llm_cache import get_llm_cache
+
+LLM_DIRECT = os.getenv('LLM_DIRECT', '1').lower() not in ('0', 'false', 'no')
+CREW_VERBOSE = os.getenv('CREW_VERBOSE', '0').lower() in ('1', 'true', 'yes')
+
+_local = threading.local()
+
+
+class AgentProfile:
+    """Role, goal and backstory of an agent plus the model and temperature it runs with.
+
+    Profiles are plain values shared by every thread. The CrewAI ``Agent`` behind a profile is only
+    built when a task actually runs through a Crew, so CrewAI is never imported on the direct path.
+    """
+
+    __slots__ = ('role', 'goal', 'backstory', 'model', 'temperature')
+
+    def __init__(self, role, goal, backstory, model, temperature=None):
+        self.role = role
+        self.goal = goal
+        self.backstory = backstory
+        self.model = model
+        self.temperature = temperature
+
+
+def create_agent(role, goal, backstory, model, temperature=None) -> AgentProfile:
+    return AgentProfile(role, goal, backstory, model, temperature)
+
+
+def crew_agent(profile: AgentProfile):
+    """The CrewAI agent for ``profile``, built once per thread and reused for every later task.
+
+    Crew runs keep executor state on the agent, so agents are not shared between threads.
+    """
+    from crewai import Agent
+
+    agents = getattr(_local, 'agents', None)
+    if agents is None:
+        agents = _local.agents = {}
+    backend = get_llm_backend()
+    key = (profile.role, profile.goal, profile.backstory, profile.model, profile.temperature, id(backend))
+    agent = agents.get(key)
+    if agent is None:
+        agent = agents[key] = Agent(role=profile.role, goal=profile.goal, backstory=profile.backstory, tools=[],
+                                    verbose=CREW_VERBOSE, llm=backend.chat_model(profile.model, profile.temperature))
+    return agent
+
+
+def task_prompt(agent, description, expected_output) -> str:
+    return '\n'.join([agent.role, agent.goal, agent.backstory, description, expected_output])
+
+
+def complete(agent, description, expected_output) -> str:
+    """One chat completion with the agent's persona as the system prompt, without building a Crew."""
+    system = f"You are {agent.role}. {agent.backstory}\nYour personal goal is: {agent.goal}"
+    prompt = (f"{description}\n\nThis is the expected criteria for your final answer: {expected_output}\n"
+              f"You MUST return the actual complete content as the final answer, not a summary.")
+    return get_llm_backend().complete(system, prompt, agent.model, agent.temperature)
+
+
+def kickoff(agent, description, expected_output) -> str:
+    from crewai import Crew, Task
+
+    agent = crew_agent(agent)
+    task = Task(description=description, agent=agent, expected_output=expected_output)
+    return Crew(agents=[agent], tasks=[task], verbose=CREW_VERBOSE).kickoff()
+
+
+def run_task(agent, description, expected_output, cache=True, direct=None) -> str:
+    """Run a single-task flow, memoized in the LLM cache.
+
+    Single prompts need no orchestration, so unless ``LLM_DIRECT=0`` they go straight to the chat
+    model; ``direct=False`` forces a Crew run. Both paths share cache entries, since the cache key
+    is the same task prompt. Pass cache=False for calls that must produce a fresh completion.
+    """
+    direct = LLM_DIRECT if direct is None else direct
+    backend = get_llm_backend()
+    # Canned and replayed answers are cached apart from real completions
+    model = agent.model if backend.name == 'openai' else f"{backend.name}:{agent.model}"
+    run = complete if direct else kickoff
+    return get_llm_cache().memoize(model, agent.temperature, task_prompt(agent, description, expected_output),
+                                   lambda: run(agent, description, expected_output), cache=cache)
@@ -0,0 +1,128 @@
+"""Pages downloaded per lead by the email spider on a local fixture corpus, with and without
+DropResolvedBusinessMiddleware.
+
+Each fixture business is a small site served from 127.0.0.1: a homepage linking to contact,
+about, team and a few filler pages, with the address on the contact and about pages. Responses
+take --latency seconds, so requests queue up the way they do against real sites. The Google
+decision-maker lookup is skipped, so every lead comes from crawling.
+
+    python benchmarks/bench_crawl_requests.py --businesses 30 --max-in-flight 2 4
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_data = tempfile.mkdtemp(prefix='bench-crawl-')
+os.environ['LEAD_DB_PATH'] = os.path.join(_data, 'leads.sqlite3')
+os.environ['PAGE_CACHE_DIR'] = os.path.join(_data, 'pages')
+
+from scrapy.crawler import CrawlerRunner  # noqa: E402
+from scrapy.utils.log import configure_logging  # noqa: E402
+from scrapy.utils.reactor import install_reactor  # noqa: E402
+
+REACTOR = 'twisted.internet.asyncioreactor.AsyncioSelectorReactor'
+install_reactor(REACTOR)
+
+from twisted.internet import defer, reactor  # noqa: E402
+
+from email_spider import EmailSpider  # noqa: E402
+
+PAGES = ['contact', 'about', 'team', 'services', 'gallery', 'blog', 'news', 'faq']
+
+
+def page_html(business, page):
+    links = ''.join(f'<a href="/b{business}/{name}">{name}</a>' for name in PAGES)
+    address = f'<p>Write to hello@business{business}.example</p>' if page in ('contact', 'about') else ''
+    filler = '<p>We look after our customers.</p>' * 20
+    return f'<html><body><h1>Business {business}: {page}</h1>{links}{address}{filler}</body></html>'.encode()
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    latency = 0.05
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        parts = self.path.strip('/').split('/')
+        if not parts[0].startswith('b'):
+            self.send_error(404)
+            return
+        body = page_html(parts[0][1:], parts[1] if len(parts) > 1 else 'home')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FixtureSpider(EmailSpider):
+    def find_decision_maker(self, company_name, location):
+        return None
+
+
+def spider_class(max_in_flight, drop_resolved):
+    middlewares = dict(EmailSpider.custom_settings['DOWNLOADER_MIDDLEWARES'])
+    if not drop_resolved:
+        middlewares['email_spider.DropResolvedBusinessMiddleware'] = None
+    settings = dict(EmailSpider.custom_settings, DOWNLOADER_MIDDLEWARES=middlewares, DOWNLOAD_DELAY=0,
+                    AUTOTHROTTLE_ENABLED=False, RETRY_ENABLED=False, LOG_LEVEL='ERROR',
+                    BUSINESS_MAX_IN_FLIGHT=max_in_flight)
+    return type('FixtureSpider', (FixtureSpider,), {'custom_settings': settings})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--businesses', type=int, default=30)
+    parser.add_argument('--max-in-flight', type=int, nargs='+', default=[2, 4])
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds per fixture response')
+    args = parser.parse_args()
+
+    FixtureHandler.latency = args.latency
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    configure_logging({'LOG_LEVEL': 'ERROR'})
+    runner = CrawlerRunner({'TWISTED_REACTOR': REACTOR})
+    results = []
+
+    @defer.inlineCallbacks
+    def run_all():
+        try:
+            for max_in_flight in args.max_in_flight:
+                for drop_resolved in (False, True):
+                    # Fresh businesses per run; the item pipeline drops addresses the store has already seen
+                    first = len(results) * args.businesses
+                    businesses = [{'Name': f'Business {i}', 'Website': f'{base}/b{i}/'}
+                                  for i in range(first, first + args.businesses)]
+                    crawler = runner.create_crawler(spider_class(max_in_flight, drop_resolved))
+                    start = time.perf_counter()
+                    yield runner.crawl(crawler, businesses=businesses)
+                    elapsed = time.perf_counter() - start
+                    stats = crawler.stats
+                    results.append((max_in_flight, drop_resolved, stats.get_value('downloader/request_count', 0),
+                                    stats.get_value('business/requests_dropped', 0),
+                                    stats.get_value('item_scraped_count', 0), elapsed))
+        finally:
+            reactor.stop()
+
+    reactor.callWhenRunning(run_all)
+    reactor.run()
+    server.shutdown()
+
+    print(f"businesses: {args.businesses}  fixture latency: {args.latency * 1000:.0f} ms")
+    print(f"{'in flight':>9} {'drop resolved':>14} {'requests':>9} {'dropped':>8} {'leads':>6} {'per lead':>9} {'seconds':>8}")
+    for max_in_flight, drop_resolved, requests_made, dropped, leads, elapsed in results:
+        print(f"{max_in_flight:>9} {'yes' if drop_resolved else 'no':>14} {requests_made:>9} {dropped:>8} {leads:>6} "
+              f"{requests_made / max(leads, 1):>9.2f} {elapsed:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Compare the spider's old email extraction with email_extractor.extract_emails.
+
+Point --corpus at a directory of saved pages (*.html). Without one, a synthetic corpus of
+asset-heavy pages is generated so the benchmark still runs.
+
+    python benchmarks/bench_email_extractor.py --corpus saved_pages/ --repeat 20
+"""
+import argparse
+import glob
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from email_extractor import extract_emails  # noqa: E402
+
+
+def legacy_is_valid_email(email):
+    if '@example.com' in email or 'test@' in email or 'filler@' in email or 'wix' in email or '@google.com' in email or 'name@' in email or 'example@' in email:
+        return False
+    if re.search(r"^\d", email) or re.search(r"^[^a-zA-Z]", email):
+        return False
+    if re.search(r"\d{2,}@|\W@", email):
+        return False
+    if re.search(r'\.(jpg|jpeg|png|webp|gif|bmp)$', email):
+        return False
+    return True
+
+
+def legacy_extract(text):
+    emails = re.findall(r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}", text)
+    return [email.lower() for email in emails if legacy_is_valid_email(email)]
+
+
+def synthetic_page(rng):
+    parts = ['<html><head><style>body{margin:0}</style></head><body>']
+    for i in range(rng.randint(200, 600)):
+        parts.append(f'<div class="c{i}"><img srcset="/img/hero-{i}@2x.png 2x, /img/hero-{i}@3x.webp 3x">'
+                     f'<p>Lorem ipsum dolor sit amet {i} consectetur adipiscing elit.</p></div>')
+    parts.append('<a href="mailto:info%40clinic.example">Contact</a>')
+    parts.append('<a href="/cdn-cgi/l/email-protection" data-cfemail="543d3a323b1437383d3a3d377a3b2633">[email]</a>')
+    parts.append('<footer>Write to hello@clinic.example or test@clinic.example</footer></body></html>')
+    return ''.join(parts)
+
+
+def load_corpus(path, rng):
+    if path:
+        pages = []
+        for filename in sorted(glob.glob(os.path.join(path, '*.htm*'))):
+            with open(filename, encoding='utf-8', errors='replace') as f:
+                pages.append(f.read())
+        if pages:
+            return pages
+        print(f"No *.html files in {path}; using the synthetic corpus")
+    return [synthetic_page(rng) for _ in range(50)]
+
+
+def timed(func, pages, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for page in pages:
+            func(page)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', help='directory of saved HTML pages')
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    pages = load_corpus(args.corpus, random.Random(0))
+    megabytes = sum(len(page) for page in pages) * args.repeat / 1e6
+
+    legacy_found = sum(len(set(legacy_extract(page))) for page in pages)
+    new_found = sum(len(extract_emails(page)) for page in pages)
+
+    legacy = timed(legacy_extract, pages, args.repeat)
+    new = timed(extract_emails, pages, args.repeat)
+    print(f"pages: {len(pages)}  repeat: {args.repeat}  text: {megabytes:.1f} MB")
+    print(f"{'extractor':>12} {'seconds':>9} {'MB/s':>8} {'emails':>7}")
+    print(f"{'legacy':>12} {legacy:>9.3f} {megabytes / legacy:>8.1f} {legacy_found:>7}")
+    print(f"{'compiled':>12} {new:>9.3f} {megabytes / new:>8.1f} {new_found:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Compare the original BeautifulSoup website text extraction with html_text.html_to_text.
+
+Point --corpus at a directory of saved pages (*.html). Without one, a synthetic corpus of
+deeply nested, script-heavy pages is generated so the benchmark still runs.
+
+    python benchmarks/bench_html_text.py --corpus saved_pages/ --repeat 5
+"""
+import argparse
+import glob
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+from html_text import html_to_text  # noqa: E402
+
+
+def legacy_html_to_text(content):
+    soup = BeautifulSoup(content, 'html.parser')
+    text_content = ' '.join([tag.get_text(strip=True) for tag in soup.find_all(['p', 'h1', 'h2', 'h3', 'li', 'span', 'div']) if tag.name not in ['script', 'style']])
+    return ' '.join(text_content.split()[:2000])
+
+
+def synthetic_page(rng):
+    parts = ['<html><head><title>Bright Smile Dental</title>',
+             '<script>' + 'var tracking = {};' * 2000 + '</script>',
+             '<style>' + '.c{margin:0}' * 1000 + '</style></head><body>',
+             '<nav><ul>' + ''.join(f'<li><a href="/p{i}">Page {i}</a></li>' for i in range(40)) + '</ul></nav>',
+             '<div id="cookie-banner"><p>We use cookies to improve your experience.</p></div>']
+    for i in range(rng.randint(150, 400)):
+        depth = rng.randint(3, 8)
+        parts.append('<div class="wrap">' * depth)
+        parts.append(f'<h2>Service {i}</h2><p>Our clinic offers <span>treatment {i}</span> with caring staff '
+                     f'and modern equipment for the whole family.</p>')
+        parts.append('</div>' * depth)
+    parts.append('<footer><p>Copyright Bright Smile Dental. All rights reserved.</p></footer></body></html>')
+    return ''.join(parts).encode('utf-8')
+
+
+def load_corpus(path, rng):
+    if path:
+        pages = []
+        for filename in sorted(glob.glob(os.path.join(path, '*.htm*'))):
+            with open(filename, 'rb') as f:
+                pages.append(f.read())
+        if pages:
+            return pages
+        print(f"No *.html files in {path}; using the synthetic corpus")
+    return [synthetic_page(rng) for _ in range(20)]
+
+
+def timed(func, pages, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for page in pages:
+            func(page)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', help='directory of saved HTML pages')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    pages = load_corpus(args.corpus, random.Random(0))
+    megabytes = sum(len(page) for page in pages) * args.repeat / 1e6
+
+    legacy_words = sum(len(legacy_html_to_text(page).split()) for page in pages)
+    new_words = sum(len(html_to_text(page).split()) for page in pages)
+    legacy = timed(legacy_html_to_text, pages, args.repeat)
+    new = timed(html_to_text, pages, args.repeat)
+    print(f"pages: {len(pages)}  repeat: {args.repeat}  html: {megabytes:.1f} MB")
+    print(f"{'extractor':>12} {'seconds':>9} {'MB/s':>8} {'words':>8}")
+    print(f"{'legacy':>12} {legacy:>9.3f} {megabytes / legacy:>8.1f} {legacy_words:>8}")
+    print(f"{'streaming':>12} {new:>9.3f} {megabytes / new:>8.1f} {new_words:>8}")
+
+
+if __name__ == '__main__':
+    main()
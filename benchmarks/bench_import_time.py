@@ -0,0 +1,68 @@
+"""Import-time cost of the app's modules, each measured in a fresh interpreter.
+
+Runs ``python -X importtime -c "import <module>"`` per module and reports the wall time and the
+heaviest packages it pulled in (cumulative microseconds from -X importtime), so a regression that
+drags crewai, scrapy or pandas back into startup shows up by name.
+
+    python benchmarks/bench_import_time.py main personalization email_automation --top 8
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MODULES = ['main', 'email_automation', 'personalization', 'crewai_needs', 'agent_runner',
+                   'lead_stream', 'crawl_worker']
+
+
+def import_profile(module):
+    """Wall seconds to import ``module`` and the cumulative import microseconds of each package it loaded."""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=ROOT, env=env,
+                            capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        error = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'unknown error'
+        return elapsed, {}, error
+
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        # Every module is imported once, so a package's own line covers all of its submodules
+        if '.' not in name and name != module:
+            packages[name] = int(cumulative)
+    return elapsed, packages, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES)
+    parser.add_argument('--top', type=int, default=5, help='heaviest packages listed per module')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per module; the fastest one is reported')
+    args = parser.parse_args()
+
+    def fastest(module):
+        return min((import_profile(module) for _ in range(args.repeat)), key=lambda profile: profile[0])
+
+    baseline, startup_packages, _ = fastest('sys')
+    print(f"interpreter startup: {baseline * 1000:.0f} ms (subtracted below)")
+    print(f"{'module':>18} {'import ms':>10}  heaviest packages (cumulative ms)")
+    for module in args.modules:
+        elapsed, packages, error = fastest(module)
+        if error:
+            print(f"{module:>18} {'failed':>10}  {error}")
+            continue
+        loaded = [(name, micros) for name, micros in packages.items() if name not in startup_packages]
+        heaviest = sorted(loaded, key=lambda item: item[1], reverse=True)[:args.top]
+        listed = ', '.join(f"{name} {micros / 1000:.0f}" for name, micros in heaviest)
+        print(f"{module:>18} {(elapsed - baseline) * 1000:>10.0f}  {listed}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Framework overhead per LLM call: a Crew kickoff vs the direct completion path of agent_runner.
+
+The chat model is the offline LLM backend, answering instantly (or after --latency seconds), so
+the difference between the two paths is time spent building agents, tasks and crews and in
+CrewAI's own prompting and logging, not in the API.
+
+    python benchmarks/bench_llm_overhead.py --calls 50 --latency 0
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+os.environ['LLM_CACHE_ENABLED'] = '0'
+os.environ.setdefault('OTEL_SDK_DISABLED', 'true')  # CrewAI telemetry, which blocks on offline hosts
+
+import agent_runner  # noqa: E402
+from crewai import Agent, Crew, Task  # noqa: E402
+from llm_backend import OfflineBackend, set_llm_backend  # noqa: E402
+
+MODEL = 'gpt-4o-mini'
+
+
+def classify(backend, index, direct, reuse):
+    role, goal, backstory = ('Email Intent Classifier',
+                             'Accurately classify incoming emails based on their content and intent.',
+                             'You are an AI expert in understanding email communications and their underlying intents.')
+    if reuse:
+        agent = agent_runner.create_agent(role, goal, backstory, MODEL)
+    else:
+        agent = Agent(role=role, goal=goal, backstory=backstory, tools=[], verbose=True,
+                      llm=backend.chat_model(MODEL))
+    description = f"Classify the following email based on its content and intent.\n\nEmail Content:\nReply number {index}"
+    expected_output = 'Classification: [category]\nExplanation: [Brief explanation]'
+    if direct:
+        return agent_runner.complete(agent, description, expected_output)
+    if reuse:
+        return agent_runner.kickoff(agent, description, expected_output)
+    task = Task(description=description, agent=agent, expected_output=expected_output)
+    return Crew(agents=[agent], tasks=[task], verbose=True).kickoff()
+
+
+def timed(backend, calls, direct, reuse):
+    start = time.perf_counter()
+    for index in range(calls):
+        classify(backend, index, direct, reuse)
+    return (time.perf_counter() - start) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds the offline backend takes per call')
+    args = parser.parse_args()
+
+    backend = OfflineBackend(latency=args.latency)
+    set_llm_backend(backend)
+    runs = [
+        ('crew, new agent, verbose', False, False),
+        ('crew, reused agent', False, True),
+        ('direct completion', True, True),
+    ]
+    print(f"calls: {args.calls}  backend latency: {args.latency * 1000:.0f} ms")
+    print(f"{'path':>26} {'ms/call':>9} {'overhead ms':>12}")
+    for name, direct, reuse in runs:
+        per_call = timed(backend, args.calls, direct, reuse)
+        print(f"{name:>26} {per_call * 1000:>9.2f} {(per_call - args.latency) * 1000:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Throughput of queries_leads and run_email_automation on the offline LLM backend.
+
+Every LLM call goes to the deterministic offline backend with --latency seconds (plus up to
+--jitter) per call, websites are served from one saved page, and emails go to an SMTP stub, so
+the numbers measure the pipeline itself and are repeatable without network access. With
+--min-leads-per-minute the run exits non-zero when throughput falls below it, for use as a
+regression check.
+
+    python benchmarks/bench_offline_throughput.py --leads 40 --latency 0.5 --concurrency 1 4 8
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_data = tempfile.mkdtemp(prefix='bench-offline-')
+os.environ['LEAD_DB_PATH'] = os.path.join(_data, 'leads.sqlite3')
+os.environ['DIGEST_CACHE_PATH'] = os.path.join(_data, 'digests.sqlite3')
+os.environ['LLM_CACHE_ENABLED'] = '0'
+os.environ['LLM_BACKEND'] = 'offline'
+
+import email_automation  # noqa: E402
+import personalization  # noqa: E402
+from crewai_needs import queries_leads  # noqa: E402
+from llm_backend import OfflineBackend, set_llm_backend  # noqa: E402
+from send_scheduler import SendScheduler  # noqa: E402
+
+PAGE = ('<html><head><title>Bright Smile Dental</title></head><body><h1>Bright Smile Dental</h1>'
+        '<p>Gentle family dentistry in the heart of the city since 1998.</p>'
+        '<h2>Our Services</h2><ul><li>Check-ups and cleaning</li><li>Whitening</li><li>Implants</li></ul>'
+        '<h2>About Us</h2><p>Three dentists and a friendly team who make every visit comfortable.</p>'
+        '<h2>Latest News</h2><p>We opened a second clinic with evening appointments.</p></body></html>').encode()
+
+
+class StubSMTP:
+    def __init__(self):
+        self.sent = 0
+
+    def sendmail(self, sender, recipients, message):
+        self.sent += 1
+        return {}
+
+
+def bench_queries(calls):
+    start = time.perf_counter()
+    for index in range(calls):
+        queries_leads(f'dentist {index}', 'Sevilla, España', cache=False)
+    return (time.perf_counter() - start) / calls
+
+
+def bench_campaign(leads, concurrency):
+    rows = [{'Name': f'Business {i}', 'Website': f'https://business{i}.example', 'Email': f'info@business{i}.example'}
+            for i in range(leads)]
+    smtp = StubSMTP()
+    scheduler = SendScheduler(workers=4, daily_quota=10 ** 6, hourly_quota=10 ** 6, interval=0, jitter=0)
+    start = time.perf_counter()
+    email_automation.run_email_automation('https://sender.example', 'Sender', '', smtp, 'sender@example.com',
+                                          'app-password', rows, concurrency=concurrency,
+                                          send_scheduler=scheduler).result()
+    elapsed = time.perf_counter() - start
+    return smtp.sent, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--leads', type=int, default=40)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--latency', type=float, default=0.2, help='seconds per offline LLM call')
+    parser.add_argument('--jitter', type=float, default=0.1, help='extra random seconds per offline LLM call')
+    parser.add_argument('--query-calls', type=int, default=5)
+    parser.add_argument('--min-leads-per-minute', type=float, help='fail when the best run is slower than this')
+    args = parser.parse_args()
+
+    backend = OfflineBackend(latency=args.latency, jitter=args.jitter)
+    set_llm_backend(backend)
+    personalization.fetch_page = lambda url: PAGE
+    # Replies would be read over IMAP; the offline run has none
+    email_automation.check_for_responses = lambda *args, **kwargs: None
+
+    per_query = bench_queries(args.query_calls)
+    print(f"offline LLM latency: {args.latency * 1000:.0f} ms + up to {args.jitter * 1000:.0f} ms")
+    print(f"queries_leads: {per_query * 1000:.0f} ms/call over {args.query_calls} calls")
+    print(f"{'workers':>8} {'sent':>6} {'seconds':>8} {'leads/min':>10} {'LLM calls':>10}")
+    best = 0.0
+    for concurrency in args.concurrency:
+        calls_before = backend.calls
+        sent, elapsed = bench_campaign(args.leads, concurrency)
+        per_minute = sent / elapsed * 60
+        best = max(best, per_minute)
+        print(f"{concurrency:>8} {sent:>6} {elapsed:>8.2f} {per_minute:>10.1f} {backend.calls - calls_before:>10}")
+
+    if args.min_leads_per_minute is not None and best < args.min_leads_per_minute:
+        print(f"FAIL: {best:.1f} leads/min is below {args.min_leads_per_minute}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Leads prepared per minute by the personalization pipeline at different worker counts.
+
+The scrape and LLM calls are replaced by sleeps drawn from a latency profile, so the numbers
+show how much of the per-lead latency the worker pool hides, not real API throughput.
+
+    python benchmarks/bench_personalization_pipeline.py --leads 40 --concurrency 1 2 4 8
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+
+import email_automation  # noqa: E402
+
+
+def fake_personalize_prospect_email(lead_site, custom_offer):
+    time.sleep(random.uniform(1.0, 3.0) * SCALE)  # scrape + LLM analysis
+    return f"Prospect info for {lead_site}"
+
+
+def fake_craft_email(user_offer, prospect_personalization, user_name, user_web, prospect_name,
+                     last_positive_reply=None):
+    time.sleep(random.uniform(1.5, 4.0) * SCALE)  # LLM email drafting
+    return f"Subject: Quick question\nHi {prospect_name},\n{prospect_personalization}"
+
+
+SCALE = 0.1
+
+
+def run(leads, concurrency):
+    rows = [{'Name': f'Business {i}', 'Website': f'https://business{i}.example', 'Email': f'info@business{i}.example'}
+            for i in range(leads)]
+
+    def prepare(lead):
+        return email_automation.prepare_lead_email(lead, 'offer', 'Sender', 'https://sender.example', '', 'None')
+
+    start = time.perf_counter()
+    prepared = sum(1 for _, parts, error in email_automation.iter_prepared_emails(rows, prepare, concurrency)
+                   if error is None)
+    elapsed = time.perf_counter() - start
+    return prepared, elapsed
+
+
+def main():
+    global SCALE
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--leads', type=int, default=40)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--scale', type=float, default=SCALE,
+                        help='multiplier applied to the synthetic latencies (1.0 = realistic seconds)')
+    args = parser.parse_args()
+    SCALE = args.scale
+
+    email_automation.personalize_prospect_email = fake_personalize_prospect_email
+    email_automation.craft_email = fake_craft_email
+
+    random.seed(0)
+    print(f"{'workers':>8} {'leads':>6} {'seconds':>9} {'leads/min':>10}")
+    for concurrency in args.concurrency:
+        prepared, elapsed = run(args.leads, concurrency)
+        # Report in real-latency minutes so runs at different --scale are comparable.
+        per_minute = prepared / (elapsed / args.scale) * 60
+        print(f"{concurrency:>8} {prepared:>6} {elapsed:>9.2f} {per_minute:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Average website tokens per lead in the prospect prompt, raw page text vs the compacted digest.
+
+Point --corpus at a directory of saved pages (*.html). Without one, a synthetic corpus of small
+business sites is generated. Tokens are counted with tiktoken when its encodings are available
+and estimated otherwise (the header says which).
+
+    python benchmarks/bench_prompt_compaction.py --corpus saved_pages/ --budget 400 600 800
+"""
+import argparse
+import glob
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from html_text import extract_blocks, html_to_text  # noqa: E402
+from page_digest import compact_blocks, estimate_tokens, get_token_counter  # noqa: E402
+
+SECTIONS = ['Our Services', 'About Us', 'Latest News', 'Opening Hours', 'Insurance', 'Gallery', 'FAQ']
+WORDS = ('gentle dental care family clinic implants whitening orthodontics children adults team modern '
+         'equipment appointment insurance emergency smile comfortable experienced hygienist crowns '
+         'veneers friendly city neighbourhood award patients treatment consultation').split()
+
+
+def sentence(rng):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(10, 25))).capitalize() + '.'
+
+
+def synthetic_page(rng):
+    parts = ['<html><head><title>Bright Smile Dental</title></head><body>',
+             '<header><h1>Bright Smile Dental</h1><p>Gentle dental care in the heart of the city.</p></header>']
+    for heading in rng.sample(SECTIONS, len(SECTIONS)):
+        parts.append(f'<section><h2>{heading}</h2>')
+        for _ in range(rng.randint(2, 8)):
+            parts.append(f'<div class="card"><p>{sentence(rng)}</p><p>Read more</p></div>')
+        parts.append('<ul>' + ''.join(f'<li>{rng.choice(WORDS).title()}</li>' for _ in range(rng.randint(3, 10))) + '</ul>')
+        parts.append('</section>')
+    # Promotional banners repeated down the page
+    parts.append('<div class="promo"><p>Book your free check-up today and bring a friend along.</p></div>' * 5)
+    parts.append('</body></html>')
+    return ''.join(parts).encode('utf-8')
+
+
+def load_corpus(path, rng):
+    if path:
+        pages = []
+        for filename in sorted(glob.glob(os.path.join(path, '*.htm*'))):
+            with open(filename, 'rb') as f:
+                pages.append(f.read())
+        if pages:
+            return pages
+        print(f"No *.html files in {path}; using the synthetic corpus")
+    return [synthetic_page(rng) for _ in range(50)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', help='directory of saved HTML pages')
+    parser.add_argument('--budget', type=int, nargs='+', default=[300, 600, 1000])
+    args = parser.parse_args()
+
+    pages = load_corpus(args.corpus, random.Random(0))
+    count_tokens = get_token_counter()
+    counter = 'estimated' if count_tokens is estimate_tokens else 'tiktoken'
+
+    before = sum(count_tokens(html_to_text(page)) for page in pages) / len(pages)
+    print(f"pages: {len(pages)}  tokens: {counter}")
+    print(f"{'budget':>8} {'tokens/lead':>12} {'reduction':>10} {'ms/page':>8}")
+    print(f"{'raw':>8} {before:>12.0f} {'':>10} {'':>8}")
+    blocks = [extract_blocks(page) for page in pages]
+    for budget in args.budget:
+        start = time.perf_counter()
+        digests = [compact_blocks(page_blocks, budget, count_tokens) for page_blocks in blocks]
+        elapsed = (time.perf_counter() - start) * 1000 / len(pages)
+        after = sum(count_tokens(digest) for digest in digests) / len(pages)
+        print(f"{budget:>8} {after:>12.0f} {1 - after / before:>10.0%} {elapsed:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+import logging
+import os
+import threading
+import traceback
+from collections import Counter
+from concurrent.futures import Future
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import lead_store
+
+CAMPAIGN_WORKERS = int(os.getenv('CAMPAIGN_WORKERS', '4'))
+CAMPAIGNS_PER_SENDER = int(os.getenv('CAMPAIGNS_PER_SENDER', '1'))
+
+
+class CampaignScheduler:
+    """Runs queued campaigns on a fixed pool of worker threads.
+
+    Jobs live in the lead store's ``campaign_jobs`` table, so campaigns that were queued or running
+    when the process stopped are picked up again by ``start``. At most ``per_sender`` campaigns run
+    for the same Gmail account at once; later ones wait in the queue instead of opening more SMTP
+    sessions. ``runner(payload, campaign_id, cancel_event)`` is expected to return early once
+    ``cancel_event`` is set; if it returns a ``Future`` the job stays running until that completes,
+    without holding a worker thread.
+
+    Payload keys listed in ``secret_fields`` (the sender's app password) are never written to the job
+    row; they are kept in memory only. A job queued before a restart therefore waits until ``resume``
+    supplies its secrets again.
+    """
+
+    def __init__(self, runner: Callable[[Dict[str, Any], int, threading.Event], None],
+                 workers: int = CAMPAIGN_WORKERS, per_sender: int = CAMPAIGNS_PER_SENDER,
+                 secret_fields: Iterable[str] = ()):
+        self.runner = runner
+        self.workers = workers
+        self.per_sender = per_sender
+        self.secret_fields = tuple(secret_fields)
+        self.secrets: Dict[int, Dict[str, Any]] = {}
+        self.running = Counter()
+        self.cancel_events: Dict[int, threading.Event] = {}
+        self.condition = threading.Condition()
+        self.threads = []
+        self.stopping = False
+
+    def start(self) -> None:
+        with self.condition:
+            if self.threads:
+                return
+            resumed = lead_store.requeue_interrupted_jobs()
+            if resumed:
+                logging.info(f"Resuming {resumed} interrupted campaigns")
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"campaign-worker-{index}", daemon=True)
+                thread.start()
+                self.threads.append(thread)
+        logging.info(f"Campaign scheduler started with {self.workers} workers, {self.per_sender} per sender")
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        with self.condition:
+            self.stopping = True
+            for event in self.cancel_events.values():
+                event.set()
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def submit(self, campaign_id: int, gmail: str, payload: Dict[str, Any]) -> None:
+        stored = {key: value for key, value in payload.items() if key not in self.secret_fields}
+        with self.condition:
+            self.secrets[campaign_id] = {key: payload[key] for key in self.secret_fields if key in payload}
+        lead_store.enqueue_job(campaign_id, gmail, stored)
+        self.start()
+        with self.condition:
+            self.condition.notify()
+
+    def resume(self, campaign_id: int, secrets: Dict[str, Any]) -> bool:
+        """Supply the secrets of a queued job that lost them in a restart; False if it is not queued."""
+        job = lead_store.get_job(campaign_id)
+        if job is None or job['status'] != 'queued':
+            return False
+        with self.condition:
+            self.secrets[campaign_id] = {key: secrets[key] for key in self.secret_fields if key in secrets}
+            self.condition.notify()
+        return True
+
+    def cancel(self, campaign_id: int) -> bool:
+        """Drop a queued campaign or ask a running one to stop; False if it already ended."""
+        with self.condition:
+            if lead_store.cancel_queued_job(campaign_id):
+                self.secrets.pop(campaign_id, None)
+                return True
+            event = self.cancel_events.get(campaign_id)
+            if event is None:
+                return False
+            event.set()
+            return True
+
+    def status(self, campaign_id: int) -> Optional[Dict[str, Any]]:
+        job = lead_store.get_job(campaign_id)
+        if job is not None:
+            with self.condition:
+                event = self.cancel_events.get(campaign_id)
+                job['cancel_requested'] = event is not None and event.is_set()
+                job['needs_secrets'] = (job['status'] == 'queued' and bool(self.secret_fields)
+                                        and campaign_id not in self.secrets)
+        return job
+
+    def _busy_senders(self):
+        return [gmail for gmail, count in self.running.items() if count >= self.per_sender]
+
+    def _next_job(self):
+        with self.condition:
+            while not self.stopping:
+                # Without its secrets a job cannot run; it stays queued until resume() provides them
+                ready = set(self.secrets) if self.secret_fields else None
+                job = lead_store.claim_next_job(self._busy_senders(), ready)
+                if job is not None:
+                    campaign_id, gmail, payload = job
+                    self.running[gmail] += 1
+                    self.cancel_events[campaign_id] = threading.Event()
+                    return campaign_id, gmail, {**payload, **self.secrets.pop(campaign_id, {})}
+                # Woken by submit() or by a finishing job freeing a sender slot; the timeout is a safety net.
+                self.condition.wait(30)
+        return None
+
+    def _work(self) -> None:
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            campaign_id, gmail, payload = job
+            cancel_event = self.cancel_events[campaign_id]
+            logging.info(f"Running campaign {campaign_id} for {gmail}")
+            try:
+                result = self.runner(payload, campaign_id, cancel_event)
+            except Exception as e:
+                logging.error(f"Campaign {campaign_id} failed: {e}")
+                logging.error(traceback.format_exc())
+                self._finish(campaign_id, gmail, 'failed', str(e))
+                continue
+
+            if isinstance(result, Future):
+                # The campaign's sends are paced elsewhere; free this worker and keep the sender slot until they finish.
+                result.add_done_callback(partial(self._finish_future, campaign_id, gmail))
+            else:
+                self._finish(campaign_id, gmail, 'cancelled' if cancel_event.is_set() else 'finished')
+
+    def _finish_future(self, campaign_id: int, gmail: str, future: Future) -> None:
+        error = None if future.cancelled() else future.exception()
+        if error is not None:
+            logging.error(f"Campaign {campaign_id} failed: {error}")
+            self._finish(campaign_id, gmail, 'failed', str(error))
+        else:
+            cancelled = future.cancelled() or self.cancel_events[campaign_id].is_set()
+            self._finish(campaign_id, gmail, 'cancelled' if cancelled else 'finished')
+
+    def _finish(self, campaign_id: int, gmail: str, status: str, error: Optional[str] = None) -> None:
+        with self.condition:
+            # Jobs interrupted by shutdown stay 'running' so the next start() requeues them.
+            if not (self.stopping and status == 'cancelled'):
+                lead_store.finish_job(campaign_id, status, error)
+            self.running[gmail] -= 1
+            if self.running[gmail] <= 0:
+                del self.running[gmail]
+            del self.cancel_events[campaign_id]
+            self.condition.notify_all()
+        logging.info(f"Campaign {campaign_id} {status}")
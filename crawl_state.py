@@ -0,0 +1,92 @@
+import heapq
+from typing import Iterable, List
+from urllib.parse import urlparse, urlunparse
+
+from w3lib.url import canonicalize_url
+
+# Lower rank is crawled first; contact pages are where addresses usually live.
+PAGE_PRIORITIES = (
+    (0, ('contact', 'contacto', 'kontakt', 'contatti', 'impressum', 'legal', 'aviso-legal')),
+    (1, ('about', 'nosotros', 'quienes-somos', 'sobre', 'equipo')),
+    (2, ('team', 'people', 'staff')),
+)
+DEFAULT_RANK = 5
+
+
+def strip_www(host: str) -> str:
+    host = host.lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+def normalize_url(url: str) -> str:
+    """Canonical form used for dedup: sorted query, no fragment, lower-case host without www, no trailing slash."""
+    parsed = urlparse(canonicalize_url(url, keep_fragments=False))
+    path = parsed.path.rstrip('/') or '/'
+    return urlunparse((parsed.scheme.lower(), strip_www(parsed.netloc), path, parsed.params, parsed.query, ''))
+
+
+def page_rank(url: str) -> int:
+    path = urlparse(url).path.lower()
+    for rank, keywords in PAGE_PRIORITIES:
+        if any(keyword in path for keyword in keywords):
+            return rank
+    return DEFAULT_RANK
+
+
+class BusinessCrawlState:
+    """Crawl bookkeeping shared by every request made for one business.
+
+    ``budget`` caps the total pages requested for the business however the link graph fans out,
+    ``seen`` holds normalized URLs so each page is requested once, and the frontier is a heap that
+    hands out contact/about/team pages before anything else. Only ``max_in_flight`` requests are
+    outstanding at a time, so links found on early pages still compete for the remaining budget.
+    """
+
+    def __init__(self, website: str, budget: int = 10, max_in_flight: int = 2):
+        self.domain = strip_www(urlparse(website).netloc)
+        self.budget = budget
+        self.max_in_flight = max_in_flight
+        self.seen = set()
+        self.frontier = []
+        self.requested = 0
+        self.in_flight = 0
+        self.resolved = False
+        self._counter = 0
+
+    def is_internal(self, url: str) -> bool:
+        netloc = urlparse(url).netloc
+        return not netloc or strip_www(netloc) == self.domain
+
+    def claim(self, url: str) -> bool:
+        """Spend budget on ``url`` outside the frontier (the homepage, retries); False once the budget is gone."""
+        if self.requested >= self.budget:
+            return False
+        self.seen.add(normalize_url(url))
+        self.requested += 1
+        self.in_flight += 1
+        return True
+
+    def add_links(self, urls: Iterable[str]) -> None:
+        for url in urls:
+            if not url.startswith('http') or not self.is_internal(url):
+                continue
+            key = normalize_url(url)
+            if key in self.seen:
+                continue
+            self.seen.add(key)
+            self._counter += 1
+            heapq.heappush(self.frontier, (page_rank(url), self._counter, url))
+
+    def next_urls(self) -> List[tuple]:
+        """Pop as many ``(rank, url)`` pairs as the budget and in-flight limit allow."""
+        urls = []
+        while (self.frontier and not self.resolved and self.requested < self.budget
+               and self.in_flight < self.max_in_flight):
+            rank, _, url = heapq.heappop(self.frontier)
+            self.requested += 1
+            self.in_flight += 1
+            urls.append((rank, url))
+        return urls
+
+    def finished_request(self) -> None:
+        self.in_flight = max(0, self.in_flight - 1)
@@ -0,0 +1,135 @@
+import logging
+import queue
+import sys
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from scrapy import signals
+from scrapy.crawler import CrawlerRunner
+from scrapy.utils.log import configure_logging
+from scrapy.utils.project import get_project_settings
+from scrapy.utils.reactor import install_reactor
+from twisted.python.failure import Failure
+
+from email_spider import EmailSpider
+
+_DONE = object()
+
+
+class CrawlWorker:
+    """Keeps one Twisted reactor running on a background thread and crawls batches of businesses on it.
+
+    A reactor cannot be restarted, so ``CrawlerProcess.start()`` only works once per process; here
+    the reactor starts once and every campaign query hands its businesses to the reactor thread
+    through ``callFromThread``. Leads are streamed back from the ``item_scraped`` signal as the
+    spider finds them, after the item pipeline has stored and deduplicated them.
+    """
+
+    def __init__(self, settings=None):
+        self.settings = settings if settings is not None else get_project_settings()
+        self.runner = None
+        self.thread = None
+        self._started = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self._run_reactor, name='crawl-reactor', daemon=True)
+            self.thread.start()
+        self._started.wait()
+
+    def _run_reactor(self) -> None:
+        reactor_path = self.settings.get('TWISTED_REACTOR')
+        if reactor_path and 'twisted.internet.reactor' not in sys.modules:
+            # Installed here so an asyncio reactor gets its event loop on this thread
+            install_reactor(reactor_path, self.settings.get('ASYNCIO_EVENT_LOOP'))
+        from twisted.internet import reactor
+
+        # Scrapy's log levels and filters; records go to the root handler the app configured
+        configure_logging(self.settings, install_root_handler=False)
+        self.runner = CrawlerRunner(self.settings)
+        reactor.callWhenRunning(self._started.set)
+        logging.info("Crawl worker reactor started")
+        reactor.run(installSignalHandlers=False)
+
+    def stop(self) -> None:
+        from twisted.internet import reactor
+
+        if self.thread is None:
+            return
+
+        def shutdown():
+            self.runner.stop().addBoth(lambda _: reactor.stop())
+
+        reactor.callFromThread(shutdown)
+        self.thread.join()
+
+    def crawl(self, campaign_id: Optional[int] = None, businesses: Optional[List[Dict[str, Any]]] = None,
+              on_lead: Optional[Callable[[Dict[str, Any]], None]] = None) -> Future:
+        """Crawl ``businesses`` (or the campaign's leads without an email) and return a future of the leads found.
+
+        ``on_lead`` is called on the reactor thread for every lead as soon as it is stored.
+        """
+        from twisted.internet import reactor
+
+        self.start()
+        future = Future()
+        future.set_running_or_notify_cancel()
+        leads = []
+
+        def item_scraped(item, response, spider):
+            lead = dict(item)
+            leads.append(lead)
+            if on_lead is not None:
+                try:
+                    on_lead(lead)
+                except Exception as e:
+                    logging.error(f"Error handling lead {lead.get('Name')}: {e}")
+
+        def finished(result):
+            if isinstance(result, Failure):
+                logging.error(f"Crawl for campaign {campaign_id} failed: {result.getErrorMessage()}")
+                future.set_exception(result.value)
+            else:
+                future.set_result(leads)
+
+        def schedule():
+            try:
+                crawler = self.runner.create_crawler(EmailSpider)
+                # weak=False: the handler is a closure nothing else keeps alive
+                crawler.signals.connect(item_scraped, signal=signals.item_scraped, weak=False)
+                self.runner.crawl(crawler, campaign_id=campaign_id, businesses=businesses).addBoth(finished)
+            except Exception as e:
+                logging.error(f"Could not start crawl for campaign {campaign_id}: {e}")
+                future.set_exception(e)
+
+        reactor.callFromThread(schedule)
+        return future
+
+    def iter_leads(self, campaign_id: Optional[int] = None,
+                   businesses: Optional[List[Dict[str, Any]]] = None) -> Iterator[Dict[str, Any]]:
+        """Yield leads on the calling thread as the crawl finds them."""
+        found = queue.Queue()
+        future = self.crawl(campaign_id, businesses, on_lead=found.put)
+        future.add_done_callback(lambda _: found.put(_DONE))
+        while True:
+            lead = found.get()
+            if lead is _DONE:
+                break
+            yield lead
+        future.result()
+
+
+_default_worker = None
+_default_lock = threading.Lock()
+
+
+def get_crawl_worker() -> CrawlWorker:
+    global _default_worker
+    with _default_lock:
+        if _default_worker is None:
+            _default_worker = CrawlWorker()
+        return _default_worker
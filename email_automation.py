@@ -1,18 +1,26 @@
-import json
 import os
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import logging
 from dotenv import load_dotenv
-from personalization import personalize_user_offer, personalize_prospect_email, craft_email, handle_email_response
-import imaplib
-import email
+from personalization import personalize_user_offer, personalize_prospect_email, craft_email, handle_email_response, triage_replies
+from llm_cache import get_llm_cache
+from page_digest import get_digest_cache
+from imap_scan import scan_replies, get_sent_index
+from imap_pool import imap_session
+from send_scheduler import SendScheduler, gather, get_send_scheduler
 from datetime import datetime, timedelta
-import pandas as pd
-from typing import List, Dict, Any
+import lead_store
+import event_bus
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Optional, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
 import traceback
+import queue
 import random
+import re
+import threading
 import time
 
 # Set up logging
@@ -22,6 +30,15 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 # Load environment variables
 load_dotenv()
 
+DEFAULT_PERSONALIZATION_CONCURRENCY = int(os.getenv('PERSONALIZATION_CONCURRENCY', '4'))
+MAX_QUEUED_SENDS = int(os.getenv('MAX_QUEUED_SENDS', '10'))
+
+
+def save_lead(lead: Dict[str, Any], *fields: str) -> None:
+    # Leads loaded from the lead store carry their row id; persist just the fields that changed.
+    if lead.get('id'):
+        lead_store.update_lead(lead['id'], {field: lead.get(field) for field in fields})
+
 
 def send_email(recipient: str, subject: str, body: str, smtp_connection) -> bool:
     msg = MIMEMultipart()
@@ -37,22 +54,23 @@ def send_email(recipient: str, subject: str, body: str, smtp_connection) -> bool
         return False
 
 
-def check_for_responses(leads: List[Dict[str, Any]], gmail: str, app_password: str) -> None:
+def check_for_responses(leads: List[Dict[str, Any]], gmail: str, app_password: str,
+                        since: Optional[datetime] = None, campaign_id=None) -> None:
+    pending = {lead['Email'].strip().lower(): lead for lead in leads if lead.get('Email') and not lead.get('Response')}
+    if not pending:
+        return
+
     try:
-        with imaplib.IMAP4_SSL(os.getenv('IMAP_SERVER')) as mail:
-            mail.login(gmail, app_password)
-            mail.select('inbox')
-
-            for lead in leads:
-                if lead['Response'] is None:
-                    _, search_data = mail.search(None, f'FROM {lead["Email"]}')
-                    for num in search_data[0].split():
-                        _, data = mail.fetch(num, '(RFC822)')
-                        email_message = email.message_from_bytes(data[0][1])
-                        lead['Response'] = 'Received'
-                        lead['ResponseDate'] = datetime.now().isoformat()
-                        lead['ResponseContent'] = get_email_content(email_message)
-                        logging.info(f"Response received from {lead['Email']}")
+        with imap_session(gmail, app_password) as mail:
+            replies = scan_replies(mail, pending, gmail, since=since, campaign_id=campaign_id)
+
+        for reply in replies:
+            lead = pending[reply['sender']]
+            lead['Response'] = 'Received'
+            lead['ResponseDate'] = (reply['date'] or datetime.now()).isoformat()
+            lead['ResponseContent'] = reply['body']
+            save_lead(lead, 'Response', 'ResponseDate', 'ResponseContent')
+            logging.info(f"Response received from {lead['Email']}")
     except Exception as e:
         logging.info(f"Error checking for responses: {e}")
 
@@ -66,142 +84,306 @@ def get_email_content(email_message):
         return email_message.get_payload(decode=True).decode()
 
 
-def get_email_thread(recipient: str, gmail: str, app_password: str) -> List[Dict[str, str]]:
-    thread = []
+def get_email_threads(recipients: List[str], gmail: str, app_password: str) -> Dict[str, List[Dict[str, str]]]:
+    threads = {recipient: [] for recipient in recipients}
     try:
-        with imaplib.IMAP4_SSL(os.getenv('IMAP_SERVER')) as mail:
-            mail.login(gmail, app_password)
-            mail.select('sent')
-
-            _, search_data = mail.search(None, f'TO {recipient}')
-            for num in reversed(search_data[0].split()):  # Reverse to get most recent emails first
-                _, data = mail.fetch(num, '(RFC822)')
-                email_message = email.message_from_bytes(data[0][1])
-                thread.append({
-                    'subject': email_message['subject'],
-                    'body': get_email_content(email_message),
-                    'date': email.utils.parsedate_to_datetime(email_message['Date'])
-                })
+        with imap_session(gmail, app_password) as mail:
+            found = get_sent_index(gmail).threads(mail, recipients)
+        for recipient in recipients:
+            threads[recipient] = found.get(recipient.strip().lower(), [])
     except Exception as e:
-        logging.info(f"Error retrieving email thread: {e}")
+        logging.info(f"Error retrieving email threads: {e}")
+
+    return threads
 
-    return thread
+
+def get_email_thread(recipient: str, gmail: str, app_password: str) -> List[Dict[str, str]]:
+    return get_email_threads([recipient], gmail, app_password)[recipient]
 
 
 def send_follow_ups(leads: List[Dict[str, Any]], user_offer: Dict[str, Any], smtp_connection, gmail: str,
-                    app_password: str, user_name: str, user_web: str, last_positive_reply: str) -> None:
-    for lead in leads:
-        if lead['Response'] is not None and lead['FollowUpCount'] < 4:
-            previous_emails = get_email_thread(lead['Email'], gmail, app_password)
-            prospect_personalization = personalize_prospect_email(lead['Website'], '')
-
-            response = handle_email_response(
-                lead['ResponseContent'],
-                user_offer,
-                prospect_personalization,
-                user_name,
-                user_web,
-                lead['Name'],
-                previous_emails
-            )
-
-            follow_up_email = response['follow_up_email']
-
-            if send_email(lead['Email'], follow_up_email['subject'], follow_up_email['body'], smtp_connection):
-                lead['FollowUpCount'] += 1
-                lead['LastEmailDate'] = datetime.now().isoformat()
-                lead['LastEmailClassification'] = response['classification']
-                logging.info(
-                    f"Follow-up {lead['FollowUpCount']} sent to {lead['Email']} (Classification: {response['classification']})")
-
-            # Update the last positive reply if this response was positive
-            if response['classification'] == 'Interested' and response['last_positive_reply'] != "No positive reply found":
-                last_positive_reply = response['last_positive_reply']
+                    app_password: str, user_name: str, user_web: str, last_positive_reply: str,
+                    scheduler: Optional[SendScheduler] = None,
+                    cancel_event: Optional[threading.Event] = None) -> List[Future]:
+    """Write follow-ups for leads that replied and queue them on the send scheduler."""
+    scheduler = scheduler or get_send_scheduler()
+    follow_up_leads = [lead for lead in leads if lead.get('Response') and int(lead.get('FollowUpCount') or 0) < 4]
+    threads = get_email_threads([lead['Email'] for lead in follow_up_leads], gmail, app_password) if follow_up_leads else {}
+
+    def deliver(lead, subject, body, classification):
+        if send_email(lead['Email'], subject, body, smtp_connection):
+            lead['FollowUpCount'] = int(lead.get('FollowUpCount') or 0) + 1
+            lead['LastEmailDate'] = datetime.now().isoformat()
+            lead['LastEmailClassification'] = classification
+            save_lead(lead, 'FollowUpCount', 'LastEmailDate', 'LastEmailClassification')
+            logging.info(
+                f"Follow-up {lead['FollowUpCount']} sent to {lead['Email']} (Classification: {classification})")
+            return True
+        return False
+
+    # All replies are triaged together, then every follow-up is written concurrently, so the batch
+    # takes about as long as its slowest LLM call rather than the sum of them.
+    triaged = triage_replies({lead['Email']: (lead['ResponseContent'], threads[lead['Email']])
+                              for lead in follow_up_leads})
+
+    def write_follow_up(lead):
+        prospect_personalization = personalize_prospect_email(lead['Website'], '')
+        return handle_email_response(
+            lead['ResponseContent'],
+            user_offer,
+            prospect_personalization,
+            user_name,
+            user_web,
+            lead['Name'],
+            threads[lead['Email']],
+            triage=triaged.get(lead['Email'])
+        )
+
+    sends = []
+    with ThreadPoolExecutor(max_workers=DEFAULT_PERSONALIZATION_CONCURRENCY, thread_name_prefix='follow-up') as pool:
+        responses = [(lead, pool.submit(write_follow_up, lead)) for lead in follow_up_leads]
+        for lead, future in responses:
+            try:
+                response = future.result()
+            except Exception as e:
+                logging.error(f"Error writing follow-up for {lead['Email']}: {e}")
+                continue
+            subject, body = split_subject_body(response['follow_up_email'])
+            sends.append(scheduler.schedule(gmail, partial(deliver, lead, subject, body, response['classification']),
+                                            cancel_event))
+
+    return sends
+
+
+def split_subject_body(email_content) -> Tuple[str, str]:
+    lines = str(email_content).strip().split('\n')
+    # Models write "Subject: ...", sometimes in markdown bold, followed by a blank line
+    subject = re.sub(r'^\W*subject\W*:\W*?\s*', '', lines[0], flags=re.IGNORECASE).strip('* ')
+    body = '\n'.join(lines[1:]).strip('\n')
+    return subject, body
+
+
+def prepare_lead_email(lead: Dict[str, Any], user_offer, user_name: str, user_site: str, custom_offer,
+                       last_positive_reply: str) -> Tuple[str, str]:
+    logging.info(f"Personalizing prospect email for {lead.get('Name', 'Unknown')}")
+    prospect_personalization = personalize_prospect_email(lead['Website'], custom_offer)
+
+    logging.info(f"Crafting email for {lead.get('Name', 'Unknown')}")
+    email_content = craft_email(user_offer, prospect_personalization, user_name, user_site,
+                                prospect_name=lead.get('Decision Maker') or 'Unknown',
+                                last_positive_reply=last_positive_reply)
+    return split_subject_body(email_content)
+
+
+def iter_prepared_emails(leads: Iterable[Dict[str, Any]], prepare: Callable[[Dict[str, Any]], Tuple[str, str]],
+                         concurrency: int = DEFAULT_PERSONALIZATION_CONCURRENCY,
+                         lookahead: Optional[int] = None) -> Iterator[Tuple[Dict[str, Any], Optional[Tuple[str, str]], Optional[BaseException]]]:
+    """Yield ``(lead, (subject, body), error)`` in lead order while a worker pool prepares the next leads.
+
+    At most ``concurrency + lookahead`` leads are in flight or waiting in the ready queue, so a slow
+    consumer (the send loop) applies backpressure instead of letting preparation run ahead unbounded.
+    Leads are read on a feeder thread, so with a live stream each one is prepared and yielded as soon
+    as it arrives rather than once a full window has been collected.
+    """
+    concurrency = max(1, concurrency)
+    window = concurrency + (concurrency if lookahead is None else max(0, lookahead))
+    slots = threading.Semaphore(window)
+    ready = queue.Queue()
+    stop = threading.Event()
+    end = object()
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='personalize') as pool:
+        def feed():
+            try:
+                for lead in leads:
+                    while not slots.acquire(timeout=0.5):
+                        if stop.is_set():
+                            return
+                    if stop.is_set():
+                        return
+                    ready.put((lead, pool.submit(prepare, lead)))
+            except Exception as e:
+                ready.put((None, e))
+            finally:
+                ready.put(end)
+
+        threading.Thread(target=feed, name='personalize-feeder', daemon=True).start()
+        try:
+            while True:
+                item = ready.get()
+                if item is end:
+                    break
+                lead, future = item
+                if lead is None:
+                    raise future
+                try:
+                    yield lead, future.result(), None
+                except Exception as e:
+                    yield lead, None, e
+                slots.release()
+        finally:
+            stop.set()
+            while True:
+                try:
+                    item = ready.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not end and item[0] is not None:
+                    item[1].cancel()
 
 
 def run_email_automation(user_site: str, user_name: str, custom_offer, smtp_connection, gmail: str, app_password: str,
-                         rows: List[Dict[str, Any]], callback=None) -> None:
-    logging.info(f"Starting email automation for {len(rows)} leads")
+                         rows: Iterable[Dict[str, Any]], callback=None, concurrency: Optional[int] = None,
+                         campaign_id=None, cancel_event: Optional[threading.Event] = None,
+                         send_scheduler: Optional[SendScheduler] = None,
+                         max_queued: int = MAX_QUEUED_SENDS) -> Future:
+    """Prepare the campaign's emails and queue them on the send scheduler.
+
+    ``rows`` is either a list of stored leads or a live stream of them (a ``lead_stream.StageQueue``),
+    in which case each lead is personalized and queued as soon as its email is found. At most
+    ``max_queued`` emails wait in the scheduler at a time; preparation pauses until one goes out, so
+    leads are personalized shortly before they are sent rather than all up front. Returns once every
+    email is queued; the returned future completes after the scheduler has sent them, replies have
+    been checked and follow-ups have gone out.
+    """
+    if isinstance(rows, list):
+        logging.info(f"Starting email automation for {len(rows)} leads")
+        event_bus.publish(campaign_id, 'status', f"Preparing emails for {len(rows)} leads")
+        random.shuffle(rows)
+    else:
+        logging.info("Starting email automation for streamed leads")
+        event_bus.publish(campaign_id, 'status', "Preparing emails as leads are found")
+    scheduler = send_scheduler or get_send_scheduler()
     user_offer = personalize_user_offer(user_site, custom_offer)
     last_positive_reply = 'None'
 
     emails_to_send = random.randint(180, 220)
     logging.info(f"Aiming to send {emails_to_send} emails today")
 
-    total_seconds = 8 * 60 * 60
-    delay_between_emails = total_seconds / emails_to_send
-    print(delay_between_emails)
-
-    random.shuffle(rows)
-
-    emails_sent = 0
-    start_time = time.time()
-    for lead in rows:
-        print(lead)
-        if emails_sent >= emails_to_send:
-            break
-
-        # if time.time() - start_time > 300:  # 5 minutes timeout
-        #     logging.warning("Campaign duration exceeded 5 minutes. Stopping early.")
-        #     break
-
-        logging.info(f"Processing lead {emails_sent + 1}/{emails_to_send}: {lead.get('Name', 'Unknown')}")
-
-        try:
-            if lead.get('EmailSent') != 'True':
-                logging.info(f"Personalizing prospect email for {lead.get('Name', 'Unknown')}")
-                prospect_personalization = personalize_prospect_email(lead['Website'], custom_offer)
-
-                logging.info(f"Crafting email for {lead.get('Name', 'Unknown')}")
-                email_content = craft_email(user_offer, prospect_personalization, user_name, user_site,
-                                            prospect_name=lead.get('Decision Maker', 'Unknown'),
-                                            last_positive_reply=last_positive_reply)
-                email_content = str(email_content)
-                subject = email_content.split('\n')[0].split(': ', 1)[-1] if ': ' in email_content.split('\n')[0] else \
-                email_content.split('\n')[0]
-                body = '\n'.join(email_content.split('\n')[1:])
-
-                logging.info(f"Sending email to {lead.get('Email', 'Unknown')}")
-
-                if send_email(lead['Email'], subject, body, smtp_connection):
-                    lead['EmailSent'] = 'True'
-                    lead['LastEmailDate'] = datetime.now().isoformat()
-                    emails_sent += 1
-                    if callback:
-                        callback(f"Email sent to: {lead.get('Name', 'Unknown')} ({lead['Email']})")
-
-                    # Send CRM update every 2 emails
-                    if emails_sent % 2 == 0:
-                        if callback:
-                            callback("CRM Update: " + json.dumps(rows[:emails_sent]))
-                else:
-                    if callback:
-                        callback(f"Failed to send email to: {lead.get('Name', 'Unknown')} ({lead['Email']})")
-
-                time.sleep(min(delay_between_emails + random.uniform(-5, 5), 10))  # Cap delay at 10 seconds for demo
-
-            else:
+    if concurrency is None:
+        concurrency = DEFAULT_PERSONALIZATION_CONCURRENCY
+    logging.info(f"Preparing emails with {concurrency} personalization workers")
+
+    # Every lead taken from ``rows``, for the CRM updates and the reply check once sending is done
+    campaign_leads = []
+
+    def unsent(leads):
+        # Two businesses can share an address (a chain, an agency's inbox); each address is emailed once
+        emails = set()
+        for lead in leads:
+            campaign_leads.append(lead)
+            email = (lead.get('Email') or '').strip().lower()
+            if lead.get('EmailSent'):
+                emails.add(email)
                 logging.info(f"Skipping lead {lead.get('Name', 'Unknown')}, email already sent")
-        except Exception as e:
-            logging.error(f"Error processing lead {lead.get('Name', 'Unknown')}: {str(e)}")
-            logging.error(traceback.format_exc())
-
-    logging.info(f"Sent {emails_sent} emails today")
-
-    # Final CRM update
-    if callback:
-        callback("CRM Update: " + json.dumps(rows))
-
-    logging.info(f"Sent {emails_sent} emails today")
-
-    logging.info("Checking for responses")
-    check_for_responses(rows, gmail, app_password)
+            elif email in emails:
+                logging.info(f"Skipping lead {lead.get('Name', 'Unknown')}, {email} is already queued")
+            else:
+                emails.add(email)
+                yield lead
+
+    def prepare(lead):
+        return prepare_lead_email(lead, user_offer, user_name, user_site, custom_offer, last_positive_reply)
+
+    # The scheduler sends one email at a time per account, so deliver() never runs concurrently for this campaign.
+    sent_leads = []
+
+    def deliver(lead, subject, body):
+        logging.info(f"Sending email to {lead.get('Email', 'Unknown')}")
+        if not send_email(lead['Email'], subject, body, smtp_connection):
+            event_bus.publish(campaign_id, 'error', f"Failed to send email to: {lead.get('Name', 'Unknown')} ({lead['Email']})")
+            if callback:
+                callback(f"Failed to send email to: {lead.get('Name', 'Unknown')} ({lead['Email']})")
+            return False
+
+        lead['EmailSent'] = True
+        lead['LastEmailDate'] = datetime.now().isoformat()
+        save_lead(lead, 'EmailSent', 'LastEmailDate')
+        sent_leads.append(lead)
+        event_bus.publish(campaign_id, 'log', f"Email sent to: {lead.get('Name', 'Unknown')} ({lead['Email']})")
+        if callback:
+            callback(f"Email sent to: {lead.get('Name', 'Unknown')} ({lead['Email']})")
+
+        # Send CRM update every 2 emails
+        if len(sent_leads) % 2 == 0:
+            event_bus.publish(campaign_id, 'crm', [dict(row) for row in sent_leads])
+        return True
 
-    logging.info("Sending follow-ups")
-    send_follow_ups(rows, user_offer, smtp_connection, gmail, app_password, user_name, user_site, last_positive_reply)
+    sends = []
+    queued = threading.Semaphore(max(1, max_queued))
+    start_time = time.time()
 
-    logging.info("Updating CSV file")
-    df = pd.DataFrame(rows)
-    df.to_csv('src/lead_scraper/business_leads_with_emails.csv', index=False)
-    logging.info("CSV file updated after follow-ups")
+    def wait_for_room():
+        # Blocks the send loop, and through it the preparation window, while the scheduler holds max_queued emails
+        while not queued.acquire(timeout=0.5):
+            if cancel_event is not None and cancel_event.is_set():
+                return False
+        return True
 
+    prepared = iter_prepared_emails(unsent(rows), prepare, concurrency=concurrency)
+    try:
+        for lead, email_parts, error in prepared:
+            if len(sends) >= emails_to_send:
+                break
+            if cancel_event is not None and cancel_event.is_set():
+                logging.info(f"Campaign {campaign_id} cancelled after queueing {len(sends)} emails")
+                break
+
+            logging.info(f"Queueing lead {len(sends) + 1}/{emails_to_send}: {lead.get('Name', 'Unknown')}")
+
+            if error is not None:
+                logging.error(f"Error processing lead {lead.get('Name', 'Unknown')}: {str(error)}")
+                logging.error(''.join(traceback.format_exception(type(error), error, error.__traceback__)))
+                continue
+
+            if not wait_for_room():
+                logging.info(f"Campaign {campaign_id} cancelled after queueing {len(sends)} emails")
+                break
+            subject, body = email_parts
+            send = scheduler.schedule(gmail, partial(deliver, lead, subject, body), cancel_event)
+            # Sent, failed or cancelled, the email no longer waits in the scheduler
+            send.add_done_callback(lambda _: queued.release())
+            sends.append(send)
+    finally:
+        prepared.close()
+        if hasattr(rows, 'abandon'):
+            # Stop the scrape and crawl stages once the daily quota is queued or the campaign is cancelled
+            rows.abandon()
+
+    logging.info(f"Queued {len(sends)} emails for {gmail}")
+    done = Future()
+    done.set_running_or_notify_cancel()
+
+    def after_sends():
+        logging.info(f"Sent {len(sent_leads)} emails today")
+
+        # Final CRM update
+        event_bus.publish(campaign_id, 'crm', [dict(row) for row in campaign_leads])
+
+        if cancel_event is not None and cancel_event.is_set():
+            return []
+
+        logging.info("Checking for responses")
+        # Leads emailed before a restart may have replied before this run started
+        since = min([datetime.fromtimestamp(start_time)] +
+                    [datetime.fromisoformat(lead['LastEmailDate']) for lead in campaign_leads if lead.get('LastEmailDate')])
+        check_for_responses(campaign_leads, gmail, app_password, since=since, campaign_id=campaign_id)
+
+        logging.info("Sending follow-ups")
+        return send_follow_ups(campaign_leads, user_offer, smtp_connection, gmail, app_password, user_name, user_site,
+                               last_positive_reply, scheduler=scheduler, cancel_event=cancel_event)
+
+    def follow_ups_queued(future):
+        if future.exception() is not None:
+            done.set_exception(future.exception())
+            return
+
+        def follow_ups_sent(_):
+            get_llm_cache().log_stats()
+            get_digest_cache().log_stats()
+            done.set_result(len(sent_leads))
+
+        gather(future.result()).add_done_callback(follow_ups_sent)
+
+    scheduler.after(sends, after_sends).add_done_callback(follow_ups_queued)
+    return done
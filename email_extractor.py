@@ -0,0 +1,65 @@
+import html
+import re
+from typing import List
+from urllib.parse import unquote
+
+# The lookbehind starts matches only at the beginning of a run of local-part characters, so long
+# alphanumeric runs (asset names, inline data) are not re-scanned from every offset. A preceding ';'
+# is the end of a character reference such as &#106;ane@..., whose decoded address the mailto pass finds.
+EMAIL_RE = re.compile(r"(?<![a-zA-Z0-9._%+;-])[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}")
+# Patterns that start with a literal let the regex engine skip ahead with a fast substring search.
+MAILTO_RE = re.compile(r"mailto:([^\"'?>\s]+)")
+CFEMAIL_ATTR_RE = re.compile(r"""data-cfemail=["']([0-9a-fA-F]+)["']""")
+CFEMAIL_LINK_RE = re.compile(r"/cdn-cgi/l/email-protection#([0-9a-fA-F]+)")
+
+# One pass replaces the old chain of substring checks and regex searches in EmailSpider.is_valid_email:
+# placeholder/vendor addresses, local-parts that start with a non-letter or end in 2+ digits or a
+# symbol, and asset filenames such as logo@2x.png that the address pattern also matches.
+REJECT_RE = re.compile(
+    r"@example\.com|test@|filler@|wix|@google\.com|name@|example@"
+    r"|^[^a-zA-Z]"
+    r"|\d{2,}@|\W@"
+    r"|\.(?:jpg|jpeg|png|webp|gif|bmp)$"
+)
+
+
+def is_valid_email(email: str) -> bool:
+    return REJECT_RE.search(email) is None
+
+
+def decode_cfemail(encoded: str) -> str:
+    """Decode a Cloudflare email-protection token (first byte is the XOR key)."""
+    try:
+        data = bytes.fromhex(encoded)
+    except ValueError:
+        return ''
+    if not data:
+        return ''
+    key = data[0]
+    return bytes(b ^ key for b in data[1:]).decode('utf-8', 'replace')
+
+
+def extract_emails(text: str) -> List[str]:
+    """Return the valid, lower-cased addresses on a page in first-seen order, without duplicates.
+
+    Besides plain-text addresses this reads ``mailto:`` links (percent- and entity-encoded) and
+    Cloudflare-obfuscated addresses, which never appear in the page text itself.
+    """
+    candidates = EMAIL_RE.findall(text)
+
+    for target in MAILTO_RE.findall(text):
+        candidates.extend(EMAIL_RE.findall(unquote(html.unescape(target))))
+
+    for encoded in CFEMAIL_ATTR_RE.findall(text) + CFEMAIL_LINK_RE.findall(text):
+        candidates.extend(EMAIL_RE.findall(decode_cfemail(encoded)))
+
+    seen = set()
+    emails = []
+    for candidate in candidates:
+        email = candidate.lower()
+        if email in seen:
+            continue
+        seen.add(email)
+        if is_valid_email(email):
+            emails.append(email)
+    return emails
@@ -1,30 +1,40 @@
 import logging
 import asyncio
+import os
 from encodings import idna
 
-import aiodns
-import socket
 from email_validator import validate_email, EmailNotValidError
 import scrapy
 from scrapy.crawler import CrawlerProcess
-from scrapy.signalmanager import dispatcher
 from scrapy import signals
-import csv
 import re
-import pandas as pd
 import random
 from urllib.parse import urlparse, urljoin
 from scrapy.linkextractors import LinkExtractor
 from scrapy.spiders import CrawlSpider, Rule
 from scrapy.downloadermiddlewares.useragent import UserAgentMiddleware
-import smtplib
-import dns.resolver
+from scrapy.exceptions import IgnoreRequest
 import time
-from concurrent.futures import ThreadPoolExecutor
+from twisted.internet import threads
+from twisted.python.threadpool import ThreadPool
+from scrapy.utils.defer import maybe_deferred_to_future
 import requests
 from bs4 import BeautifulSoup
 from twisted.internet.error import TCPTimedOutError, DNSLookupError
-import unicodedata
+from page_cache import get_page_cache
+from email_verifier import get_email_verifier
+import lead_store
+import event_bus
+from email_extractor import extract_emails, is_valid_email
+from crawl_state import BusinessCrawlState, DEFAULT_RANK, normalize_url, strip_www
+
+
+LOOKUP_CONCURRENCY = int(os.getenv('EMAIL_LOOKUP_CONCURRENCY', '10'))
+
+
+def _header_str(value):
+    return value.decode('latin-1') if value else None
+
 
 class RotateUserAgentMiddleware(UserAgentMiddleware):
     def __init__(self, user_agent='Scrapy'):
@@ -45,6 +55,30 @@ class RotateUserAgentMiddleware(UserAgentMiddleware):
     def process_request(self, request, spider):
         request.headers['User-Agent'] = random.choice(self.user_agent_list)
 
+class DropResolvedBusinessMiddleware:
+    """Drops queued requests for businesses whose email has already been found.
+
+    Sibling pages scheduled before the email turned up would otherwise still be downloaded (and
+    could yield duplicate rows); dropping them before download hands their slots to businesses
+    that are still unresolved.
+    """
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.stats)
+
+    def process_request(self, request, spider):
+        row = request.meta.get('row')
+        if row is None or not hasattr(spider, 'crawl_state_for'):
+            return None
+        if spider.crawl_state_for(row).resolved:
+            self.stats.inc_value('business/requests_dropped', spider=spider)
+            raise IgnoreRequest(f"Email already found for {row.get('Name')}")
+        return None
+
 class EmailSpider(CrawlSpider):
     name = 'email_spider'
 
@@ -52,6 +86,7 @@ class EmailSpider(CrawlSpider):
         'DOWNLOADER_MIDDLEWARES': {
             'scrapy.downloadermiddlewares.useragent.UserAgentMiddleware': None,
             'email_spider.RotateUserAgentMiddleware': 400,
+            'email_spider.DropResolvedBusinessMiddleware': 50,
         },
         'DOWNLOAD_DELAY': 2,
         'CONCURRENT_REQUESTS_PER_DOMAIN': 8,
@@ -66,107 +101,158 @@ class EmailSpider(CrawlSpider):
         'CLOSESPIDER_TIMEOUT': 0,  # Disable auto-closing
         'CLOSESPIDER_PAGECOUNT': 0,  # Disable closing on page count
         'CONCURRENT_REQUESTS': 8,  # Reduce concurrent requests
+        'ITEM_PIPELINES': {
+            'lead_pipeline.BufferedLeadWriterPipeline': 300,
+        },
+        'BUSINESS_PAGE_BUDGET': 10,  # Pages fetched per business, homepage included
+        'BUSINESS_MAX_IN_FLIGHT': 2,  # Outstanding requests per business
     }
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, campaign_id=None, businesses=None, *args, **kwargs):
         super(EmailSpider, self).__init__(*args, **kwargs)
+        self.campaign_id = int(campaign_id) if campaign_id else None
+        # A batch handed over by the crawl worker; otherwise the campaign's leads without an email
+        self.businesses = businesses
         self.start_urls = []
-        self.visited_urls = set()
-        self.visited_domains = {}
+        self.crawl_states = {}
         self.missing_emails = []
-        dispatcher.connect(self.spider_closed, signals.spider_closed)
 
-        self.fieldnames = ['Name', 'Website', 'Email', 'Decision Maker']
-        with open('src/lead_scraper/business_leads_with_emails.csv', 'w', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=self.fieldnames)
-            writer.writeheader()
+        self.business_names = set()
+        self.businesses_with_emails = set()
+
+        self.lookup_pool = ThreadPool(minthreads=0, maxthreads=LOOKUP_CONCURRENCY, name='email-lookups')
+        # Shared by every batch spider, so MX records and verdicts stay cached for their TTLs
+        self.email_verifier = get_email_verifier()
+        self.smtp_sessions_at_start = self.email_verifier.smtp_sessions
 
-        self.email_verification_pool = ThreadPoolExecutor(max_workers=10)
-        # self.dns_resolver = aiodns.DNSResolver()
-        self.verified_emails_cache = {}
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        # Per-crawler signal: several spiders share the process when run from the crawl worker
+        crawler.signals.connect(spider.spider_closed, signal=signals.spider_closed)
+        return spider
 
     def start_requests(self):
         logging.info("Starting requests...")
-        with open('src/lead_scraper/business_leads.csv', newline='') as csvfile:
-            reader = csv.DictReader(csvfile)
-            self.fieldnames = reader.fieldnames + ['Email', 'Decision Maker']
-            for row in reader:
-                logging.info(f"Processing business: {row['Name']}")
-                yield scrapy.Request(url=row['Website'], callback=self.process_business, meta={'row': row},
-                                     errback=self.errback_httpbin, dont_filter=True)
+        rows = self.businesses
+        if rows is None:
+            rows = lead_store.get_leads(self.campaign_id, with_email=False)
+        for row in rows:
+            logging.info(f"Processing business: {row['Name']}")
+            self.business_names.add(row['Name'])
+            yield scrapy.Request(url=row['Website'], callback=self.process_business, meta={'row': row},
+                                 errback=self.errback_httpbin, dont_filter=True)
+
+    def crawl_state_for(self, row):
+        key = row.get('id') or row['Website']
+        state = self.crawl_states.get(key)
+        if state is None:
+            state = self.crawl_states[key] = BusinessCrawlState(
+                row['Website'],
+                budget=self.settings.getint('BUSINESS_PAGE_BUDGET', 10),
+                max_in_flight=self.settings.getint('BUSINESS_MAX_IN_FLIGHT', 2),
+            )
+        return state
+
+    def page_request(self, url, row, rank=DEFAULT_RANK):
+        return scrapy.Request(url, callback=self.parse_item, meta={'row': row}, errback=self.errback_httpbin,
+                              priority=DEFAULT_RANK - rank)
+
+    def schedule_next(self, state, row):
+        for rank, url in state.next_urls():
+            yield self.page_request(url, row, rank)
 
     def errback_httpbin(self, failure):
-        logging.error(f"Request failed: {failure.request.url}")
+        request = failure.request
+        row = request.meta['row']
+        state = self.crawl_state_for(row)
+        if request.callback == self.parse_item:
+            state.finished_request()
+        if state.resolved:
+            return
+        logging.error(f"Request failed: {request.url}")
         if failure.check(TimeoutError, TCPTimedOutError, DNSLookupError, ConnectionRefusedError):
-            request = failure.request
             logging.error(f"TimeoutError on {request.url}")
-            yield scrapy.Request(request.url, callback=self.parse_item, dont_filter=True, meta=request.meta)
+            if state.claim(request.url):
+                yield scrapy.Request(request.url, callback=self.parse_item, dont_filter=True, meta=request.meta,
+                                     errback=self.errback_httpbin)
+        yield from self.schedule_next(state, row)
 
-    def process_business(self, response):
+    def _defer_blocking(self, func, *args):
+        # DNS, SMTP, the Google lookup and page cache writes block; run them on a bounded pool of our
+        # own so the reactor (and Scrapy's DNS threads) keep serving other businesses in the meantime.
+        from twisted.internet import reactor
+
+        if not self.lookup_pool.started:
+            self.lookup_pool.start()
+        return threads.deferToThreadPool(reactor, self.lookup_pool, func, *args)
+
+    def _run_blocking(self, func, *args):
+        return maybe_deferred_to_future(self._defer_blocking(func, *args))
+
+    async def process_business(self, response):
         row = response.meta['row']
+        # Personalization scrapes this homepage again later; share the copy we already downloaded.
+        # Nothing here waits for the write, so it runs alongside the decision-maker lookup.
+        self._defer_blocking(get_page_cache().store, row['Website'], response.body,
+                             _header_str(response.headers.get('ETag')),
+                             _header_str(response.headers.get('Last-Modified'))).addErrback(
+            lambda failure: logging.warning(f"Could not cache {row['Website']}: {failure.getErrorMessage()}"))
         domain = urlparse(row['Website']).netloc
         if domain.startswith("www."):
             domain = domain[4:]
 
-        decision_maker = self.find_decision_maker(row['Name'], '')
+        decision_maker = await self._run_blocking(self.find_decision_maker, row['Name'], '')
         if decision_maker:
             logging.info(f"Found potential decision maker for {row['Name']}: {decision_maker}")
             # row['Decision Maker'] = decision_maker
 
             guessed_emails = self.guess_emails(decision_maker, domain)
-            verified_email = None
-            for email in guessed_emails:
-                if self.verify_email(email):
-                    row['Decision Maker'] = decision_maker
-                    verified_email = email
-                    break
+            verified_email = await self._run_blocking(self.email_verifier.verify_candidates, guessed_emails)
 
             if verified_email:
+                self.crawl_state_for(row).resolved = True
+                row['Decision Maker'] = decision_maker
                 row['Email'] = verified_email
-                self.write_to_csv(row)
                 logging.info(f"Found and verified email: {verified_email} for {row['Name']}")
+                yield self.lead_item(row)
                 return
             else:
                 logging.info(
                     f"No verified email found for decision maker of {row['Name']}. Proceeding to crawl website.")
 
         logging.info(f"Crawling website for {row['Name']}: {row['Website']}")
-        yield scrapy.Request(url=row['Website'], callback=self.parse_item, meta={'row': row, 'urls_crawled': 1},
-                             errback=self.errback_httpbin, dont_filter=True)
+        # The homepage is already downloaded; parse it here rather than fetching it a second time.
+        state = self.crawl_state_for(row)
+        state.seen.add(normalize_url(row['Website']))
+        if state.claim(response.url):
+            for result in self.parse_item(response):
+                yield result
 
     def parse_item(self, response):
         logging.info(f"Parsing {response.url}")
         row = response.meta['row']
-        urls_crawled = response.meta.get('urls_crawled', 0)
-
-        if urls_crawled > 10:
-            logging.info(f"Reached maximum URLs for {row['Name']}. Moving to next business.")
+        state = self.crawl_state_for(row)
+        state.finished_request()
+        if state.resolved:
             return
 
-        emails = re.findall(r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}", response.text)
-        valid_emails = [email.lower() for email in emails if self.is_valid_email(email)]
+        valid_emails = extract_emails(response.text)
 
         logging.info(f"Found {len(valid_emails)} potential emails on {response.url}")
-        print(valid_emails)
+        self.logger.debug(f"Emails on {response.url}: {valid_emails}")
 
         for email in valid_emails:
             row['Email'] = email
-            self.write_to_csv(row)
+            state.resolved = True
             logging.info(f"Found and verified email: {email} for {row['Name']}")
+            yield self.lead_item(row)
             return
 
-        domain = urlparse(row['Website']).netloc
-        if domain.startswith("www."):
-            domain = domain[4:]
-
-        internal_links = self.get_internal_links(response, domain)
-        for href in internal_links:
-            if urls_crawled >= 10:
-                break
-            url = urljoin(response.url, href)
-            if url.startswith('http'):
-                urls_crawled += 1
-                yield scrapy.Request(url, callback=self.parse_item, meta={'row': row, 'urls_crawled': urls_crawled}, errback=self.errback_httpbin)
+        state.add_links(urljoin(response.url, href) for href in self.get_internal_links(response, state.domain))
+        if state.requested >= state.budget and not state.in_flight:
+            logging.info(f"Reached maximum URLs for {row['Name']}. Moving to next business.")
+        yield from self.schedule_next(state, row)
 
     def find_decision_maker(self, company_name, location):
         search_query = f"{company_name} {location} linkedin"
@@ -178,7 +264,7 @@ class EmailSpider(CrawlSpider):
         }
 
         try:
-            response = requests.get(url, headers=headers)
+            response = requests.get(url, headers=headers, timeout=10)
             soup = BeautifulSoup(response.text, 'html.parser')
 
             search_results = soup.find_all('h3', class_='LC20lb')
@@ -202,15 +288,12 @@ class EmailSpider(CrawlSpider):
             return None
 
     def get_internal_links(self, response, domain):
-        links = response.css('a::attr(href)').getall()
-        internal_links = [link for link in links if self.is_internal_link(link, domain)]
-        important_pages = [link for link in internal_links if
-                           any(page in link.lower() for page in ['about', 'team', 'contact', 'people'])]
-        return important_pages + [link for link in internal_links if link not in important_pages]
+        links = dict.fromkeys(response.css('a::attr(href)').getall())
+        return [link for link in links if self.is_internal_link(link, domain)]
 
     def is_internal_link(self, href, domain):
         parsed_href = urlparse(href)
-        return parsed_href.netloc == '' or parsed_href.netloc == domain
+        return parsed_href.netloc == '' or strip_www(parsed_href.netloc) == domain
 
     def guess_emails(self, name, domain):
         name_parts = name.lower().split()
@@ -233,68 +316,35 @@ class EmailSpider(CrawlSpider):
         return patterns
 
     def is_valid_email(self, email):
-        if '@example.com' in email or 'test@' in email or 'filler@' in email or 'wix' in email or '@google.com' in email or 'name@' in email or 'example@' in email:
-            return False
-        if re.search(r"^\d", email) or re.search(r"^[^a-zA-Z]", email):
-            return False
-        if re.search(r"\d{2,}@|\W@", email):
-            return False
-        if re.search(r'\.(jpg|jpeg|png|webp|gif|bmp)$', email):
-            return False
-        return True
+        return is_valid_email(email)
 
     def verify_email(self, email):
-        domain = email.split('@')[-1]
-        try:
-            # Normalize the email address to handle non-ASCII characters
-            email = unicodedata.normalize('NFKC', email)
-
-            records = dns.resolver.resolve(domain, 'MX')
-            mx_record = records[0].exchange.to_text().rstrip('.')
-            with smtplib.SMTP(mx_record, timeout=10) as server:  # Increased timeout
-                server.set_debuglevel(0)
-                server.connect(mx_record)
-                server.helo(server.local_hostname)
-                server.mail('')
-                code, _ = server.rcpt(str(email))
-                server.quit()
-
-                if code == 250:
-                    logging.info(f"Verified email: {email}")
-                    return True
-                print(email)
-                print(code)
-
-        except (smtplib.SMTPConnectError, smtplib.SMTPServerDisconnected, socket.timeout) as e:
-            logging.warning(f"Connection issue while verifying {email}: {e}")
-        except UnicodeEncodeError as e:
-            logging.warning(f"Encoding issue with email {email}: {e}")
-        except Exception as e:
-            logging.error(f"Error verifying {email}: {e}")
-
-        return False
+        return self.email_verifier.verify(email)
 
-    def write_to_csv(self, row):
-        with open('src/lead_scraper/business_leads_with_emails.csv', 'a', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=self.fieldnames)
-            writer.writerow(row)
-        logging.info(f"Wrote data for {row['Name']} to CSV")
+    def lead_item(self, row):
+        self.businesses_with_emails.add(row['Name'])
+        event_bus.publish(self.campaign_id, 'log', f"Found email for {row['Name']}: {row['Email']}")
+        return dict(row)
 
     def spider_closed(self, spider):
-        logging.info('Spider closed: CSV with emails saved.')
-        df = pd.read_csv('src/lead_scraper/business_leads_with_emails.csv')
-        df.drop_duplicates(subset=['Email'], inplace=True)
-        df.to_excel('src/lead_scraper/business_leads_with_emails.xlsx', index=False)
-        df.to_csv('src/lead_scraper/business_leads_with_emails.csv', index=False)
-        logging.info('CSV converted to XLSX.')
+        logging.info('Spider closed: emails saved to the lead store.')
+        logging.info(f"Email verification opened "
+                     f"{self.email_verifier.smtp_sessions - self.smtp_sessions_at_start} SMTP sessions")
+        if self.lookup_pool.started:
+            self.lookup_pool.stop()
+
+        stats = self.crawler.stats
+        requests_made = stats.get_value('downloader/request_count', 0, spider=self)
+        dropped = stats.get_value('business/requests_dropped', 0, spider=self)
+        leads_found = len(self.businesses_with_emails)
+        event_bus.publish(self.campaign_id, 'status', f"Email search finished: {leads_found} of "
+                                                      f"{len(self.business_names)} businesses have an email")
+        logging.info(f"Downloaded {requests_made} pages for {leads_found} leads "
+                     f"({requests_made / max(leads_found, 1):.1f} per lead); dropped {dropped} requests "
+                     f"for businesses already resolved")
 
         # Log businesses without emails
-        businesses_with_emails = set(df['Name'])
-        with open('src/lead_scraper/business_leads.csv', newline='') as csvfile:
-            reader = csv.DictReader(csvfile)
-            all_businesses = set(row['Name'] for row in reader)
-
-        businesses_without_emails = all_businesses - businesses_with_emails
+        businesses_without_emails = self.business_names - self.businesses_with_emails
         if businesses_without_emails:
             logging.info('Businesses without emails:')
             for business in businesses_without_emails:
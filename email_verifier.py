@@ -0,0 +1,196 @@
+import logging
+import os
+import random
+import smtplib
+import socket
+import string
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional
+
+import dns.resolver
+
+MX_CACHE_TTL = int(os.getenv('MX_CACHE_TTL', '3600'))
+VERDICT_CACHE_TTL = int(os.getenv('VERDICT_CACHE_TTL', str(24 * 60 * 60)))
+SMTP_PROBE_TIMEOUT = int(os.getenv('SMTP_PROBE_TIMEOUT', '10'))
+VERIFIER_CACHE_SIZE = int(os.getenv('VERIFIER_CACHE_SIZE', '10000'))
+
+VALID = 'valid'
+INVALID = 'invalid'
+CATCH_ALL = 'catch_all'
+UNKNOWN = 'unknown'
+
+
+class _ExpiringCache:
+    """LRU map whose entries also expire; callers hold the verifier's lock."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key: str, value: Any, expires_at: float) -> None:
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class EmailVerifier:
+    """RCPT-based mailbox verification that costs one SMTP session per domain.
+
+    MX lookups and per-address verdicts are cached with a TTL, keeping at most ``max_entries`` of
+    each and dropping the least recently used beyond that. Each domain is first probed with a
+    random local-part: if the server accepts it, the domain accepts everything and the guesses
+    cannot be told apart, so probing stops there.
+    """
+
+    def __init__(self, mx_ttl: int = MX_CACHE_TTL, verdict_ttl: int = VERDICT_CACHE_TTL,
+                 timeout: int = SMTP_PROBE_TIMEOUT, max_entries: int = VERIFIER_CACHE_SIZE):
+        self.mx_ttl = mx_ttl
+        self.verdict_ttl = verdict_ttl
+        self.timeout = timeout
+        self._mx_cache = _ExpiringCache(max_entries)
+        self._verdicts = _ExpiringCache(max_entries)
+        self._lock = threading.Lock()
+        # domain -> [lock, threads using it]; entries go away once no probe needs them
+        self._domain_locks: Dict[str, list] = {}
+        self.smtp_sessions = 0
+
+    @contextmanager
+    def _domain_lock(self, domain: str):
+        with self._lock:
+            entry = self._domain_locks.setdefault(domain, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._domain_locks[domain]
+
+    def mx_host(self, domain: str) -> Optional[str]:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._mx_cache.get(domain)
+        if cached:
+            return cached[0]
+
+        host, ttl = None, self.mx_ttl
+        try:
+            answer = dns.resolver.resolve(domain, 'MX')
+            best = min(answer, key=lambda record: record.preference)
+            host = best.exchange.to_text().rstrip('.')
+            ttl = min(self.mx_ttl, answer.rrset.ttl) if answer.rrset is not None else self.mx_ttl
+        except Exception as e:
+            logging.warning(f"MX lookup failed for {domain}: {e}")
+        with self._lock:
+            self._mx_cache.set(domain, host, now + ttl)
+        return host
+
+    def cached_verdict(self, email: str) -> Optional[str]:
+        with self._lock:
+            cached = self._verdicts.get(email)
+        return cached[0] if cached else None
+
+    def _remember(self, email: str, verdict: str) -> None:
+        # Temporary failures (greylisting, rate limits) are worth retrying soon; definite answers are not.
+        ttl = self.verdict_ttl if verdict != UNKNOWN else min(self.verdict_ttl, 300)
+        with self._lock:
+            self._verdicts.set(email, verdict, time.monotonic() + ttl)
+
+    def verify_candidates(self, candidates: Iterable[str]) -> Optional[str]:
+        """Return the first candidate the mail server accepts, probing each domain in a single session."""
+        by_domain: Dict[str, List[str]] = {}
+        ordered = []
+        for candidate in candidates:
+            address = unicodedata.normalize('NFKC', candidate).strip().lower()
+            domain = address.rsplit('@', 1)[-1]
+            by_domain.setdefault(domain, []).append(address)
+            ordered.append(address)
+
+        for address in ordered:
+            if self.cached_verdict(address) == VALID:
+                return address
+
+        for domain, addresses in by_domain.items():
+            with self._domain_lock(domain):
+                found = self._probe_domain(domain, addresses)
+            if found:
+                return found
+        return None
+
+    def verify(self, email: str) -> bool:
+        return self.verify_candidates([email]) is not None
+
+    def _probe_domain(self, domain: str, addresses: List[str]) -> Optional[str]:
+        if self.cached_verdict(f"*@{domain}") == CATCH_ALL:
+            return None
+        pending = [address for address in addresses if self.cached_verdict(address) is None]
+        if not pending:
+            return next((address for address in addresses if self.cached_verdict(address) == VALID), None)
+
+        mx_record = self.mx_host(domain)
+        if not mx_record:
+            return None
+
+        try:
+            with smtplib.SMTP(mx_record, timeout=self.timeout) as server:
+                with self._lock:
+                    self.smtp_sessions += 1
+                server.set_debuglevel(0)
+                server.helo(server.local_hostname)
+                server.mail('')
+
+                probe = ''.join(random.choices(string.ascii_lowercase + string.digits, k=16))
+                code, _ = server.rcpt(f"{probe}@{domain}")
+                if code in (250, 251):
+                    logging.info(f"{domain} accepts all recipients; skipping address guesses")
+                    self._remember(f"*@{domain}", CATCH_ALL)
+                    for address in pending:
+                        self._remember(address, CATCH_ALL)
+                    return None
+
+                for address in pending:
+                    code, _ = server.rcpt(address)
+                    if code in (250, 251):
+                        self._remember(address, VALID)
+                        logging.info(f"Verified email: {address}")
+                        return address
+                    self._remember(address, INVALID if 500 <= code < 600 else UNKNOWN)
+        except (smtplib.SMTPConnectError, smtplib.SMTPServerDisconnected, socket.timeout) as e:
+            logging.warning(f"Connection issue while verifying addresses at {domain}: {e}")
+        except UnicodeEncodeError as e:
+            logging.warning(f"Encoding issue while verifying addresses at {domain}: {e}")
+        except Exception as e:
+            logging.error(f"Error verifying addresses at {domain}: {e}")
+        return None
+
+
+_default_verifier = None
+_default_verifier_lock = threading.Lock()
+
+
+def get_email_verifier() -> EmailVerifier:
+    global _default_verifier
+    with _default_verifier_lock:
+        if _default_verifier is None:
+            _default_verifier = EmailVerifier()
+        return _default_verifier
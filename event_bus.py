@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, Iterator, List, Optional
+
+EVENT_BUFFER_SIZE = int(os.getenv('EVENT_BUFFER_SIZE', '256'))
+MAX_CAMPAIGN_CHANNELS = int(os.getenv('MAX_CAMPAIGN_CHANNELS', '200'))
+
+
+class CampaignChannel:
+    def __init__(self, buffer_size: int):
+        self.events = deque(maxlen=buffer_size)
+        self.next_id = 1
+        self.finished = False
+        self.subscribers = 0
+        self.condition = threading.Condition()
+
+    def after(self, last_event_id: int) -> List[Dict[str, Any]]:
+        # Event ids are consecutive, so the ring buffer can be sliced instead of scanned.
+        if not self.events:
+            return []
+        if last_event_id >= self.next_id:
+            # An id this channel never issued comes from before a restart; replay what is buffered.
+            return list(self.events)
+        start = max(0, last_event_id - self.events[0]['id'] + 1)
+        return list(self.events)[start:]
+
+
+class EventBus:
+    """In-process publish/subscribe of campaign events.
+
+    Each campaign keeps its latest events in a bounded ring buffer, so a subscriber that reconnects
+    with ``Last-Event-ID`` resumes where it left off. Beyond ``max_campaigns``, the oldest channels
+    that are finished and have no subscribers are dropped. Subscribers block on the campaign's condition
+    variable until something is published instead of polling.
+    """
+
+    def __init__(self, buffer_size: int = EVENT_BUFFER_SIZE, max_campaigns: int = MAX_CAMPAIGN_CHANNELS):
+        self.buffer_size = buffer_size
+        self.max_campaigns = max_campaigns
+        self._channels: 'OrderedDict[str, CampaignChannel]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _channel(self, campaign_id) -> CampaignChannel:
+        key = str(campaign_id)
+        channel = self._channels.get(key)
+        if channel is None:
+            channel = self._channels[key] = CampaignChannel(self.buffer_size)
+            excess = len(self._channels) - self.max_campaigns
+            if excess > 0:
+                idle = [k for k, c in self._channels.items() if c.finished and not c.subscribers][:excess]
+                for idle_key in idle:
+                    del self._channels[idle_key]
+        return channel
+
+    def channel(self, campaign_id) -> CampaignChannel:
+        with self._lock:
+            return self._channel(campaign_id)
+
+    def latest_campaign_id(self) -> Optional[str]:
+        with self._lock:
+            return next(reversed(self._channels), None)
+
+    def publish(self, campaign_id, event_type: str, message: Any, finished: bool = False) -> Dict[str, Any]:
+        channel = self.channel(campaign_id)
+        with channel.condition:
+            event = {
+                'id': channel.next_id,
+                'campaign_id': str(campaign_id),
+                'type': event_type,
+                'message': message,
+                'timestamp': time.time(),
+                'finished': finished,
+            }
+            channel.next_id += 1
+            channel.events.append(event)
+            channel.finished = channel.finished or finished
+            channel.condition.notify_all()
+        return event
+
+    def subscribe(self, campaign_id, last_event_id: int = 0,
+                  heartbeat: float = 15.0) -> Iterator[Optional[Dict[str, Any]]]:
+        """Yield events after ``last_event_id`` as they arrive; ``None`` marks an idle heartbeat interval."""
+        with self._lock:
+            channel = self._channel(campaign_id)
+            channel.subscribers += 1
+        try:
+            while True:
+                with channel.condition:
+                    pending = channel.after(last_event_id)
+                    if not pending and not channel.finished:
+                        channel.condition.wait(heartbeat)
+                        pending = channel.after(last_event_id)
+                    finished = channel.finished
+                for event in pending:
+                    last_event_id = event['id']
+                    yield event
+                if finished and not pending:
+                    return
+                if not pending:
+                    yield None
+        finally:
+            with self._lock:
+                channel.subscribers -= 1
+
+
+_default_bus = EventBus()
+
+
+def get_event_bus() -> EventBus:
+    return _default_bus
+
+
+def publish(campaign_id, event_type: str, message: Any, finished: bool = False) -> None:
+    if campaign_id is not None:
+        _default_bus.publish(campaign_id, event_type, message, finished=finished)
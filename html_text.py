@@ -0,0 +1,136 @@
+import re
+from typing import Iterable, List, Optional, Tuple
+
+from lxml import etree
+
+DEFAULT_MAX_WORDS = 2000
+FEED_CHUNK_SIZE = 64 * 1024
+
+# Subtrees whose text is never useful to the LLM: code, navigation, footers and form chrome.
+DROP_TAGS = frozenset({
+    'script', 'style', 'noscript', 'template', 'svg', 'canvas', 'object', 'iframe',
+    'nav', 'footer', 'aside', 'form', 'button', 'select', 'option',
+})
+DROP_ROLES = frozenset({'navigation', 'contentinfo', 'search', 'dialog'})
+BOILERPLATE_RE = re.compile(r'cookie|consent|gdpr|breadcrumb|newsletter|skip-link', re.IGNORECASE)
+BLOCK_TAGS = frozenset({
+    'title', 'header', 'main', 'section', 'article', 'div', 'p', 'blockquote', 'address',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'ul', 'ol', 'li', 'dl', 'dt', 'dd',
+    'table', 'tr', 'td', 'th', 'figcaption', 'br',
+})
+
+
+def is_boilerplate(tag: str, attrib) -> bool:
+    if tag in DROP_TAGS:
+        return True
+    if attrib.get('role') in DROP_ROLES or attrib.get('aria-hidden') == 'true':
+        return True
+    marker = f"{attrib.get('id', '')} {attrib.get('class', '')}"
+    return bool(marker.strip()) and BOILERPLATE_RE.search(marker) is not None
+
+
+class TextCollector:
+    """lxml parser target that keeps visible text as ``(block tag, text)`` pairs in document order.
+
+    Text nodes arrive exactly once through ``data``, so nested containers never repeat their
+    children's text, and no tree is built. ``done`` flips once ``max_words`` have been collected so
+    the caller can stop feeding the parser.
+    """
+
+    def __init__(self, max_words: int = DEFAULT_MAX_WORDS):
+        self.max_words = max_words
+        self.words = 0
+        self.done = False
+        self.blocks: List[Tuple[str, str]] = []
+        self._pieces = []
+        self._dropped = []
+        self._skipping = 0
+        self._block_stack = ['body']
+
+    def _flush(self) -> None:
+        if self._pieces:
+            text = ' '.join(''.join(self._pieces).split())
+            if text:
+                self.blocks.append((self._block_stack[-1], text))
+            self._pieces = []
+
+    def start(self, tag, attrib) -> None:
+        tag = tag.lower() if isinstance(tag, str) else ''
+        dropped = not self._skipping and is_boilerplate(tag, attrib)
+        self._dropped.append(dropped)
+        if dropped:
+            self._skipping += 1
+        if not self._skipping and tag in BLOCK_TAGS:
+            self._flush()
+            self._block_stack.append(tag)
+
+    def end(self, tag) -> None:
+        tag = tag.lower() if isinstance(tag, str) else ''
+        if self._dropped and self._dropped.pop():
+            self._skipping -= 1
+            return
+        if not self._skipping and tag in BLOCK_TAGS:
+            self._flush()
+            if len(self._block_stack) > 1:
+                self._block_stack.pop()
+
+    def data(self, data: str) -> None:
+        if self._skipping or self.done:
+            return
+        self._pieces.append(data)
+        self.words += len(data.split())
+        if self.words >= self.max_words:
+            self.done = True
+
+    def close(self) -> List[Tuple[str, str]]:
+        self._flush()
+        return self.blocks
+
+
+def _decode(content: bytes) -> Optional[str]:
+    """UTF-8 text, tolerating a multi-byte character cut by the byte cap; None to let libxml2 sniff the charset."""
+    try:
+        return content.decode('utf-8')
+    except UnicodeDecodeError as e:
+        if e.start >= len(content) - 3:
+            return content[:e.start].decode('utf-8', 'ignore')
+        return None
+
+
+def iter_chunks(content, size: int = FEED_CHUNK_SIZE) -> Iterable:
+    for start in range(0, len(content), size):
+        yield content[start:start + size]
+
+
+def extract_blocks(content, max_words: int = DEFAULT_MAX_WORDS) -> List[Tuple[str, str]]:
+    """Parse ``content`` (bytes, str or an iterable of chunks) into visible text blocks, stopping at ``max_words``."""
+    if isinstance(content, bytes):
+        decoded = _decode(content)
+        chunks = iter_chunks(decoded if decoded is not None else content)
+    elif isinstance(content, str):
+        chunks = iter_chunks(content)
+    else:
+        chunks = content
+
+    collector = TextCollector(max_words)
+    parser = etree.HTMLParser(target=collector, remove_comments=True, remove_pis=True, no_network=True)
+    fed = False
+    for chunk in chunks:
+        if not chunk:
+            continue
+        parser.feed(chunk)
+        fed = True
+        if collector.done:
+            break
+    if not fed:
+        return []
+    try:
+        return parser.close()
+    except etree.XMLSyntaxError:
+        return collector.close()
+
+
+def html_to_text(content, max_words: int = DEFAULT_MAX_WORDS) -> str:
+    """Visible page text with boilerplate removed, cut to ``max_words`` words."""
+    words = ' '.join(text for _, text in extract_blocks(content, max_words)).split()
+    return ' '.join(words[:max_words])
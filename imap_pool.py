@@ -0,0 +1,105 @@
+import imaplib
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+IMAP_POOL_SIZE = int(os.getenv('IMAP_POOL_SIZE', '2'))
+IMAP_MAX_IDLE = int(os.getenv('IMAP_MAX_IDLE', '300'))
+
+
+class IMAPPool:
+    """A few reusable, logged-in IMAP sessions for one account.
+
+    Sessions are NOOP-checked before being handed out and dropped if they fail or have been idle
+    longer than ``max_idle`` seconds; at most ``max_size`` are open at once, which also keeps us
+    clear of the provider's connection-burst throttling.
+    """
+
+    def __init__(self, host: str, user: str, password: str, max_size: int = IMAP_POOL_SIZE,
+                 max_idle: int = IMAP_MAX_IDLE):
+        self.host = host
+        self.user = user
+        self.password = password
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+
+    def _connect(self) -> imaplib.IMAP4_SSL:
+        mail = imaplib.IMAP4_SSL(self.host)
+        mail.login(self.user, self.password)
+        logging.info(f"Opened IMAP session for {self.user}")
+        return mail
+
+    @staticmethod
+    def _discard(mail) -> None:
+        try:
+            mail.logout()
+        except Exception:
+            pass
+
+    def _checkout(self) -> imaplib.IMAP4_SSL:
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                mail, released_at = self._idle.pop()
+            if time.monotonic() - released_at > self.max_idle:
+                self._discard(mail)
+                continue
+            try:
+                if mail.noop()[0] == 'OK':
+                    return mail
+            except (imaplib.IMAP4.error, OSError):
+                pass
+            self._discard(mail)
+        return self._connect()
+
+    @contextmanager
+    def session(self, mailbox: Optional[str] = None, readonly: bool = True):
+        self._slots.acquire()
+        mail = None
+        try:
+            mail = self._checkout()
+            if mailbox:
+                mail.select(mailbox, readonly=readonly)
+            yield mail
+        except (imaplib.IMAP4.abort, OSError):
+            if mail is not None:
+                self._discard(mail)
+                mail = None
+            raise
+        finally:
+            if mail is not None:
+                with self._lock:
+                    self._idle.append((mail, time.monotonic()))
+            self._slots.release()
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for mail, _ in idle:
+            self._discard(mail)
+
+
+_pools: Dict[Tuple[str, str], IMAPPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_imap_pool(user: str, password: str, host: Optional[str] = None) -> IMAPPool:
+    host = host or os.getenv('IMAP_SERVER')
+    with _pools_lock:
+        pool = _pools.get((host, user))
+        if pool is None or pool.password != password:
+            if pool is not None:
+                pool.close()
+            pool = _pools[(host, user)] = IMAPPool(host, user, password)
+        return pool
+
+
+def imap_session(user: str, password: str, mailbox: Optional[str] = None, readonly: bool = True):
+    return get_imap_pool(user, password).session(mailbox, readonly=readonly)
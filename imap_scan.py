@@ -0,0 +1,325 @@
+import base64
+import email
+import email.utils
+import json
+import logging
+import os
+import quopri
+import re
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+IMAP_STATE_PATH = os.getenv('IMAP_STATE_PATH', 'data/imap_state.json')
+FETCH_BATCH_SIZE = int(os.getenv('IMAP_FETCH_BATCH_SIZE', '200'))
+
+_MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+_UID_RE = re.compile(rb'UID (\d+)')
+_MESSAGE_START_RE = re.compile(rb'^\d+ \(')
+_TOKEN_RE = re.compile(rb'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|\{(\d+)\}\r\n|([^\s()"]+))')
+_state_lock = threading.Lock()
+
+
+def imap_date(value: datetime) -> str:
+    # IMAP wants English month abbreviations regardless of the process locale.
+    return f"{value.day:02d}-{_MONTHS[value.month - 1]}-{value.year}"
+
+
+def chunked(items: List[Any], size: int) -> Iterable[List[Any]]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def parse_imap_list(data: bytes):
+    """Parse a parenthesized IMAP response (e.g. a BODYSTRUCTURE) into nested lists of str/None."""
+    stack = [[]]
+    pos = 0
+    while pos < len(data):
+        match = _TOKEN_RE.match(data, pos)
+        if not match or match.end() == pos:
+            break
+        pos = match.end()
+        open_paren, close_paren, quoted, literal_len, atom = match.groups()
+        if open_paren:
+            stack.append([])
+        elif close_paren:
+            if len(stack) == 1:
+                break
+            node = stack.pop()
+            stack[-1].append(node)
+        elif quoted is not None:
+            stack[-1].append(re.sub(rb'\\(.)', rb'\1', quoted).decode('utf-8', 'replace'))
+        elif literal_len is not None:
+            size = int(literal_len)
+            stack[-1].append(data[pos:pos + size].decode('utf-8', 'replace'))
+            pos += size
+        else:
+            value = atom.decode('ascii', 'replace')
+            stack[-1].append(None if value.upper() == 'NIL' else value)
+    while len(stack) > 1:
+        node = stack.pop()
+        stack[-1].append(node)
+    return stack[0]
+
+
+def _part_params(params) -> Dict[str, str]:
+    if not isinstance(params, list):
+        return {}
+    return {str(k).lower(): v for k, v in zip(params[::2], params[1::2])}
+
+
+def _iter_leaf_parts(structure, prefix: str = ''):
+    if structure and isinstance(structure[0], list):
+        index = 0
+        for child in structure:
+            if not isinstance(child, list):
+                break
+            index += 1
+            yield from _iter_leaf_parts(child, f"{prefix}.{index}" if prefix else str(index))
+    elif len(structure) >= 6:
+        yield prefix or '1', structure
+
+
+def find_text_part(structure) -> Optional[Dict[str, str]]:
+    """Locate the text/plain part of a BODYSTRUCTURE (falling back to text/html)."""
+    fallback = None
+    for part_id, leaf in _iter_leaf_parts(structure):
+        main_type, sub_type = str(leaf[0]).lower(), str(leaf[1]).lower()
+        if main_type != 'text':
+            continue
+        part = {
+            'part': part_id,
+            'subtype': sub_type,
+            'charset': _part_params(leaf[2]).get('charset') or 'utf-8',
+            'encoding': str(leaf[5] or '7bit').lower(),
+        }
+        if sub_type == 'plain':
+            return part
+        if sub_type == 'html' and fallback is None:
+            fallback = part
+    return fallback
+
+
+def decode_part(payload: bytes, encoding: str, charset: str) -> str:
+    if encoding == 'base64':
+        payload = base64.b64decode(payload)
+    elif encoding == 'quoted-printable':
+        payload = quopri.decodestring(payload)
+    try:
+        return payload.decode(charset, 'replace')
+    except LookupError:
+        return payload.decode('utf-8', 'replace')
+
+
+def _split_fetch_response(data) -> List[bytes]:
+    """Reassemble imaplib's FETCH response into one bytes blob per message, literals inlined."""
+    messages = []
+    for item in data or []:
+        if item is None:
+            continue
+        if isinstance(item, tuple):
+            head, literal = item[0], item[1]
+            chunk = head + b'\r\n' + literal
+            if _MESSAGE_START_RE.match(head) or not messages:
+                messages.append(chunk)
+            else:
+                messages[-1] += chunk
+        elif _MESSAGE_START_RE.match(item) or not messages:
+            messages.append(item)
+        else:
+            messages[-1] += item
+    return messages
+
+
+def _fetch_literals(mail, uids: List[bytes], query: str) -> Dict[int, bytes]:
+    results = {}
+    for batch in chunked(uids, FETCH_BATCH_SIZE):
+        _, data = mail.uid('FETCH', b','.join(batch).decode(), query)
+        for item in data or []:
+            if isinstance(item, tuple):
+                match = _UID_RE.search(item[0])
+                if match:
+                    results[int(match.group(1))] = item[1]
+    return results
+
+
+def _fetch_structures(mail, uids: List[bytes]) -> Dict[int, list]:
+    results = {}
+    for batch in chunked(uids, FETCH_BATCH_SIZE):
+        _, data = mail.uid('FETCH', b','.join(batch).decode(), '(BODYSTRUCTURE)')
+        for message in _split_fetch_response(data):
+            match = _UID_RE.search(message)
+            start = message.find(b'BODYSTRUCTURE')
+            if match and start != -1:
+                parsed = parse_imap_list(message[start + len(b'BODYSTRUCTURE'):])
+                if parsed and isinstance(parsed[0], list):
+                    results[int(match.group(1))] = parsed[0]
+    return results
+
+
+def fetch_text_bodies(mail, uids: List[int]) -> Dict[int, str]:
+    """Fetch only the readable text part of each message, grouped so each distinct part id costs one batch."""
+    structures = _fetch_structures(mail, [str(uid).encode() for uid in uids])
+    by_part: Dict[str, List[int]] = {}
+    parts: Dict[int, Dict[str, str]] = {}
+    for uid, structure in structures.items():
+        part = find_text_part(structure)
+        if part:
+            parts[uid] = part
+            by_part.setdefault(part['part'], []).append(uid)
+
+    bodies = {}
+    for part_id, part_uids in by_part.items():
+        payloads = _fetch_literals(mail, [str(uid).encode() for uid in part_uids], f'(BODY.PEEK[{part_id}])')
+        for uid, payload in payloads.items():
+            bodies[uid] = decode_part(payload, parts[uid]['encoding'], parts[uid]['charset'])
+    return bodies
+
+
+def load_scan_state(key: str, path: Optional[str] = None) -> Dict[str, Any]:
+    path = path or IMAP_STATE_PATH
+    with _state_lock:
+        try:
+            with open(path) as f:
+                return json.load(f).get(key, {})
+        except (OSError, ValueError):
+            return {}
+
+
+def save_scan_state(key: str, state: Dict[str, Any], path: Optional[str] = None) -> None:
+    path = path or IMAP_STATE_PATH
+    with _state_lock:
+        try:
+            with open(path) as f:
+                all_state = json.load(f)
+        except (OSError, ValueError):
+            all_state = {}
+        all_state[key] = state
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(all_state, f)
+        os.replace(tmp_path, path)
+
+
+def scan_replies(mail, senders: Dict[str, Any], account: str, since: Optional[datetime] = None,
+                 mailbox: str = 'inbox', campaign_id=None) -> List[Dict[str, Any]]:
+    """Find replies from ``senders`` (lower-cased address -> lead) in one incremental pass over ``mailbox``.
+
+    A single UID SEARCH covers everything newer than the last scan (or ``since`` on the first scan), headers are
+    fetched in batches, and bodies are downloaded only for messages whose sender is a lead. The UID cursor is
+    kept per ``campaign_id``, since campaigns sharing an account each look for their own leads' replies.
+    """
+    mail.select(mailbox, readonly=True)
+    uidvalidity = (mail.response('UIDVALIDITY')[1] or [None])[0]
+    uidvalidity = uidvalidity.decode() if isinstance(uidvalidity, bytes) else uidvalidity
+
+    state_key = f"{account}:{mailbox}" if campaign_id is None else f"{account}:{mailbox}:{campaign_id}"
+    state = load_scan_state(state_key)
+    last_uid = state.get('last_uid', 0) if state.get('uidvalidity') == uidvalidity else 0
+
+    criteria = [f'UID {last_uid + 1}:*']
+    if since is not None and not last_uid:
+        # Later scans are bounded by the stored UID alone, so replies that arrived between runs are kept.
+        criteria.append(f'SINCE {imap_date(since)}')
+    _, search_data = mail.uid('SEARCH', None, *criteria)
+    # "n:*" always matches the newest message, even when its UID is below n.
+    uids = [uid for uid in (search_data[0] or b'').split() if int(uid) > last_uid]
+    logging.info(f"Scanning {len(uids)} new messages in {mailbox} for replies from {len(senders)} leads")
+
+    replies: Dict[str, Dict[str, Any]] = {}
+    headers = _fetch_literals(mail, uids, '(BODY.PEEK[HEADER.FIELDS (FROM DATE IN-REPLY-TO)])')
+    for uid, raw_headers in headers.items():
+        message = email.message_from_bytes(raw_headers)
+        sender = email.utils.parseaddr(message.get('From', ''))[1].strip().lower()
+        if sender not in senders:
+            continue
+        try:
+            date = email.utils.parsedate_to_datetime(message['Date']) if message['Date'] else None
+        except (TypeError, ValueError):
+            date = None
+        reply = {'uid': uid, 'sender': sender, 'date': date, 'in_reply_to': message.get('In-Reply-To'), 'body': None}
+        current = replies.get(sender)
+        # Prefer real replies (In-Reply-To set) and, among those, the most recent message.
+        if current is None or (bool(reply['in_reply_to']), uid) > (bool(current['in_reply_to']), current['uid']):
+            replies[sender] = reply
+
+    if replies:
+        bodies = fetch_text_bodies(mail, [reply['uid'] for reply in replies.values()])
+        for reply in replies.values():
+            reply['body'] = bodies.get(reply['uid'])
+
+    if uids:
+        save_scan_state(state_key, {'uidvalidity': uidvalidity, 'last_uid': max(int(uid) for uid in uids)})
+    return list(replies.values())
+
+
+class SentMessageIndex:
+    """Incrementally maintained index of sent messages by recipient.
+
+    Each refresh costs one UID SEARCH for messages newer than the last one seen plus batched
+    header fetches; bodies are fetched once per message and kept, since sent mail never changes.
+    Building the threads for a whole batch of recipients therefore takes a fixed handful of
+    round trips instead of a search and full download per recipient.
+    """
+
+    def __init__(self, account: str, mailbox: str = 'sent'):
+        self.account = account
+        self.mailbox = mailbox
+        self.uidvalidity = None
+        self.last_uid = 0
+        self.by_recipient: Dict[str, List[Dict[str, Any]]] = {}
+        self.bodies: Dict[int, str] = {}
+        self.lock = threading.Lock()
+
+    def refresh(self, mail) -> None:
+        mail.select(self.mailbox, readonly=True)
+        uidvalidity = (mail.response('UIDVALIDITY')[1] or [None])[0]
+        if uidvalidity != self.uidvalidity:
+            self.uidvalidity, self.last_uid = uidvalidity, 0
+            self.by_recipient, self.bodies = {}, {}
+
+        _, search_data = mail.uid('SEARCH', None, f'UID {self.last_uid + 1}:*')
+        uids = [uid for uid in (search_data[0] or b'').split() if int(uid) > self.last_uid]
+        headers = _fetch_literals(mail, uids, '(BODY.PEEK[HEADER.FIELDS (TO CC SUBJECT DATE)])')
+        for uid, raw_headers in headers.items():
+            message = email.message_from_bytes(raw_headers)
+            try:
+                date = email.utils.parsedate_to_datetime(message['Date']) if message['Date'] else None
+            except (TypeError, ValueError):
+                date = None
+            entry = {'uid': uid, 'subject': message['subject'], 'date': date}
+            addresses = email.utils.getaddresses(message.get_all('To', []) + message.get_all('Cc', []))
+            for _, address in addresses:
+                if address:
+                    self.by_recipient.setdefault(address.strip().lower(), []).append(entry)
+        if uids:
+            self.last_uid = max(int(uid) for uid in uids)
+
+    def threads(self, mail, recipients: Iterable[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """Return each recipient's sent messages, most recent first, as subject/body/date dicts."""
+        with self.lock:
+            self.refresh(mail)
+            recipients = [recipient.strip().lower() for recipient in recipients]
+            entries = {recipient: sorted(self.by_recipient.get(recipient, []), key=lambda e: e['uid'], reverse=True)
+                       for recipient in recipients}
+            missing = sorted({e['uid'] for thread in entries.values() for e in thread if e['uid'] not in self.bodies})
+            if missing:
+                self.bodies.update(fetch_text_bodies(mail, missing))
+            return {recipient: [{'subject': e['subject'], 'body': self.bodies.get(e['uid']), 'date': e['date']}
+                                for e in thread]
+                    for recipient, thread in entries.items()}
+
+
+_sent_indexes: Dict[tuple, SentMessageIndex] = {}
+_sent_indexes_lock = threading.Lock()
+
+
+def get_sent_index(account: str, mailbox: str = 'sent') -> SentMessageIndex:
+    with _sent_indexes_lock:
+        index = _sent_indexes.get((account, mailbox))
+        if index is None:
+            index = _sent_indexes[(account, mailbox)] = SentMessageIndex(account, mailbox)
+        return index
@@ -1,7 +1,10 @@
 document.addEventListener('DOMContentLoaded', () => {
     const logsContainer = document.getElementById('logs-container');
     const crmContainer = document.getElementById('crm-container');
-    const eventSource = new EventSource('/api/campaign-status');
+    const campaignId = new URLSearchParams(window.location.search).get('campaign_id');
+    const statusUrl = campaignId ? `/api/campaign-status?campaign_id=${encodeURIComponent(campaignId)}` : '/api/campaign-status';
+    // EventSource reconnects on its own and sends Last-Event-ID, so the server resumes where we left off.
+    const eventSource = new EventSource(statusUrl);
 
     eventSource.onmessage = function(event) {
         console.log('Received event:', event.data);
@@ -19,9 +22,6 @@ document.addEventListener('DOMContentLoaded', () => {
                 logEntry.style.fontWeight = 'bold';
                 logsContainer.appendChild(logEntry);
                 logsContainer.scrollTop = logsContainer.scrollHeight;
-                if (data.message === 'Campaign finished') {å
-                    eventSource.close();
-                }
                 break;
             case 'error':
                 logEntry.textContent = 'Error: ' + data.message;
@@ -33,11 +33,15 @@ document.addEventListener('DOMContentLoaded', () => {
                 updateCRM(data.message);
                 break;
         }
+
+        // The server ends the stream after a finished event; reconnecting would only replay it.
+        if (data.finished) {
+            eventSource.close();
+        }
     };
 
     eventSource.onerror = function(error) {
         console.error('EventSource failed:', error);
-        eventSource.close();
     };
 
     function updateCRM(crmData) {
@@ -59,7 +59,10 @@ document.addEventListener('DOMContentLoaded', () => {
                         const data = JSON.parse(line.slice(6));
                         console.log(data);  // Log each message for debugging
 
-                        if (data.type === 'status' && data.message === 'Campaign finished') {
+                        if (data.type === 'campaign') {
+                            window.location.href = `/logs?campaign_id=${encodeURIComponent(data.campaign_id)}`;
+                            return;
+                        } else if (data.type === 'status' && data.message === 'Campaign finished') {
                             window.location.href = '/logs';
                             return;
                         } else if (data.type === 'error') {
@@ -0,0 +1,139 @@
+import logging
+import os
+import threading
+
+from scrapy.exceptions import DropItem
+from twisted.internet import task
+
+import lead_store
+
+EXPORT_FIELDNAMES = ['Name', 'Website', 'Email', 'Decision Maker']
+
+
+class SeenEmails:
+    """Emails already found for one campaign, shared by every spider crawling for it.
+
+    The crawl worker runs several batch spiders for a campaign at once and each pipeline buffers
+    its writes, so the store alone cannot tell one batch about another's addresses.
+    """
+
+    def __init__(self, emails):
+        self._emails = set(emails)
+        self._lock = threading.Lock()
+        self.users = 0
+
+    def add(self, email: str) -> bool:
+        """Record ``email``; False if the campaign already had it."""
+        with self._lock:
+            if email in self._emails:
+                return False
+            self._emails.add(email)
+            return True
+
+
+_seen_emails = {}
+_seen_emails_lock = threading.Lock()
+
+
+def acquire_seen_emails(campaign_id) -> SeenEmails:
+    """The campaign's shared set, loaded from the store by the first spider that needs it."""
+    with _seen_emails_lock:
+        seen = _seen_emails.get(campaign_id)
+        if seen is None:
+            seen = _seen_emails[campaign_id] = SeenEmails(lead_store.campaign_emails(campaign_id))
+        seen.users += 1
+        return seen
+
+
+def release_seen_emails(campaign_id) -> None:
+    # Once the campaign's last spider has flushed, the store holds every address and the set can go.
+    with _seen_emails_lock:
+        seen = _seen_emails.get(campaign_id)
+        if seen is None:
+            return
+        seen.users -= 1
+        if seen.users <= 0:
+            del _seen_emails[campaign_id]
+
+
+class BufferedLeadWriterPipeline:
+    """Writes enriched leads to the lead store in batches, dropping duplicate emails as they arrive.
+
+    Rows are flushed every ``LEADS_FLUSH_BATCH`` items or ``LEADS_FLUSH_INTERVAL`` seconds,
+    whichever comes first, each flush being a single transaction. Because duplicates never reach
+    the store, closing the spider only flushes the last batch.
+    """
+
+    def __init__(self, batch_size=50, flush_interval=10.0, export_xlsx=False,
+                 xlsx_path='src/lead_scraper/business_leads_with_emails.xlsx'):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.export_xlsx = export_xlsx
+        self.xlsx_path = xlsx_path
+        self.campaign_id = None
+        self.buffer = []
+        self.seen_emails = None
+        self.saved = 0
+        self.exported_rows = []
+        self.flush_loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            batch_size=settings.getint('LEADS_FLUSH_BATCH', 50),
+            flush_interval=settings.getfloat('LEADS_FLUSH_INTERVAL', 10.0),
+            export_xlsx=settings.getbool('LEADS_EXPORT_XLSX', False),
+            xlsx_path=settings.get('LEADS_XLSX_PATH', 'src/lead_scraper/business_leads_with_emails.xlsx'),
+        )
+
+    def open_spider(self, spider):
+        self.campaign_id = getattr(spider, 'campaign_id', None)
+        self.seen_emails = acquire_seen_emails(self.campaign_id)
+
+        self.flush_loop = task.LoopingCall(self.flush)
+        self.flush_loop.start(self.flush_interval, now=False)
+
+    def process_item(self, item, spider):
+        email = (item.get('Email') or '').strip().lower()
+        if not email:
+            raise DropItem(f"No email for {item.get('Name')}")
+        if not self.seen_emails.add(email):
+            raise DropItem(f"Duplicate email {email} for {item.get('Name')}")
+
+        row = dict(item)
+        row['Email'] = email
+        self.buffer.append(row)
+        if self.export_xlsx:
+            self.exported_rows.append(row)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+        return item
+
+    def flush(self):
+        if not self.buffer:
+            return
+        lead_store.save_lead_emails(self.buffer, self.campaign_id)
+        self.saved += len(self.buffer)
+        logging.info(f"Saved {len(self.buffer)} leads to the lead store")
+        self.buffer = []
+
+    def close_spider(self, spider):
+        if self.flush_loop is not None and self.flush_loop.running:
+            self.flush_loop.stop()
+        try:
+            self.flush()
+        finally:
+            if self.seen_emails is not None:
+                release_seen_emails(self.campaign_id)
+                self.seen_emails = None
+        logging.info(f"Saved {self.saved} unique leads for campaign {self.campaign_id}")
+
+        if self.export_xlsx:
+            import pandas as pd
+
+            directory = os.path.dirname(self.xlsx_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            pd.DataFrame(self.exported_rows, columns=EXPORT_FIELDNAMES).to_excel(self.xlsx_path, index=False)
+            logging.info(f"Exported leads to {self.xlsx_path}")
@@ -0,0 +1,328 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+LEAD_DB_PATH = os.getenv('LEAD_DB_PATH', 'data/leads.sqlite3')
+
+# Lead dicts keep the column names the CSV files used, so campaign code reads the same either way.
+LEAD_COLUMNS = {
+    'Name': 'name',
+    'Website': 'website',
+    'Email': 'email',
+    'Decision Maker': 'decision_maker',
+    'EmailSent': 'email_sent',
+    'LastEmailDate': 'last_email_date',
+    'FollowUpCount': 'follow_up_count',
+    'Response': 'response',
+    'ResponseDate': 'response_date',
+    'ResponseContent': 'response_content',
+    'LastEmailClassification': 'last_email_classification',
+}
+_BOOLEAN_COLUMNS = {'email_sent'}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    niche TEXT,
+    location TEXT,
+    website TEXT,
+    name TEXT,
+    offer TEXT,
+    gmail TEXT
+);
+CREATE TABLE IF NOT EXISTS campaigns (
+    id INTEGER PRIMARY KEY,
+    gmail TEXT,
+    niche TEXT,
+    location TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leads (
+    id INTEGER PRIMARY KEY,
+    campaign_id INTEGER REFERENCES campaigns (id),
+    name TEXT,
+    website TEXT,
+    website_key TEXT,
+    domain TEXT,
+    email TEXT,
+    decision_maker TEXT,
+    email_sent INTEGER NOT NULL DEFAULT 0,
+    last_email_date TEXT,
+    follow_up_count INTEGER NOT NULL DEFAULT 0,
+    response TEXT,
+    response_date TEXT,
+    response_content TEXT,
+    last_email_classification TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS campaign_jobs (
+    campaign_id INTEGER PRIMARY KEY REFERENCES campaigns (id),
+    gmail TEXT NOT NULL,
+    payload TEXT,
+    status TEXT NOT NULL DEFAULT 'queued',
+    error TEXT,
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT
+);
+CREATE INDEX IF NOT EXISTS leads_email ON leads (email);
+CREATE INDEX IF NOT EXISTS leads_domain ON leads (domain);
+CREATE INDEX IF NOT EXISTS leads_campaign ON leads (campaign_id, email_sent);
+CREATE INDEX IF NOT EXISTS users_gmail ON users (gmail);
+CREATE INDEX IF NOT EXISTS campaign_jobs_status ON campaign_jobs (status, campaign_id);
+'''
+
+# Leads without a campaign dedupe among themselves as campaign 0, since NULLs never collide in a UNIQUE index.
+LEAD_UNIQUE_KEY = 'IFNULL(campaign_id, 0), website_key'
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized_paths = set()
+
+
+def connect(path: Optional[str] = None) -> sqlite3.Connection:
+    """Return this thread's connection to the lead database, creating the schema on first use."""
+    path = path or LEAD_DB_PATH
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        with _init_lock:
+            if path not in _initialized_paths:
+                conn.executescript(SCHEMA)
+                _migrate(conn)
+                _initialized_paths.add(path)
+        connections[path] = conn
+    return conn
+
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    """Bring databases created before website_key existed up to the current schema."""
+    columns = {row['name'] for row in conn.execute('PRAGMA table_info(leads)')}
+    with conn:
+        if 'website_key' not in columns:
+            conn.execute('ALTER TABLE leads ADD COLUMN website_key TEXT')
+        rows = conn.execute('SELECT id, campaign_id, website FROM leads WHERE website_key IS NULL ORDER BY id').fetchall()
+        if rows:
+            taken = {(row[0], row[1]) for row in conn.execute(
+                'SELECT IFNULL(campaign_id, 0), website_key FROM leads WHERE website_key IS NOT NULL')}
+            for row in rows:
+                key = website_key(row['website'])
+                if key is not None and (row['campaign_id'] or 0, key) in taken:
+                    # Duplicates stored before the key existed stay readable but cannot collide
+                    key = f"{key}#{row['id']}"
+                taken.add((row['campaign_id'] or 0, key))
+                conn.execute('UPDATE leads SET website_key = ? WHERE id = ?', (key, row['id']))
+        conn.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS leads_campaign_website ON leads ({LEAD_UNIQUE_KEY})')
+
+
+def website_domain(website: str) -> str:
+    website = (website or '').strip()
+    domain = urlparse(website if '//' in website else f"//{website}").netloc.lower()
+    return domain[4:] if domain.startswith('www.') else domain
+
+
+def website_key(website: str) -> Optional[str]:
+    """Identify a business by its site, ignoring scheme, www, a trailing slash and any fragment."""
+    website = (website or '').strip()
+    if not website:
+        return None
+    parsed = urlparse(website if '//' in website else f"//{website}")
+    key = website_domain(website) + parsed.path.rstrip('/')
+    return f"{key}?{parsed.query}" if parsed.query else key
+
+
+def row_to_lead(row: sqlite3.Row) -> Dict[str, Any]:
+    lead = {'id': row['id'], 'campaign_id': row['campaign_id']}
+    for key, column in LEAD_COLUMNS.items():
+        value = row[column]
+        lead[key] = bool(value) if column in _BOOLEAN_COLUMNS else value
+    return lead
+
+
+def register_user(niche, location, website, name, offer, gmail) -> int:
+    conn = connect()
+    with conn:
+        cursor = conn.execute(
+            'INSERT INTO users (timestamp, niche, location, website, name, offer, gmail) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), niche, location, website, name, offer, gmail))
+    return cursor.lastrowid
+
+
+def create_campaign(gmail, niche, location) -> int:
+    conn = connect()
+    with conn:
+        cursor = conn.execute('INSERT INTO campaigns (gmail, niche, location, created_at) VALUES (?, ?, ?, ?)',
+                              (gmail, niche, location, datetime.now().isoformat()))
+    return cursor.lastrowid
+
+
+def campaign_exists(campaign_id: int) -> bool:
+    return connect().execute('SELECT 1 FROM campaigns WHERE id = ?', (campaign_id,)).fetchone() is not None
+
+
+def add_lead(campaign_id: Optional[int], row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Insert one scraped business and return it as a stored lead, or None if the campaign already has it."""
+    if not row.get('Website'):
+        return None
+    conn = connect()
+    with conn:
+        cursor = conn.execute('''INSERT OR IGNORE INTO leads (campaign_id, name, website, website_key, domain, email,
+                                                           decision_maker, created_at)
+                                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                              (campaign_id, row.get('Name'), row['Website'], website_key(row['Website']),
+                               website_domain(row['Website']),
+                               row.get('Email') or None, row.get('Decision Maker') or None, datetime.now().isoformat()))
+        if not cursor.rowcount:
+            return None
+        return row_to_lead(conn.execute('SELECT * FROM leads WHERE id = ?', (cursor.lastrowid,)).fetchone())
+
+
+def get_leads(campaign_id: Optional[int] = None, with_email: Optional[bool] = None) -> List[Dict[str, Any]]:
+    clauses, params = [], []
+    if campaign_id is not None:
+        clauses.append('campaign_id = ?')
+        params.append(campaign_id)
+    if with_email is True:
+        clauses.append('email IS NOT NULL')
+    elif with_email is False:
+        clauses.append('email IS NULL')
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    rows = connect().execute(f'SELECT * FROM leads {where} ORDER BY id', params).fetchall()
+    return [row_to_lead(row) for row in rows]
+
+
+def campaign_emails(campaign_id: Optional[int] = None) -> set:
+    if campaign_id is None:
+        rows = connect().execute('SELECT email FROM leads WHERE email IS NOT NULL').fetchall()
+    else:
+        rows = connect().execute('SELECT email FROM leads WHERE campaign_id = ? AND email IS NOT NULL',
+                                 (campaign_id,)).fetchall()
+    return {row['email'] for row in rows}
+
+
+def emails_sent_today(gmail: str) -> int:
+    """Leads of ``gmail``'s campaigns last emailed today (local time), which seeds the daily send quota."""
+    row = connect().execute('''SELECT COUNT(*) FROM leads JOIN campaigns ON campaigns.id = leads.campaign_id
+                               WHERE campaigns.gmail = ? AND leads.last_email_date >= ?''',
+                            (gmail, datetime.now().date().isoformat())).fetchone()
+    return row[0]
+
+
+def update_lead(lead_id: int, fields: Dict[str, Any]) -> None:
+    """Update a single lead in place; ``fields`` uses the lead dict keys (e.g. ``EmailSent``)."""
+    columns = {LEAD_COLUMNS[key]: value for key, value in fields.items() if key in LEAD_COLUMNS}
+    if not columns:
+        return
+    assignments = ', '.join(f"{column} = ?" for column in columns)
+    conn = connect()
+    with conn:
+        conn.execute(f'UPDATE leads SET {assignments} WHERE id = ?', [*columns.values(), lead_id])
+
+
+def save_lead_emails(rows: Iterable[Dict[str, Any]], campaign_id: Optional[int] = None) -> None:
+    """Record emails found by the spider in one transaction, inserting leads the store has not seen."""
+    conn = connect()
+    now = datetime.now().isoformat()
+    with conn:
+        for row in rows:
+            email = row.get('Email')
+            decision_maker = row.get('Decision Maker') or None
+            if row.get('id'):
+                conn.execute('UPDATE leads SET email = ?, decision_maker = COALESCE(?, decision_maker) WHERE id = ?',
+                             (email, decision_maker, row['id']))
+            else:
+                conn.execute(f'''INSERT INTO leads (campaign_id, name, website, website_key, domain, email, decision_maker,
+                                                    created_at)
+                                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                                 ON CONFLICT ({LEAD_UNIQUE_KEY}) DO UPDATE SET
+                                     email = excluded.email,
+                                     decision_maker = COALESCE(excluded.decision_maker, leads.decision_maker)''',
+                             (campaign_id, row.get('Name'), row.get('Website'), website_key(row.get('Website')),
+                              website_domain(row.get('Website')), email, decision_maker, now))
+
+
+def job_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+    return {key: row[key] for key in ('campaign_id', 'gmail', 'status', 'error', 'created_at', 'started_at', 'finished_at')}
+
+
+def enqueue_job(campaign_id: int, gmail: str, payload: Dict[str, Any]) -> None:
+    conn = connect()
+    with conn:
+        conn.execute('INSERT INTO campaign_jobs (campaign_id, gmail, payload, created_at) VALUES (?, ?, ?, ?)',
+                     (campaign_id, gmail, json.dumps(payload), datetime.now().isoformat()))
+
+
+def get_job(campaign_id: int) -> Optional[Dict[str, Any]]:
+    row = connect().execute('SELECT * FROM campaign_jobs WHERE campaign_id = ?', (campaign_id,)).fetchone()
+    return job_to_dict(row) if row else None
+
+
+def get_jobs(statuses: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+    if statuses is None:
+        rows = connect().execute('SELECT * FROM campaign_jobs ORDER BY campaign_id').fetchall()
+    else:
+        statuses = list(statuses)
+        placeholders = ', '.join('?' * len(statuses))
+        rows = connect().execute(f'SELECT * FROM campaign_jobs WHERE status IN ({placeholders}) ORDER BY campaign_id',
+                                 statuses).fetchall()
+    return [job_to_dict(row) for row in rows]
+
+
+def claim_next_job(busy_senders: Iterable[str] = (),
+                   campaign_ids: Optional[Iterable[int]] = None) -> Optional[Tuple[int, str, Dict[str, Any]]]:
+    """Mark the oldest queued job whose sender is not in ``busy_senders`` as running and return it.
+
+    With ``campaign_ids``, only those campaigns' jobs are considered.
+    """
+    busy_senders = set(busy_senders)
+    campaign_ids = None if campaign_ids is None else set(campaign_ids)
+    conn = connect()
+    with conn:
+        for row in conn.execute("SELECT campaign_id, gmail, payload FROM campaign_jobs WHERE status = 'queued' ORDER BY campaign_id"):
+            if row['gmail'] in busy_senders:
+                continue
+            if campaign_ids is not None and row['campaign_id'] not in campaign_ids:
+                continue
+            claimed = conn.execute("UPDATE campaign_jobs SET status = 'running', started_at = ? WHERE campaign_id = ? AND status = 'queued'",
+                                   (datetime.now().isoformat(), row['campaign_id'])).rowcount
+            if claimed:
+                return row['campaign_id'], row['gmail'], json.loads(row['payload'] or '{}')
+    return None
+
+
+def finish_job(campaign_id: int, status: str, error: Optional[str] = None) -> None:
+    # The payload is only needed while the job can still run.
+    conn = connect()
+    with conn:
+        conn.execute('UPDATE campaign_jobs SET status = ?, error = ?, finished_at = ?, payload = NULL WHERE campaign_id = ?',
+                     (status, error, datetime.now().isoformat(), campaign_id))
+
+
+def cancel_queued_job(campaign_id: int) -> bool:
+    conn = connect()
+    with conn:
+        cancelled = conn.execute("""UPDATE campaign_jobs SET status = 'cancelled', finished_at = ?, payload = NULL
+                                    WHERE campaign_id = ? AND status = 'queued'""",
+                                 (datetime.now().isoformat(), campaign_id)).rowcount
+    return bool(cancelled)
+
+
+def requeue_interrupted_jobs() -> int:
+    """Put jobs that were running when the process stopped back in the queue."""
+    conn = connect()
+    with conn:
+        return conn.execute("UPDATE campaign_jobs SET status = 'queued', started_at = NULL WHERE status = 'running'").rowcount
@@ -0,0 +1,211 @@
+import logging
+import os
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import event_bus
+import lead_store
+
+STREAM_QUEUE_SIZE = int(os.getenv('STREAM_QUEUE_SIZE', '50'))
+CRAWL_BATCH_SIZE = int(os.getenv('CRAWL_BATCH_SIZE', '10'))
+CRAWL_BATCHES_IN_FLIGHT = int(os.getenv('CRAWL_BATCHES_IN_FLIGHT', '2'))
+CRAWL_BATCH_WAIT = float(os.getenv('CRAWL_BATCH_WAIT', '2'))
+POLL_INTERVAL = 0.5
+
+_END = object()
+
+
+class StageQueue:
+    """Bounded hand-off between two pipeline stages.
+
+    The producer blocks in ``put`` while the queue is full, which is what keeps memory flat when a
+    later stage is slower. ``close`` marks the end of the stream; a consumer that stops early calls
+    ``abandon`` so producers stop instead of blocking forever, and anything still reading from the
+    queue sees the end of the stream. Setting ``stop`` (e.g. a campaign's cancel event) abandons the
+    queue the next time a reader polls it.
+    """
+
+    def __init__(self, maxsize: int = STREAM_QUEUE_SIZE, stop: Optional[threading.Event] = None):
+        self._queue = queue.Queue(maxsize)
+        self.abandoned = threading.Event()
+        self.stop = stop
+
+    def put(self, item) -> bool:
+        """Queue ``item``, waiting for room; False once the consumer has abandoned the queue."""
+        while not self.abandoned.is_set():
+            try:
+                self._queue.put(item, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def put_nowait(self, item) -> None:
+        if not self.abandoned.is_set():
+            self._queue.put_nowait(item)
+
+    def close(self) -> None:
+        self.put(_END)
+
+    def abandon(self) -> None:
+        self.abandoned.set()
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def _ended(self, stop: Optional[threading.Event]) -> bool:
+        if self.stop is not None and self.stop.is_set():
+            self.abandon()
+        return self.abandoned.is_set() or (stop is not None and stop.is_set())
+
+    def _get(self, timeout: Optional[float] = None, stop: Optional[threading.Event] = None):
+        """Next item, ``_END`` once the queue is abandoned (or ``stop`` is set), or raise ``queue.Empty`` on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._ended(stop):
+            wait_seconds = POLL_INTERVAL if deadline is None else min(POLL_INTERVAL, deadline - time.monotonic())
+            if wait_seconds <= 0:
+                raise queue.Empty
+            try:
+                return self._queue.get(timeout=wait_seconds)
+            except queue.Empty:
+                continue
+        return _END
+
+    def get_batch(self, size: int, wait_seconds: float,
+                  stop: Optional[threading.Event] = None) -> Tuple[List[Any], bool]:
+        """Wait for one item, then collect up to ``size`` for at most ``wait_seconds``; also says if the stream ended.
+
+        The stream counts as ended once the queue is abandoned or ``stop`` is set.
+        """
+        first = self._get(stop=stop)
+        if first is _END:
+            return [], True
+        items = [first]
+        deadline = time.monotonic() + wait_seconds
+        while len(items) < size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._get(timeout=remaining, stop=stop)
+            except queue.Empty:
+                break
+            if item is _END:
+                return items, True
+            items.append(item)
+        return items, False
+
+    def __iter__(self) -> Iterator[Any]:
+        while True:
+            item = self._get()
+            if item is _END:
+                return
+            yield item
+
+
+def start_stage(name: str, target: Callable, *args) -> threading.Thread:
+    thread = threading.Thread(target=target, args=args, name=name, daemon=True)
+    thread.start()
+    return thread
+
+
+def scrape_stage(queries: Iterable[Any], scrape: Callable[[Iterable[Any], Callable[[str], None]], Iterable[Dict[str, Any]]],
+                 outbox: StageQueue, campaign_id: Optional[int] = None,
+                 stored_leads: Iterable[Dict[str, Any]] = ()) -> None:
+    """Pass ``stored_leads`` on (sent ones included), then every business ``scrape`` finds that is new to the campaign.
+
+    ``scrape(queries, on_status)`` streams businesses for all queries (see ``ScraperRunner.iter_queries``)
+    and reports per-query progress through ``on_status``.
+    """
+    businesses = None
+    try:
+        # A campaign resumed after a restart picks up the leads it had already scraped first. Leads it
+        # already emailed are passed on too, so their replies are checked and followed up.
+        for lead in stored_leads:
+            if not outbox.put(lead):
+                return
+
+        businesses = scrape(queries, lambda message: event_bus.publish(campaign_id, 'log', message))
+        found = 0
+        for business in businesses:
+            lead = lead_store.add_lead(campaign_id, business)
+            if lead is None:
+                continue
+            found += 1
+            if not outbox.put(lead):
+                break
+        logging.info(f"Scraped {found} new businesses for campaign {campaign_id}")
+    except Exception as e:
+        logging.error(f"Scrape stage failed: {e}")
+        logging.error(traceback.format_exc())
+    finally:
+        if hasattr(businesses, 'close'):
+            businesses.close()
+        outbox.close()
+
+
+def crawl_stage(inbox: StageQueue, outbox: StageQueue, campaign_id: Optional[int] = None, worker=None,
+                batch_size: int = CRAWL_BATCH_SIZE, batches_in_flight: int = CRAWL_BATCHES_IN_FLIGHT,
+                max_ready: int = STREAM_QUEUE_SIZE) -> None:
+    """Look up emails for businesses in small batches on the crawl worker, streaming leads as they are found.
+
+    Leads arrive on the reactor thread, which must never block, so ``outbox`` is unbounded and this
+    stage holds back the next batch while ``max_ready`` leads are still waiting downstream.
+    """
+    if worker is None:
+        from crawl_worker import get_crawl_worker
+        worker = get_crawl_worker()
+
+    slots = threading.Semaphore(batches_in_flight)
+    crawls = []
+    stopped = outbox.abandoned
+    try:
+        while not stopped.is_set():
+            batch, ended = inbox.get_batch(batch_size, CRAWL_BATCH_WAIT, stop=stopped)
+            to_crawl = []
+            for lead in batch:
+                if lead.get('Email'):
+                    outbox.put_nowait(lead)
+                else:
+                    to_crawl.append(lead)
+
+            if to_crawl:
+                while outbox.qsize() >= max_ready and not stopped.is_set():
+                    time.sleep(POLL_INTERVAL)
+                while not slots.acquire(timeout=POLL_INTERVAL):
+                    if stopped.is_set():
+                        break
+                # The consumer may have stopped while this stage waited for room; start nothing more then
+                if stopped.is_set():
+                    break
+                crawl = worker.crawl(campaign_id, to_crawl, on_lead=outbox.put_nowait)
+                crawl.add_done_callback(lambda _: slots.release())
+                crawls.append(crawl)
+            if ended:
+                break
+        wait(crawls)
+    except Exception as e:
+        logging.error(f"Crawl stage failed: {e}")
+        logging.error(traceback.format_exc())
+    finally:
+        inbox.abandon()
+        outbox.close()
+
+
+def stream_leads(queries: Iterable[Any], scrape: Callable[[Iterable[Any], Callable[[str], None]], Iterable[Dict[str, Any]]],
+                 campaign_id: Optional[int] = None, stored_leads: Iterable[Dict[str, Any]] = (),
+                 queue_size: int = STREAM_QUEUE_SIZE, cancel_event: Optional[threading.Event] = None) -> StageQueue:
+    """Start the scrape and crawl stages; the returned queue yields leads with an email as soon as each is found.
+
+    Once ``cancel_event`` is set the stream ends within a poll interval, even while no lead is coming,
+    and both stages stop.
+    """
+    businesses = StageQueue(queue_size)
+    leads = StageQueue(0, stop=cancel_event)
+    start_stage('scrape-stage', scrape_stage, queries, scrape, businesses, campaign_id, stored_leads)
+    start_stage('crawl-stage', crawl_stage, businesses, leads, campaign_id)
+    return leads
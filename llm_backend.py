@@ -0,0 +1,212 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from typing import Optional
+
+from llm_cache import prompt_key
+
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'openai')  # openai, offline, record or replay
+LLM_OFFLINE_LATENCY = float(os.getenv('LLM_OFFLINE_LATENCY', '0'))
+LLM_OFFLINE_JITTER = float(os.getenv('LLM_OFFLINE_JITTER', '0'))
+LLM_RECORDING_PATH = os.getenv('LLM_RECORDING_PATH', 'data/llm_recordings.jsonl')
+
+
+class LLMBackend:
+    """Where every chat completion goes: ``complete`` for direct calls, ``chat_model`` for Crew runs.
+
+    ``name`` is part of the LLM cache identity of every backend except ``openai``, so canned or
+    replayed answers never end up served as real completions.
+    """
+
+    name = 'base'
+
+    def complete(self, system: str, prompt: str, model: str, temperature=None) -> str:
+        raise NotImplementedError
+
+    def chat_model(self, model: str, temperature=None):
+        """A LangChain chat model for CrewAI that answers through this backend."""
+        from langchain_core.language_models.chat_models import SimpleChatModel
+
+        backend = self
+
+        class BackendChatModel(SimpleChatModel):
+            model_name: str = model
+
+            @property
+            def _llm_type(self) -> str:
+                return f'{backend.name}-backend'
+
+            def _call(self, messages, stop=None, run_manager=None, **kwargs):
+                system = '\n'.join(str(message.content) for message in messages if message.type == 'system')
+                prompt = '\n'.join(str(message.content) for message in messages if message.type != 'system')
+                # CrewAI's executor keeps iterating until the model states a final answer
+                return f"Thought: I now know the final answer\nFinal Answer: {backend.complete(system, prompt, model, temperature)}"
+
+        return BackendChatModel()
+
+
+class OpenAIBackend(LLMBackend):
+    name = 'openai'
+
+    def __init__(self):
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def chat_model(self, model: str, temperature=None):
+        """The shared ``ChatOpenAI`` client for ``model``, created (and langchain_openai imported) on first use."""
+        key = (model, temperature)
+        with self._lock:
+            client = self._models.get(key)
+            if client is None:
+                if not os.getenv('OPENAI_API_KEY'):
+                    raise ValueError("OPENAI_API_KEY not found in environment variables")
+                from langchain_openai import ChatOpenAI
+
+                options = {} if temperature is None else {'temperature': temperature}
+                client = self._models[key] = ChatOpenAI(model=model, **options)
+            return client
+
+    def complete(self, system: str, prompt: str, model: str, temperature=None) -> str:
+        return self.chat_model(model, temperature).invoke([('system', system), ('human', prompt)]).content
+
+
+class OfflineBackend(LLMBackend):
+    """Deterministic stand-in that answers in the shape each prompt asks for, after a synthetic delay.
+
+    The same prompt always gets the same answer and the same delay (``latency`` plus up to
+    ``jitter`` seconds), so throughput runs are repeatable without network access or API spend.
+    """
+
+    name = 'offline'
+
+    def __init__(self, latency: float = LLM_OFFLINE_LATENCY, jitter: float = LLM_OFFLINE_JITTER):
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def complete(self, system: str, prompt: str, model: str, temperature=None) -> str:
+        seed = int(hashlib.sha256(f"{system}\0{prompt}".encode('utf-8')).hexdigest()[:16], 16)
+        rng = random.Random(seed)
+        with self._lock:
+            self.calls += 1
+        delay = self.latency + rng.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        return canned_response(prompt, rng)
+
+
+CLASSIFICATIONS = ['Interested', 'Need More Info', 'Not Interested', 'Wrong Person', 'Out of Office', 'Other']
+
+
+def canned_response(prompt: str, rng: random.Random) -> str:
+    """A made-up answer in the format ``prompt`` expects, chosen from ``rng``."""
+    if '"niche"' in prompt and '"zone"' in prompt:
+        niche = re.search(r'the niche: (.+?)\.', prompt)
+        location = re.search(r'divide the location: (.+?), into zones', prompt)
+        niche = niche.group(1) if niche else 'business'
+        location = location.group(1) if location else 'City'
+        return json.dumps([{'niche': niche, 'zone': f"Zone {index + 1}, {location}"} for index in range(15)])
+    if '### Reply' in prompt:
+        replies = len(re.findall(r'^\s*### Reply \d+', prompt, re.MULTILINE))
+        return json.dumps([{'id': index, 'classification': rng.choice(CLASSIFICATIONS),
+                            'explanation': 'Offline triage.',
+                            'last_positive_reply': rng.choice(['Sounds good, tell me more.', 'No positive reply found'])}
+                           for index in range(1, replies + 1)])
+    if 'Classification: [' in prompt:
+        return f"Classification: {rng.choice(CLASSIFICATIONS)}\nExplanation: Offline classification."
+    if 'Most recent positive reply:' in prompt:
+        return f"Most recent positive reply: {rng.choice(['Sounds good, tell me more.', 'No positive reply found'])}"
+    if 'follow-up email' in prompt:
+        return f"Subject: Following up #{rng.randint(1, 999)}\n\nHi,\n\nJust following up on my last note.\n\nBest"
+    if 'email' in prompt.lower() and 'ready to send' in prompt:
+        return f"Subject: Quick question #{rng.randint(1, 999)}\n\nHi,\n\nI had an idea for your business.\n\nBest"
+    if 'Unique Value Proposition' in prompt:
+        return ('1. We help local businesses book more appointments.\n2. - More bookings\n   - Less admin\n'
+                '3. Empty calendar slots.\n4. Reply to book a quick call.')
+    if 'Language of the website' in prompt:
+        return ('1. Family dental care.\n2. Local families.\n3. Opened a second clinic.\n'
+                '4. Filling weekday appointments.\n5. Language of the website: English')
+    return f"Offline response {rng.randint(0, 10 ** 6)}"
+
+
+class RecordReplayBackend(LLMBackend):
+    """Records another backend's answers to a JSON-lines file, or replays them without any network.
+
+    Entries are keyed like the LLM cache (model, temperature and normalized prompt). In ``replay``
+    mode a prompt that was never recorded raises ``KeyError``, so a changed prompt fails loudly
+    instead of silently reaching the API.
+    """
+
+    def __init__(self, mode: str, path: str = LLM_RECORDING_PATH, inner: Optional[LLMBackend] = None):
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"Unknown record/replay mode: {mode}")
+        self.mode = mode
+        self.name = mode
+        self.path = path
+        self.inner = inner
+        self._lock = threading.Lock()
+        self._recordings = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._recordings[entry['key']] = entry['response']
+        elif mode == 'replay':
+            raise FileNotFoundError(f"No LLM recordings at {path}")
+
+    def complete(self, system: str, prompt: str, model: str, temperature=None) -> str:
+        key = prompt_key(model, temperature, f"{system}\n{prompt}")
+        if self.mode == 'replay':
+            try:
+                return self._recordings[key]
+            except KeyError:
+                raise KeyError(f"No recorded response for {model} prompt {key[:12]}") from None
+
+        response = self.inner.complete(system, prompt, model, temperature)
+        with self._lock:
+            self._recordings[key] = response
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'key': key, 'model': model, 'response': response}) + '\n')
+        return response
+
+
+def create_backend(name: str = LLM_BACKEND) -> LLMBackend:
+    if name == 'openai':
+        return OpenAIBackend()
+    if name == 'offline':
+        return OfflineBackend()
+    if name == 'record':
+        return RecordReplayBackend('record', inner=OpenAIBackend())
+    if name == 'replay':
+        return RecordReplayBackend('replay')
+    raise ValueError(f"Unknown LLM_BACKEND: {name}")
+
+
+_default_backend = None
+_default_lock = threading.Lock()
+
+
+def get_llm_backend() -> LLMBackend:
+    global _default_backend
+    with _default_lock:
+        if _default_backend is None:
+            _default_backend = create_backend()
+            logging.info(f"Using the {_default_backend.name} LLM backend")
+        return _default_backend
+
+
+def set_llm_backend(backend: LLMBackend) -> None:
+    """Route every later LLM call through ``backend`` (benchmarks and load tests)."""
+    global _default_backend
+    with _default_lock:
+        _default_backend = backend
@@ -0,0 +1,137 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+DEFAULT_CACHE_PATH = os.getenv('LLM_CACHE_PATH', 'data/cache/llm_cache.sqlite3')
+DEFAULT_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '20000'))
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', '1').lower() not in ('0', 'false', 'no')
+
+
+def normalize_prompt(prompt: str) -> str:
+    # Prompts are built from indented triple-quoted strings, so whitespace differences carry no meaning.
+    return ' '.join(str(prompt).split())
+
+
+def prompt_key(model: str, temperature, prompt: str) -> str:
+    payload = f"{model}\0{temperature}\0{normalize_prompt(prompt)}"
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMCache:
+    """On-disk memo of LLM completions keyed on model, temperature and the normalized prompt.
+
+    The least recently used entries are evicted past ``max_entries``. Hit/miss counters, the
+    latency of the original calls that hits avoided, and a rough token estimate are kept per
+    process and reported by :meth:`stats`.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 enabled: bool = LLM_CACHE_ENABLED):
+        self.path = path
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.seconds_saved = 0.0
+        self.tokens_saved = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS completions (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                result TEXT NOT NULL,
+                elapsed REAL NOT NULL,
+                tokens INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )''')
+            conn.execute('CREATE INDEX IF NOT EXISTS completions_accessed_at ON completions (accessed_at)')
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> Optional[tuple]:
+        with self._connect() as conn:
+            row = conn.execute('SELECT result, elapsed, tokens FROM completions WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                conn.execute('UPDATE completions SET accessed_at = ? WHERE key = ?', (time.time(), key))
+        return row
+
+    def set(self, key: str, model: str, result: str, elapsed: float, tokens: int) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('''INSERT OR REPLACE INTO completions (key, model, result, elapsed, tokens, created_at, accessed_at)
+                            VALUES (?, ?, ?, ?, ?, ?, ?)''', (key, model, result, elapsed, tokens, now, now))
+            count = conn.execute('SELECT COUNT(*) FROM completions').fetchone()[0]
+            if count > self.max_entries:
+                conn.execute('''DELETE FROM completions WHERE key IN (
+                                    SELECT key FROM completions ORDER BY accessed_at LIMIT ?)''',
+                             (count - self.max_entries,))
+
+    def memoize(self, model: str, temperature, prompt: str, compute: Callable[[], object], cache: bool = True) -> str:
+        if not (cache and self.enabled):
+            with self._lock:
+                self.bypassed += 1
+            return str(compute())
+
+        key = prompt_key(model, temperature, prompt)
+        cached = self.get(key)
+        if cached is not None:
+            result, elapsed, tokens = cached
+            with self._lock:
+                self.hits += 1
+                self.seconds_saved += elapsed
+                self.tokens_saved += tokens
+            return result
+
+        start = time.perf_counter()
+        result = str(compute())
+        elapsed = time.perf_counter() - start
+        # ~4 characters per token is close enough to size the spend a hit avoids.
+        tokens = (len(normalize_prompt(prompt)) + len(result)) // 4
+        self.set(key, model, result, elapsed, tokens)
+        with self._lock:
+            self.misses += 1
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'bypassed': self.bypassed,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'seconds_saved': round(self.seconds_saved, 2),
+                'tokens_saved': self.tokens_saved,
+            }
+
+    def log_stats(self) -> None:
+        logging.info(f"LLM cache stats: {self.stats()}")
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMCache:
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = LLMCache()
+        return _default_cache
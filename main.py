@@ -1,24 +1,23 @@
-import subprocess
 import json
 import os
-import smtplib
-import csv
-import threading
-import time
-from datetime import datetime
-import pandas as pd
+from concurrent.futures import Future
+from dotenv import load_dotenv
 from flask import Flask, request, jsonify, Response, send_from_directory, render_template, stream_with_context
-from crewai_needs import queries_leads
-from email_automation import run_email_automation
 from utils import setup_logging
-from scrapy.crawler import CrawlerProcess
-from scrapy.utils.project import get_project_settings
-from email_spider import EmailSpider
+from llm_cache import get_llm_cache
+from page_digest import get_digest_cache
+import lead_store
+import event_bus
+from campaign_scheduler import CampaignScheduler
+from send_scheduler import gather
+from lead_stream import stream_leads
+from scraper_runner import get_scraper_runner
+from smtp_pool import get_smtp_pool
 import logging
-from scrapy.utils.log import configure_logging
 
-# Configure logging for both Flask and Scrapy
-configure_logging()
+# The LLM (crewai, langchain), crawler (scrapy, twisted) and email automation modules are imported
+# where they are first used, so the API starts and forks without loading them.
+load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 app = Flask(__name__, template_folder='landing_page', static_folder='landing_page')
@@ -31,102 +30,40 @@ def index():
 def logs():
     return render_template('logs.html')
 
-def run_js_scraper(query):
-    query_json = json.dumps([query])
-    escaped_query_json = query_json.replace('"', '\\"')
-    js_command = f'node src/lead_scraper/scrape.js "{escaped_query_json}"'
-    logging.info(f"Running command: {js_command}")
-    process = subprocess.Popen(js_command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
-                               bufsize=1, universal_newlines=True)
-
-    while True:
-        output = process.stdout.readline()
-        if output == '' and process.poll() is not None:
-            break
-        if output:
-            logging.info(output.strip())
-
-    rc = process.poll()
-    if rc != 0:
-        error = process.stderr.read()
-        logging.error(f"Error running JS scraper: {error}")
-        raise subprocess.CalledProcessError(rc, js_command)
-
-    return process
-
-def run_email_scraper():
-    try:
-        process = CrawlerProcess(get_project_settings())
-        process.crawl(EmailSpider)
-        process.start()
-        logging.info("Email scraper finished running")
-    except Exception as e:
-        logging.error(f"Error running email scraper: {str(e)}")
-
 def setup_smtp(gmail, app_password):
     smtp_server = "smtp.gmail.com"
     port = 587  # For starttls
-    smtp_connection = smtplib.SMTP(smtp_server, port)
-    smtp_connection.starttls()
-    smtp_connection.login(gmail, app_password)
+    # Pooled per account: campaigns for the same sender share sessions that are NOOP-checked and re-opened when dropped
+    smtp_connection = get_smtp_pool(gmail, app_password, host=smtp_server, port=port)
+    smtp_connection.warm()
     return smtp_connection
 
 def register_user(niche, location, website, name, offer, gmail):
-    user_data = {
-        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        'niche': niche,
-        'location': location,
-        'website': website,
-        'name': name,
-        'offer': offer,
-        'gmail': gmail
-    }
-
-    csv_file_path = 'data/registered_users.csv'
-    file_exists = os.path.isfile(csv_file_path)
-
-    with open(csv_file_path, 'a', newline='') as csvfile:
-        fieldnames = ['timestamp', 'niche', 'location', 'website', 'name', 'offer', 'gmail']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-        if not file_exists:
-            writer.writeheader()
-
-        writer.writerow(user_data)
+    lead_store.register_user(niche, location, website, name, offer, gmail)
     logging.info(f"New user registered: {name}")
 
-def process_rows(user_site, user_name, custom_offer, smtp_connection, gmail, app_password):
-    if not os.path.exists('src/lead_scraper/business_leads_with_emails.csv'):
-        logging.warning("business_leads_with_emails.csv not found.")
-        return
+def main(niche, location, user_site, user_name, custom_offer, gmail, app_password, callback, campaign_id=None,
+         cancel_event=None):
+    from crewai_needs import queries_leads
+    from email_automation import run_email_automation
 
-    try:
-        with open('src/lead_scraper/business_leads_with_emails.csv', 'r') as csvfile:
-            reader = csv.DictReader(csvfile)
-            rows = list(reader)
-            run_email_automation(user_site, user_name, custom_offer, smtp_connection, gmail, app_password, rows)
-    except Exception as e:
-        logging.error(f"Error processing rows: {str(e)}")
-
-def main(niche, location, user_site, user_name, custom_offer, gmail, app_password, callback):
     setup_logging()
     smtp_connection = setup_smtp(gmail, app_password)
-    # queries = queries_leads(niche, location)
-    queries = 'ghhghghg'
-
-    for query in queries:
-        logging.info(f"Processing query: {query}")
-        # run_js_scraper(query)
-
-        if not os.path.exists('src/lead_scraper/business_leads.csv'):
-            logging.warning("The business_leads.csv file was not created.")
-            continue
-
-        # run_email_scraper()
-        process_rows(user_site, user_name, custom_offer, smtp_connection, gmail, app_password)
-        logging.info(f"Completed processing for query: {query}")
-        if callback:
-            callback(f"Completed processing for query: {query}")
+    if campaign_id is None:
+        campaign_id = lead_store.create_campaign(gmail, niche, location)
+    queries = queries_leads(niche, location)
+
+    # Scraping, email lookup, personalization and sending run as stages joined by bounded queues, so each
+    # lead is emailed as soon as its address is found instead of after the whole crawl
+    leads = stream_leads(queries, get_scraper_runner().iter_queries, campaign_id,
+                         stored_leads=lead_store.get_leads(campaign_id), cancel_event=cancel_event)
+    try:
+        sends = run_email_automation(user_site, user_name, custom_offer, smtp_connection, gmail, app_password, leads,
+                                     callback=callback, campaign_id=campaign_id, cancel_event=cancel_event)
+    except Exception:
+        leads.abandon()
+        raise
+    return gather([sends])
 
 @app.route('/api/start-campaign', methods=['POST'])
 def start_campaign():
@@ -147,11 +84,14 @@ def start_campaign():
             )
             yield f"data: {json.dumps({'type': 'log', 'message': 'User registered'})}\n\n"
 
-            # Start the campaign process in a background thread
-            thread = threading.Thread(target=run_campaign, args=(data,))
-            thread.start()
+            campaign_id = lead_store.create_campaign(data['gmail'], data['niche'], data['location'])
+            event_bus.publish(campaign_id, 'status', 'Campaign queued')
+
+            # Campaigns run on the scheduler's worker pool; this request only queues the job
+            campaign_scheduler.submit(campaign_id, data['gmail'], data)
 
-            yield f"data: {json.dumps({'type': 'status', 'message': 'Campaign processing'})}\n\n"
+            yield f"data: {json.dumps({'type': 'campaign', 'campaign_id': campaign_id})}\n\n"
+            yield f"data: {json.dumps({'type': 'status', 'message': 'Campaign queued'})}\n\n"
         except Exception as e:
             yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
 
@@ -159,24 +99,65 @@ def start_campaign():
 
 @app.route('/api/campaign-status')
 def campaign_status():
+    bus = event_bus.get_event_bus()
+    campaign_id = request.args.get('campaign_id')
+    if campaign_id is not None:
+        # Only real campaigns get a channel, so made-up ids cannot push them out of the bus's history
+        if not campaign_id.isdigit() or not lead_store.campaign_exists(int(campaign_id)):
+            return jsonify({'error': 'Unknown campaign'}), 404
+    else:
+        campaign_id = bus.latest_campaign_id()
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0
+    try:
+        last_event_id = int(last_event_id)
+    except ValueError:
+        last_event_id = 0
+
     def generate():
-        while True:
-            # Check campaign status and yield updates
-            # This is a placeholder - you'll need to implement actual status checking
-            yield f"data: {json.dumps({'type': 'log', 'message': 'Campaign is running...'})}\n\n"
-            time.sleep(5)  # Send an update every 5 seconds
+        if campaign_id is None:
+            yield f"data: {json.dumps({'type': 'log', 'message': 'No campaign is running', 'finished': True})}\n\n"
+            return
+        finished = False
+        for event in bus.subscribe(campaign_id, last_event_id):
+            if event is None:
+                yield ": keepalive\n\n"
+                continue
+            # 'finished' marks the last event of the campaign, so the client closes instead of reconnecting
+            finished = event['finished']
+            payload = {'type': event['type'], 'message': event['message'], 'finished': finished}
+            yield f"id: {event['id']}\ndata: {json.dumps(payload)}\n\n"
+        if not finished:
+            # A client reconnecting after the last event still needs to be told to stop
+            yield f"data: {json.dumps({'type': 'end', 'message': None, 'finished': True})}\n\n"
 
     return Response(stream_with_context(generate()), mimetype='text/event-stream')
 
 
-def run_campaign(data):
+def run_campaign(data, campaign_id=None, cancel_event=None):
+    """Queue the campaign's sends; the returned future completes once they and the follow-ups are out."""
+    done = Future()
+    done.set_running_or_notify_cancel()
+
+    def finished(future):
+        errors = [query.exception() for query in future.result()
+                  if not query.cancelled() and query.exception() is not None]
+        if errors:
+            logging.error(f"Campaign error: {str(errors[0])}")
+            event_bus.publish(campaign_id, 'error', str(errors[0]), finished=True)
+            done.set_exception(errors[0])
+            return
+        if cancel_event is not None and cancel_event.is_set():
+            event_bus.publish(campaign_id, 'status', 'Campaign cancelled', finished=True)
+        else:
+            event_bus.publish(campaign_id, 'status', 'Campaign finished', finished=True)
+        done.set_result(None)
+
     try:
+        # Sends, failures and CRM snapshots are published on the event bus by run_email_automation itself
         def callback(message):
-            # You might want to implement a way to send these messages to the client
-            # For now, we'll just log them
             logging.info(f"Campaign update: {message}")
 
-        main(
+        pending = main(
             niche=data['niche'],
             location=data['location'],
             user_site=data['website'],
@@ -184,14 +165,67 @@ def run_campaign(data):
             custom_offer=data['offer'],
             gmail=data['gmail'],
             app_password=data['appPassword'],
-            callback=callback
+            callback=callback,
+            campaign_id=campaign_id,
+            cancel_event=cancel_event
         )
+        pending.add_done_callback(finished)
+        return done
     except Exception as e:
         logging.error(f"Campaign error: {str(e)}")
+        event_bus.publish(campaign_id, 'error', str(e), finished=True)
+        raise
+
+# The app password stays in memory; campaigns resumed after a restart need it again through /api/resume-campaign
+campaign_scheduler = CampaignScheduler(run_campaign, secret_fields=('appPassword',))
+
+@app.route('/api/campaign-job')
+def campaign_job():
+    job = campaign_scheduler.status(request.args.get('campaign_id', type=int))
+    if job is None:
+        return jsonify({'error': 'Unknown campaign'}), 404
+    return jsonify(job)
+
+@app.route('/api/cancel-campaign', methods=['POST'])
+def cancel_campaign():
+    campaign_id = (request.get_json(silent=True) or {}).get('campaign_id')
+    if campaign_id is None:
+        return jsonify({'error': 'campaign_id is required'}), 400
+    if not str(campaign_id).isdigit():
+        return jsonify({'error': 'campaign_id must be a number'}), 400
+    campaign_id = int(campaign_id)
+    if not campaign_scheduler.cancel(campaign_id):
+        return jsonify({'error': 'Campaign is not queued or running'}), 409
+    event_bus.publish(campaign_id, 'status', 'Cancelling campaign')
+    return jsonify(campaign_scheduler.status(campaign_id))
+
+@app.route('/api/resume-campaign', methods=['POST'])
+def resume_campaign():
+    data = request.get_json(silent=True) or {}
+    campaign_id = data.get('campaign_id')
+    if campaign_id is None or not str(campaign_id).isdigit():
+        return jsonify({'error': 'campaign_id must be a number'}), 400
+    if not data.get('appPassword'):
+        return jsonify({'error': 'appPassword is required'}), 400
+    campaign_id = int(campaign_id)
+    if not campaign_scheduler.resume(campaign_id, data):
+        return jsonify({'error': 'Campaign is not queued'}), 409
+    event_bus.publish(campaign_id, 'status', 'Campaign resumed')
+    return jsonify(campaign_scheduler.status(campaign_id))
+
+@app.route('/api/llm-cache-stats')
+def llm_cache_stats():
+    return jsonify(get_llm_cache().stats())
+
+@app.route('/api/digest-stats')
+def digest_stats():
+    return jsonify(get_digest_cache().stats())
 
 @app.route('/<path:path>')
 def send_js(path):
     return send_from_directory('landing_page', path)
 
 if __name__ == "__main__":
+    # Start the workers up front so campaigns queued before a restart resume without waiting for a POST
+    campaign_scheduler.start()
     app.run(debug=False, host='0.0.0.0', port=int(os.environ.get('PORT', 8080)))
\ No newline at end of file
@@ -0,0 +1,190 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+import requests
+
+DEFAULT_CACHE_DIR = os.getenv('PAGE_CACHE_DIR', 'data/cache/pages')
+DEFAULT_TTL = int(os.getenv('PAGE_CACHE_TTL', str(7 * 24 * 60 * 60)))
+DEFAULT_MAX_BYTES = int(os.getenv('PAGE_CACHE_MAX_MB', '256')) * 1024 * 1024
+
+
+class PageCache:
+    """Disk-backed page cache shared by the spider and the personalization scraper.
+
+    Bodies are stored once per content hash under ``blobs/``; a small SQLite index maps each URL
+    to its blob together with the validators (ETag / Last-Modified) needed for cheap revalidation.
+    Entries older than ``ttl`` are revalidated with a conditional GET, and the least recently used
+    URLs are evicted once the stored bodies exceed ``max_bytes``.
+    """
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, ttl: int = DEFAULT_TTL, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(directory, 'blobs'), exist_ok=True)
+        self._index_path = os.path.join(directory, 'index.sqlite3')
+        with self._connect() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )''')
+            conn.execute('CREATE INDEX IF NOT EXISTS pages_accessed_at ON pages (accessed_at)')
+            conn.execute('CREATE INDEX IF NOT EXISTS pages_digest ON pages (digest)')
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self._index_path, timeout=30)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.directory, 'blobs', digest[:2], digest)
+
+    def _read_blob(self, digest: str) -> Optional[bytes]:
+        try:
+            with open(self._blob_path(digest), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _lookup(self, url: str):
+        with self._connect() as conn:
+            return conn.execute('SELECT digest, etag, last_modified, fetched_at FROM pages WHERE url = ?',
+                                (url,)).fetchone()
+
+    def get(self, url: str, allow_stale: bool = False) -> Optional[bytes]:
+        entry = self._lookup(url)
+        if entry is None:
+            return None
+        digest, _, _, fetched_at = entry
+        if not allow_stale and time.time() - fetched_at > self.ttl:
+            return None
+        content = self._read_blob(digest)
+        if content is not None:
+            self._touch(url)
+        return content
+
+    def _touch(self, url: str, revalidated: bool = False) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            if revalidated:
+                conn.execute('UPDATE pages SET accessed_at = ?, fetched_at = ? WHERE url = ?', (now, now, url))
+            else:
+                conn.execute('UPDATE pages SET accessed_at = ? WHERE url = ?', (now, url))
+
+    def store(self, url: str, content: bytes, etag: Optional[str] = None, last_modified: Optional[str] = None) -> str:
+        digest = hashlib.sha256(content).hexdigest()
+        path = self._blob_path(digest)
+        with self._lock:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(content)
+                os.replace(tmp_path, path)
+
+            now = time.time()
+            with self._connect() as conn:
+                previous = conn.execute('SELECT digest FROM pages WHERE url = ?', (url,)).fetchone()
+                conn.execute('''INSERT OR REPLACE INTO pages (url, digest, size, etag, last_modified, fetched_at, accessed_at)
+                                VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                             (url, digest, len(content), etag, last_modified, now, now))
+                if previous and previous[0] != digest:
+                    self._drop_blob_if_unreferenced(conn, previous[0])
+                self._evict(conn)
+        return digest
+
+    def _drop_blob_if_unreferenced(self, conn, digest: str) -> None:
+        if conn.execute('SELECT 1 FROM pages WHERE digest = ? LIMIT 1', (digest,)).fetchone() is None:
+            try:
+                os.remove(self._blob_path(digest))
+            except OSError:
+                pass
+
+    def _evict(self, conn) -> None:
+        # Blobs are shared between URLs, so the size budget is measured over distinct digests.
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT digest, size FROM pages)').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for url, digest, size in conn.execute('SELECT url, digest, size FROM pages ORDER BY accessed_at').fetchall():
+            conn.execute('DELETE FROM pages WHERE url = ?', (url,))
+            if conn.execute('SELECT 1 FROM pages WHERE digest = ? LIMIT 1', (digest,)).fetchone() is None:
+                total -= size
+                self._drop_blob_if_unreferenced(conn, digest)
+            if total <= self.max_bytes:
+                break
+
+    @staticmethod
+    def _read_body(response, max_bytes: Optional[int]) -> bytes:
+        if max_bytes is None:
+            return response.content
+        chunks, size = [], 0
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= max_bytes:
+                # Everything past the cap is dropped without being downloaded
+                break
+        response.close()
+        return b''.join(chunks)[:max_bytes]
+
+    def fetch(self, url: str, headers: Optional[dict] = None, timeout: int = 10, max_bytes: Optional[int] = None) -> bytes:
+        """Return the body of ``url``; with ``max_bytes`` the response is streamed and cut off at that size."""
+        entry = self._lookup(url)
+        request_headers = dict(headers or {})
+        if entry is not None:
+            digest, etag, last_modified, fetched_at = entry
+            cached = self._read_blob(digest)
+            if cached is not None:
+                if time.time() - fetched_at <= self.ttl:
+                    self._touch(url)
+                    return cached
+                if etag:
+                    request_headers['If-None-Match'] = etag
+                if last_modified:
+                    request_headers['If-Modified-Since'] = last_modified
+        else:
+            cached = None
+
+        try:
+            response = requests.get(url, headers=request_headers, timeout=timeout, stream=max_bytes is not None)
+            if response.status_code == 304 and cached is not None:
+                self._touch(url, revalidated=True)
+                return cached
+            response.raise_for_status()
+            content = self._read_body(response, max_bytes)
+        except requests.RequestException:
+            if cached is not None:
+                logging.warning(f"Revalidation of {url} failed, serving stale cached copy")
+                return cached
+            raise
+
+        self.store(url, content, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return content
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_page_cache() -> PageCache:
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = PageCache()
+        return _default_cache
@@ -0,0 +1,248 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from html_text import DEFAULT_MAX_WORDS, extract_blocks
+
+DIGEST_TOKEN_BUDGET = int(os.getenv('DIGEST_TOKEN_BUDGET', '600'))
+DIGEST_CACHE_PATH = os.getenv('DIGEST_CACHE_PATH', 'data/cache/digests.sqlite3')
+DIGEST_CACHE_TTL = int(os.getenv('DIGEST_CACHE_TTL', str(7 * 24 * 60 * 60)))
+DIGEST_MODEL = os.getenv('DIGEST_MODEL', 'gpt-4o-mini')
+
+HEADING_TAGS = frozenset({'title', 'h1', 'h2', 'h3', 'h4'})
+KEEP_SHORT_TAGS = HEADING_TAGS | {'li', 'dt', 'td', 'th'}
+
+# Section headings are matched in English and Spanish, the languages campaigns mostly target.
+SECTION_PATTERNS = [
+    ('services', re.compile(r'service|treatment|what we (do|offer)|solution|product|speciali[sz]|pricing|'
+                            r'servicio|tratamiento|especialidad|producto|precio', re.IGNORECASE)),
+    ('about', re.compile(r'about|who we are|our (story|team|mission)|history|philosophy|why (us|choose)|'
+                         r'sobre|nosotros|qui[eé]nes somos|equipo|historia|misi[oó]n', re.IGNORECASE)),
+    ('news', re.compile(r'news|blog|latest|award|press|event|update|testimonial|review|'
+                        r'noticia|novedad|premio|evento|opini[oó]n|rese[ñn]a', re.IGNORECASE)),
+]
+SECTION_PRIORITY = {'hero': 0, 'services': 1, 'about': 2, 'news': 3, 'other': 4}
+
+
+@lru_cache(maxsize=None)
+def get_token_counter(model: str = DIGEST_MODEL) -> Callable[[str], int]:
+    """Exact token counts through tiktoken, or ~4 characters per token when its encodings are unavailable."""
+    try:
+        import tiktoken
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding('cl100k_base')
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    except Exception as e:
+        # tiktoken downloads its encodings on first use, which fails on offline hosts
+        logging.warning(f"tiktoken unavailable ({type(e).__name__}); estimating prompt tokens")
+        return estimate_tokens
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+
+def site_domain(url: str) -> str:
+    netloc = urlsplit(url if '//' in url else f'//{url}').netloc.lower()
+    netloc = netloc.rsplit('@', 1)[-1].split(':', 1)[0]
+    return netloc[4:] if netloc.startswith('www.') else netloc
+
+
+def block_key(text: str) -> str:
+    # Digits are ignored so templated cards ("voted best of 2019", "... of 2021") count as repeats
+    return ' '.join(re.findall(r'[^\W\d_]+', text.lower()))
+
+
+def section_kind(heading: str) -> str:
+    for kind, pattern in SECTION_PATTERNS:
+        if pattern.search(heading):
+            return kind
+    return 'other'
+
+
+def split_sections(blocks: List[Tuple[str, str]]) -> List[Dict]:
+    """Group blocks under their nearest heading, dropping repeated and near-empty blocks.
+
+    Everything before the first ``h2`` (the title, the hero heading and its tagline) is the hero.
+    """
+    sections = [{'kind': 'hero', 'heading': '', 'texts': [], 'position': 0}]
+    seen = set()
+    for tag, text in blocks:
+        key = block_key(text)
+        if not key or key in seen:
+            continue
+        if len(key.split()) < 3 and tag not in KEEP_SHORT_TAGS:
+            # Buttons, labels and stray link text left over once navigation is gone
+            continue
+        seen.add(key)
+        if tag in ('h2', 'h3', 'h4'):
+            sections.append({'kind': section_kind(text), 'heading': text, 'texts': [], 'position': len(sections)})
+            continue
+        sections[-1]['texts'].append(text)
+    return [section for section in sections if section['texts']]
+
+
+def fit_to_budget(text: str, budget: int, count_tokens: Callable[[str], int]) -> str:
+    if budget <= 0:
+        return ''
+    if count_tokens(text) <= budget:
+        return text
+    words = text.split()
+    low, high = 0, len(words)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(' '.join(words[:middle])) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return ' '.join(words[:low])
+
+
+def compact_blocks(blocks: List[Tuple[str, str]], token_budget: int = DIGEST_TOKEN_BUDGET,
+                   count_tokens: Optional[Callable[[str], int]] = None) -> str:
+    """Rank page sections (hero, services, about, news, then the rest) and keep what fits in ``token_budget``.
+
+    Sections are written in rank order under their heading, so the model sees the most telling
+    parts of the site first and the budget is never spent on repeated boilerplate.
+    """
+    count_tokens = count_tokens or get_token_counter()
+    ranked = sorted(split_sections(blocks), key=lambda s: (SECTION_PRIORITY[s['kind']], s['position']))
+    picked = [[] for _ in ranked]
+    remaining = token_budget
+    depth = 0
+    # Blocks are taken a round at a time across sections, so every section gets its lead text
+    # before any of them gets a second block.
+    while remaining > 0 and any(depth < len(section['texts']) for section in ranked):
+        for lines, section in zip(picked, ranked):
+            if depth >= len(section['texts']):
+                continue
+            text = section['texts'][depth]
+            if depth == 0 and section['heading']:
+                text = f"{section['heading']}: {text}"
+            cost = count_tokens(text) + 1
+            if cost > remaining:
+                text = fit_to_budget(text, remaining - 1, count_tokens)
+                if text:
+                    lines.append(text)
+                remaining = 0
+                break
+            lines.append(text)
+            remaining -= cost
+        depth += 1
+    return '\n'.join(line for lines in picked for line in lines)
+
+
+class DigestCache:
+    """Compacted website text, one digest per domain and token budget, kept on disk for ``ttl`` seconds.
+
+    Follow-ups and later campaigns for the same business reuse the digest instead of parsing the
+    page again, and the identical digest lets the LLM cache answer their prompts. Token counts of
+    the raw page text and of the digest are tracked to report how much prompt input was saved.
+    """
+
+    def __init__(self, path: str = DIGEST_CACHE_PATH, ttl: int = DIGEST_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.source_tokens = 0
+        self.digest_tokens = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS digests (
+                domain TEXT NOT NULL,
+                budget INTEGER NOT NULL,
+                digest TEXT NOT NULL,
+                source_tokens INTEGER NOT NULL,
+                tokens INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (domain, budget)
+            )''')
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get(self, domain: str, budget: int) -> Optional[tuple]:
+        with self._connect() as conn:
+            return conn.execute('SELECT digest, source_tokens, tokens FROM digests WHERE domain = ? AND budget = ? '
+                                'AND created_at > ?', (domain, budget, time.time() - self.ttl)).fetchone()
+
+    def set(self, domain: str, budget: int, digest: str, source_tokens: int, tokens: int) -> None:
+        with self._connect() as conn:
+            conn.execute('''INSERT OR REPLACE INTO digests (domain, budget, digest, source_tokens, tokens, created_at)
+                            VALUES (?, ?, ?, ?, ?, ?)''', (domain, budget, digest, source_tokens, tokens, time.time()))
+
+    def _count(self, source_tokens: int, tokens: int, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self.source_tokens += source_tokens
+            self.digest_tokens += tokens
+
+    def digest(self, url: str, fetch: Callable[[], bytes], token_budget: int = DIGEST_TOKEN_BUDGET) -> str:
+        """The digest for ``url``'s domain, calling ``fetch`` for the page only when none is cached."""
+        domain = site_domain(url)
+        cached = self.get(domain, token_budget)
+        if cached is not None:
+            digest, source_tokens, tokens = cached
+            self._count(source_tokens, tokens, hit=True)
+            return digest
+
+        content = fetch()
+        if not content:
+            return ''
+        count_tokens = get_token_counter()
+        blocks = extract_blocks(content, DEFAULT_MAX_WORDS)
+        source_tokens = count_tokens(' '.join(' '.join(text for _, text in blocks).split()[:DEFAULT_MAX_WORDS]))
+        digest = compact_blocks(blocks, token_budget, count_tokens)
+        tokens = count_tokens(digest)
+        if digest:
+            self.set(domain, token_budget, digest, source_tokens, tokens)
+        self._count(source_tokens, tokens, hit=False)
+        return digest
+
+    def stats(self) -> dict:
+        with self._lock:
+            pages = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'avg_tokens_before': round(self.source_tokens / pages) if pages else 0,
+                'avg_tokens_after': round(self.digest_tokens / pages) if pages else 0,
+                'tokens_saved': self.source_tokens - self.digest_tokens,
+            }
+
+    def log_stats(self) -> None:
+        logging.info(f"Website digest stats: {self.stats()}")
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_digest_cache() -> DigestCache:
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = DigestCache()
+        return _default_cache
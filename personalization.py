@@ -1,42 +1,53 @@
 import os
-import requests
-from bs4 import BeautifulSoup
-from langchain_openai import ChatOpenAI
-from crewai import Agent, Task, Crew
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 import logging
+from page_cache import get_page_cache
+from page_digest import DIGEST_TOKEN_BUDGET, get_digest_cache
+import agent_runner
+from agent_runner import run_task
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 load_dotenv()
 
-openai_api_key = os.getenv("OPENAI_API_KEY")
-if not openai_api_key:
-    raise ValueError("OPENAI_API_KEY not found in environment variables")
+LLM_MODEL = 'gpt-4o-mini'
+LLM_TEMPERATURE = 0.7
+SCRAPE_MAX_BYTES = int(os.getenv('SCRAPE_MAX_BYTES', str(1024 * 1024)))
+REPLY_TRIAGE_MODE = os.getenv('REPLY_TRIAGE_MODE', 'batch')  # 'batch' or 'parallel'
+REPLY_TRIAGE_BATCH_SIZE = int(os.getenv('REPLY_TRIAGE_BATCH_SIZE', '10'))
+REPLY_TRIAGE_CONCURRENCY = int(os.getenv('REPLY_TRIAGE_CONCURRENCY', '4'))
 
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.7)
+REPLY_CLASSIFICATIONS = ['Interested', 'Need More Info', 'Not Interested', 'Wrong Person', 'Out of Office', 'Other']
+NO_POSITIVE_REPLY = 'No positive reply found'
 
-def scrape_website(url):
+def fetch_page(url):
     try:
         headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-        text_content = ' '.join([tag.get_text(strip=True) for tag in soup.find_all(['p', 'h1', 'h2', 'h3', 'li', 'span', 'div']) if tag.name not in ['script', 'style']])
-        return ' '.join(text_content.split()[:2000])  # Adjusted to 2000 words
+        return get_page_cache().fetch(url, headers=headers, timeout=10, max_bytes=SCRAPE_MAX_BYTES)
     except Exception as e:
         logging.error(f"Error scraping {url}: {str(e)}")
+        return b""
+
+def website_digest(url, token_budget=DIGEST_TOKEN_BUDGET):
+    # Ranked, deduplicated page sections cut to token_budget, cached per domain so follow-ups reuse it
+    try:
+        return get_digest_cache().digest(url, lambda: fetch_page(url), token_budget)
+    except Exception as e:
+        logging.error(f"Error compacting {url}: {str(e)}")
         return ""
 
 def create_agent(role, goal, backstory):
-    return Agent(role=role, goal=goal, backstory=backstory, tools=[], verbose=True, llm=llm)
+    return agent_runner.create_agent(role, goal, backstory, LLM_MODEL, LLM_TEMPERATURE)
 
-def generate_personalized_content(website_content, query, expected_output, agent, custom_offer):
-    task = Task(description=f"Analyze the following website content and {query}:\n\n{website_content}. {custom_offer}", agent=agent, expected_output=expected_output)
-    crew = Crew(agents=[agent], tasks=[task], verbose=True)
-    return crew.kickoff()
+def generate_personalized_content(website_content, query, expected_output, agent, custom_offer, cache=True):
+    description = f"Analyze the following website content and {query}:\n\n{website_content}. {custom_offer}"
+    return run_task(agent, description, expected_output, cache=cache)
 
 def personalize_user_offer(user_site, custom_offer):
-    user_content = scrape_website(user_site)
+    user_content = website_digest(user_site)
     if not user_content:
         return "Unable to generate a personalized offer due to website scraping issues."
 
@@ -59,7 +70,7 @@ def personalize_user_offer(user_site, custom_offer):
     return offer
 
 def personalize_prospect_email(lead_site, custom_offer):
-    prospect_content = scrape_website(lead_site)
+    prospect_content = website_digest(lead_site)
     if not prospect_content:
         return "Unable to personalize the email due to website scraping issues."
 
@@ -82,14 +93,15 @@ def personalize_prospect_email(lead_site, custom_offer):
     return email_content
 
 
-def classify_email(email_content):
+def classify_email(email_content, cache=True):
     email_classifier = create_agent(
         role='Email Intent Classifier',
         goal='Accurately classify incoming emails based on their content and intent.',
         backstory='You are an AI expert in understanding email communications and their underlying intents.'
     )
 
-    task = Task(
+    return run_task(
+        email_classifier,
         description=f'''Classify the following email based on its content and intent. Provide a classification and a brief explanation.
 
         Email Content:
@@ -107,22 +119,21 @@ def classify_email(email_content):
         - Provide a single classification that best fits the email
         - Give a brief explanation (1-2 sentences) for your classification
         ''',
-        agent=email_classifier,
         expected_output='''Classification: [One of the above categories]
-        Explanation: [Brief explanation for the classification]'''
+        Explanation: [Brief explanation for the classification]''',
+        cache=cache
     )
-    crew = Crew(agents=[email_classifier], tasks=[task], verbose=True)
-    return crew.kickoff()
 
 
-def get_last_positive_reply(previous_emails):
+def get_last_positive_reply(previous_emails, cache=True):
     email_classifier = create_agent(
         role='Email Classifier',
         goal='Identify the most recent positive reply from the prospect.',
         backstory='You are an expert in analyzing email sentiment and identifying positive responses.'
     )
 
-    task = Task(
+    return run_task(
+        email_classifier,
         description=f'''Analyze the following email thread and identify the most recent positive reply from the prospect. A positive reply shows interest, asks for more information, or expresses willingness to engage further.
 
         Email Thread:
@@ -134,14 +145,13 @@ def get_last_positive_reply(previous_emails):
         - If there are multiple positive replies, choose the most recent one
         - If there are no positive replies, return "No positive reply found"
         ''',
-        agent=email_classifier,
-        expected_output='''Most recent positive reply: [Content of the positive reply or "No positive reply found"]'''
+        expected_output='''Most recent positive reply: [Content of the positive reply or "No positive reply found"]''',
+        cache=cache
     )
-    crew = Crew(agents=[email_classifier], tasks=[task], verbose=True)
-    return crew.kickoff()
 
 
-def craft_email(user_offer, prospect_personalization, user_name, user_web, prospect_name, last_positive_reply=None):
+def craft_email(user_offer, prospect_personalization, user_name, user_web, prospect_name, last_positive_reply=None,
+                cache=True):
     if len(prospect_name) < 3:
         prospect_name = 'use business name'
     email_crafter = create_agent(
@@ -174,17 +184,16 @@ def craft_email(user_offer, prospect_personalization, user_name, user_web, prosp
 
         Use this positive reply as inspiration for the tone and content of your email. Identify what worked well in this reply and incorporate similar elements into your new email.'''
 
-    task = Task(
+    return run_task(
+        email_crafter,
         description=task_description,
-        agent=email_crafter,
-        expected_output='''Complete email ready to send written with no placeholder text or anything below or after.'''
+        expected_output='''Complete email ready to send written with no placeholder text or anything below or after.''',
+        cache=cache
     )
-    crew = Crew(agents=[email_crafter], tasks=[task], verbose=True)
-    return crew.kickoff()
 
 
 def craft_follow_up_email(user_offer, prospect_personalization, user_name, user_web, prospect_name, previous_emails,
-                          email_classification, last_positive_reply=None):
+                          email_classification, last_positive_reply=None, cache=True):
     follow_up_crafter = create_agent(
         role='Follow-up Email Specialist',
         goal='Craft personalized and effective follow-up emails based on previous interactions.',
@@ -216,24 +225,165 @@ def craft_follow_up_email(user_offer, prospect_personalization, user_name, user_
 
         Use this positive reply as inspiration for the tone and content of your follow-up email. Identify what worked well in this reply and incorporate similar elements into your new email.'''
 
-    task = Task(
+    return run_task(
+        follow_up_crafter,
         description=task_description,
-        agent=follow_up_crafter,
-        expected_output='''Complete follow-up email ready to send, including subject line and body.'''
+        expected_output='''Complete follow-up email ready to send, including subject line and body.''',
+        cache=cache
     )
-    crew = Crew(agents=[follow_up_crafter], tasks=[task], verbose=True)
-    return crew.kickoff()
 
 
-def handle_email_response(response_content, user_offer, prospect_personalization, user_name, user_web, prospect_name,
-                          previous_emails):
-    # First, classify the email
-    classification = classify_email(response_content)
+class ReplyTriage:
+    """Classification of one prospect reply plus the most recent positive reply in its thread."""
+
+    __slots__ = ('email', 'classification', 'explanation', 'last_positive_reply')
+
+    def __init__(self, email: str, classification: str = 'Other', explanation: str = '',
+                 last_positive_reply: Optional[str] = None):
+        self.email = email
+        self.classification = classification
+        self.explanation = explanation
+        self.last_positive_reply = last_positive_reply
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self) -> str:
+        return f"ReplyTriage({self.email!r}, {self.classification!r})"
+
+
+def normalize_classification(label) -> str:
+    label = ' '.join(str(label or '').replace('[', ' ').replace(']', ' ').split()).lower()
+    # Longest names first so "Not Interested" is not read as "Interested"
+    for name in sorted(REPLY_CLASSIFICATIONS, key=len, reverse=True):
+        if name.lower() in label:
+            return name
+    return 'Other'
+
+
+def normalize_positive_reply(reply) -> Optional[str]:
+    reply = str(reply or '').strip().strip('"').strip()
+    if not reply or reply == 'None' or NO_POSITIVE_REPLY.lower() in reply.lower():
+        return None
+    return reply
+
+
+def parse_classification(text) -> Tuple[str, str]:
+    """``(classification, explanation)`` from classify_email's "Classification: ... Explanation: ..." output."""
+    text = str(text)
+    label = re.search(r'Classification:\s*(.+)', text, re.IGNORECASE)
+    explanation = re.search(r'Explanation:\s*(.+)', text, re.IGNORECASE | re.DOTALL)
+    return (normalize_classification(label.group(1) if label else text),
+            explanation.group(1).strip() if explanation else '')
+
 
-    # Get the last positive reply
-    last_positive_reply = get_last_positive_reply(previous_emails)
+def parse_last_positive_reply(text) -> Optional[str]:
+    text = re.sub(r'^\s*Most recent positive reply:\s*', '', str(text), flags=re.IGNORECASE)
+    return normalize_positive_reply(text)
+
+
+def parse_triage_batch(text, emails: List[str]) -> Dict[str, ReplyTriage]:
+    """Read the JSON array a batched triage call returns; replies it left out are missing from the result."""
+    text = str(text)
+    start, end = text.find('['), text.rfind(']')
+    try:
+        items = json.loads(text[start:end + 1]) if start != -1 and end > start else []
+    except ValueError:
+        logging.warning("Could not parse batched reply triage output")
+        return {}
+    triaged = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        try:
+            email = emails[int(item.get('id')) - 1]
+        except (TypeError, ValueError, IndexError):
+            continue
+        triaged[email] = ReplyTriage(email, normalize_classification(item.get('classification')),
+                                     str(item.get('explanation') or ''),
+                                     normalize_positive_reply(item.get('last_positive_reply')))
+    return triaged
+
+
+def triage_reply(email: str, response_content, previous_emails, cache=True) -> ReplyTriage:
+    """Triage a single reply; the classification and the positive-reply lookup run concurrently."""
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix='triage') as pool:
+        classification = pool.submit(classify_email, response_content, cache)
+        last_positive_reply = pool.submit(get_last_positive_reply, previous_emails, cache)
+        label, explanation = parse_classification(classification.result())
+        return ReplyTriage(email, label, explanation, parse_last_positive_reply(last_positive_reply.result()))
+
+
+def triage_reply_batch(replies: Dict[str, Tuple[str, list]], cache=True) -> Dict[str, ReplyTriage]:
+    """Classify several replies and find their last positive replies in one structured-output call."""
+    emails = list(replies)
+    reply_triager = create_agent(
+        role='Reply Triage Specialist',
+        goal='Classify prospect replies and find the most recent positive reply in each email thread.',
+        backstory='You are an expert in understanding email communications, their intent and their sentiment.'
+    )
+
+    conversations = '\n\n'.join(
+        f"### Reply {index}\nReply Content:\n{response_content}\n\nEmail Thread:\n{previous_emails}"
+        for index, (response_content, previous_emails) in enumerate(replies.values(), start=1))
+    triage = run_task(
+        reply_triager,
+        description=f'''For each numbered reply below, classify the prospect's reply and identify the most recent positive reply in its email thread.
+
+        {conversations}
+
+        Possible Classifications: {', '.join(REPLY_CLASSIFICATIONS)}
+
+        Guidelines:
+        - Provide a single classification per reply and a brief explanation (1-2 sentences)
+        - A positive reply shows interest, asks for more information, or expresses willingness to engage further
+        - Focus on the prospect's replies in the thread, not the sender's emails; if there are none, use "{NO_POSITIVE_REPLY}"
+        ''',
+        expected_output=f'''A JSON array with one object per reply and nothing else:
+        [{{"id": 1, "classification": "<one of the classifications>", "explanation": "<brief explanation>", "last_positive_reply": "<content or {NO_POSITIVE_REPLY}>"}}]''',
+        cache=cache
+    )
+    return parse_triage_batch(triage, emails)
+
+
+def triage_replies(replies: Dict[str, Tuple[str, list]], mode: str = REPLY_TRIAGE_MODE,
+                   batch_size: int = REPLY_TRIAGE_BATCH_SIZE,
+                   concurrency: int = REPLY_TRIAGE_CONCURRENCY) -> Dict[str, ReplyTriage]:
+    """Triage ``{email: (response_content, previous_emails)}`` with all LLM calls in flight at once.
+
+    In ``batch`` mode replies are grouped ``batch_size`` to a call and any reply a batch answer
+    leaves out is triaged on its own; ``parallel`` mode triages every reply on its own.
+    """
+    if not replies:
+        return {}
+    emails = list(replies)
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='triage') as pool:
+        triaged = {}
+        if mode == 'batch':
+            batches = [emails[start:start + batch_size] for start in range(0, len(emails), batch_size)]
+            for batch, future in [(batch, pool.submit(triage_reply_batch, {email: replies[email] for email in batch}))
+                                  for batch in batches]:
+                try:
+                    triaged.update(future.result())
+                except Exception as e:
+                    logging.error(f"Batched reply triage failed for {len(batch)} replies: {e}")
+
+        missing = {email: pool.submit(triage_reply, email, *replies[email]) for email in emails if email not in triaged}
+        for email, future in missing.items():
+            try:
+                triaged[email] = future.result()
+            except Exception as e:
+                logging.error(f"Reply triage failed for {email}: {e}")
+                triaged[email] = ReplyTriage(email)
+    return triaged
+
+
+def handle_email_response(response_content, user_offer, prospect_personalization, user_name, user_web, prospect_name,
+                          previous_emails, triage: Optional[ReplyTriage] = None):
+    # Replies triaged up front (see triage_replies) skip straight to writing the follow-up
+    if triage is None:
+        triage = triage_reply(None, response_content, previous_emails)
 
-    # Then, craft an appropriate follow-up based on the classification and last positive reply
     follow_up_email = craft_follow_up_email(
         user_offer,
         prospect_personalization,
@@ -241,14 +391,14 @@ def handle_email_response(response_content, user_offer, prospect_personalization
         user_web,
         prospect_name,
         previous_emails,
-        classification,
-        last_positive_reply
+        f"{triage.classification} - {triage.explanation}" if triage.explanation else triage.classification,
+        triage.last_positive_reply
     )
 
     return {
-        'classification': classification,
+        'classification': triage.classification,
         'follow_up_email': follow_up_email,
-        'last_positive_reply': last_positive_reply
+        'last_positive_reply': triage.last_positive_reply or NO_POSITIVE_REPLY
     }
 
 
@@ -0,0 +1,149 @@
+import json
+import logging
+import os
+import queue
+import subprocess
+import threading
+from collections import deque
+from contextlib import closing
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+SCRAPER_SCRIPT = os.getenv('SCRAPER_SCRIPT', 'src/lead_scraper/scrape.js')
+SCRAPER_PROCESSES = int(os.getenv('SCRAPER_PROCESSES', '2'))
+SCRAPER_QUEUE_SIZE = int(os.getenv('SCRAPER_QUEUE_SIZE', '100'))
+
+_DONE = object()
+
+
+class ScraperRunner:
+    """Runs the Node Maps scraper, at most ``max_processes`` queries at a time.
+
+    The script is started with an argv list (no shell) in ``--jsonl`` mode, so every business comes
+    back on stdout as a JSON line the moment it is found. stderr carries the scraper's progress log
+    and is drained on its own thread, so neither pipe can fill up and stall the child.
+    """
+
+    def __init__(self, script: str = SCRAPER_SCRIPT, max_processes: int = SCRAPER_PROCESSES,
+                 node: str = 'node'):
+        self.script = script
+        self.node = node
+        self.max_processes = max_processes
+        self._slots = threading.BoundedSemaphore(max_processes)
+
+    def command(self, query) -> list:
+        return [self.node, self.script, '--jsonl', json.dumps([query])]
+
+    @staticmethod
+    def _drain_stderr(stream, tail: deque) -> None:
+        for line in stream:
+            line = line.rstrip()
+            if line:
+                tail.append(line)
+                logging.info(f"[scraper] {line}")
+
+    def iter_query(self, query) -> Iterator[Dict[str, Any]]:
+        """Yield the businesses found for ``query`` while the scraper is still running."""
+        with self._slots:
+            cmd = self.command(query)
+            logging.info(f"Running scraper for {json.dumps(query)}")
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1)
+            stderr_tail = deque(maxlen=20)
+            stderr_thread = threading.Thread(target=self._drain_stderr, args=(process.stderr, stderr_tail),
+                                             name='scraper-stderr', daemon=True)
+            stderr_thread.start()
+            try:
+                for line in process.stdout:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        logging.warning(f"Ignoring scraper output line: {line.strip()}")
+                        continue
+                    if record.get('type') == 'lead':
+                        record.pop('type')
+                        yield record
+                rc = process.wait()
+                stderr_thread.join()
+                if rc != 0:
+                    raise subprocess.CalledProcessError(rc, cmd, stderr='\n'.join(stderr_tail))
+            finally:
+                if process.poll() is None:
+                    # The consumer stopped early; don't leave a browser running behind it
+                    process.kill()
+                    process.wait()
+                process.stdout.close()
+
+    def iter_queries(self, queries: Iterable[Any],
+                     on_status: Optional[Callable[[str], None]] = None) -> Iterator[Dict[str, Any]]:
+        """Scrape ``queries`` in parallel and yield their businesses as one stream, in arrival order.
+
+        A failing query is logged and reported through ``on_status``; the others carry on.
+        """
+        found = queue.Queue(SCRAPER_QUEUE_SIZE)
+        stop = threading.Event()
+        pending = queue.Queue()
+        for query in queries:
+            pending.put(query)
+
+        def report(message):
+            logging.info(message)
+            if on_status is not None:
+                on_status(message)
+
+        def offer(item) -> bool:
+            while not stop.is_set():
+                try:
+                    found.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def work():
+            try:
+                while not stop.is_set():
+                    try:
+                        query = pending.get_nowait()
+                    except queue.Empty:
+                        return
+                    report(f"Processing query: {json.dumps(query)}")
+                    count = 0
+                    try:
+                        with closing(self.iter_query(query)) as businesses:
+                            for business in businesses:
+                                if not offer(business):
+                                    return
+                                count += 1
+                        report(f"Completed processing for query: {json.dumps(query)} ({count} businesses)")
+                    except Exception as e:
+                        logging.error(f"Scraper failed for {json.dumps(query)}: {e}")
+                        report(f"Scraper failed for query: {json.dumps(query)}")
+            finally:
+                offer(_DONE)
+
+        workers = [threading.Thread(target=work, name=f'scraper-{index}', daemon=True)
+                   for index in range(min(self.max_processes, pending.qsize()))]
+        for worker in workers:
+            worker.start()
+
+        remaining = len(workers)
+        try:
+            while remaining:
+                business = found.get()
+                if business is _DONE:
+                    remaining -= 1
+                    continue
+                yield business
+        finally:
+            stop.set()
+
+
+_default_runner = None
+_default_lock = threading.Lock()
+
+
+def get_scraper_runner() -> ScraperRunner:
+    global _default_runner
+    with _default_lock:
+        if _default_runner is None:
+            _default_runner = ScraperRunner()
+        return _default_runner
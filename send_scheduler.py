@@ -0,0 +1,285 @@
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import lead_store
+
+SEND_WORKERS = int(os.getenv('SEND_WORKERS', '4'))
+SEND_AFTER_WORKERS = int(os.getenv('SEND_AFTER_WORKERS', '4'))
+SEND_DAILY_QUOTA = int(os.getenv('SEND_DAILY_QUOTA', '200'))
+SEND_HOURLY_QUOTA = int(os.getenv('SEND_HOURLY_QUOTA', '30'))
+SEND_INTERVAL = float(os.getenv('SEND_INTERVAL', '10'))
+SEND_JITTER = float(os.getenv('SEND_JITTER', '5'))
+CANCEL_CHECK_INTERVAL = 5.0
+
+
+class TokenBucket:
+    """``capacity`` tokens refilled continuously over ``period`` seconds."""
+
+    def __init__(self, capacity: int, period: float):
+        self.capacity = max(1, capacity)
+        self.rate = self.capacity / period
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+
+class DailyQuota:
+    """At most ``limit`` sends per calendar day (local time), starting from ``sent`` already made today."""
+
+    def __init__(self, limit: int, sent: int = 0):
+        self.limit = max(1, limit)
+        self.sent = sent
+        self.day = datetime.now().date()
+
+    def _roll(self) -> datetime:
+        wall = datetime.now()
+        if wall.date() != self.day:
+            self.day, self.sent = wall.date(), 0
+        return wall
+
+    def wait_time(self, now: float) -> float:
+        wall = self._roll()
+        if self.sent < self.limit:
+            return 0.0
+        midnight = datetime.combine(self.day + timedelta(days=1), datetime.min.time())
+        return max(0.0, (midnight - wall).total_seconds())
+
+    def take(self, now: float) -> None:
+        self._roll()
+        self.sent += 1
+
+
+class SendJob:
+    __slots__ = ('send', 'future', 'cancel_event')
+
+    def __init__(self, send: Callable[[], Any], cancel_event: Optional[threading.Event]):
+        self.send = send
+        self.future = Future()
+        self.cancel_event = cancel_event
+
+
+class SenderAccount:
+    def __init__(self, daily_quota: int, hourly_quota: int, sent_today: int = 0):
+        self.buckets = (DailyQuota(daily_quota, sent_today), TokenBucket(hourly_quota, 60 * 60))
+        self.queue = deque()
+        self.next_send = 0.0
+        self.busy = False
+        self.scheduled = False
+
+    def ready_at(self, now: float) -> float:
+        return max(self.next_send, now + max(bucket.wait_time(now) for bucket in self.buckets))
+
+
+class SendScheduler:
+    """Paces email sends for every campaign in the process from one dispatcher thread.
+
+    Each sender account has a FIFO of pending sends, a calendar-day quota and an hourly token bucket.
+    ``sent_today(account)`` seeds the daily count when an account is first seen, so a restart does
+    not hand out the day's quota again. A min-heap
+    keyed by the time each account may send next decides what goes out; due sends run on a small
+    worker pool, one at a time per account so an SMTP session is never shared by two threads. After
+    a send the account waits ``interval`` seconds plus or minus ``jitter`` before the next one.
+    """
+
+    def __init__(self, workers: int = SEND_WORKERS, daily_quota: int = SEND_DAILY_QUOTA,
+                 hourly_quota: int = SEND_HOURLY_QUOTA, interval: float = SEND_INTERVAL, jitter: float = SEND_JITTER,
+                 after_workers: int = SEND_AFTER_WORKERS, sent_today: Optional[Callable[[str], int]] = None):
+        self.daily_quota = daily_quota
+        self.sent_today = sent_today
+        self.hourly_quota = hourly_quota
+        self.interval = interval
+        self.jitter = jitter
+        self.accounts: Dict[str, SenderAccount] = {}
+        self.heap = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='send')
+        # Continuations (reply checks, follow-up writing) can take minutes; they get their own threads so
+        # they never hold up paced sends for other campaigns.
+        self.after_pool = ThreadPoolExecutor(max_workers=after_workers, thread_name_prefix='send-after')
+        self.dispatcher = None
+        self.stopping = False
+
+    def start(self) -> None:
+        with self.condition:
+            if self.dispatcher is None:
+                self.dispatcher = threading.Thread(target=self._dispatch, name='send-dispatcher', daemon=True)
+                self.dispatcher.start()
+
+    def stop(self) -> None:
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        self.pool.shutdown(wait=False)
+        self.after_pool.shutdown(wait=False)
+
+    def schedule(self, account: str, send: Callable[[], Any], cancel_event: Optional[threading.Event] = None) -> Future:
+        """Queue ``send()`` for ``account``; the returned future holds its result once it has gone out."""
+        self.start()
+        job = SendJob(send, cancel_event)
+        # Read outside the lock; only the first schedule() for an account uses it
+        sent_today = self.sent_today(account) if self.sent_today and account not in self.accounts else 0
+        with self.condition:
+            sender = self.accounts.get(account)
+            if sender is None:
+                sender = self.accounts[account] = SenderAccount(self.daily_quota, self.hourly_quota, sent_today)
+            sender.queue.append(job)
+            self._push(account, sender, time.monotonic())
+        return job.future
+
+    def after(self, futures: Iterable[Future], fn: Callable[[], Any]) -> Future:
+        """Run ``fn`` on the continuation pool once every future in ``futures`` is done (or cancelled)."""
+        result = Future()
+
+        def run(_):
+            if not result.set_running_or_notify_cancel():
+                return
+            try:
+                self.after_pool.submit(self._complete, result, fn)
+            except RuntimeError as e:
+                result.set_exception(e)
+
+        gather(futures).add_done_callback(run)
+        return result
+
+    def pending(self, account: str) -> int:
+        with self.condition:
+            sender = self.accounts.get(account)
+            return len(sender.queue) if sender else 0
+
+    @staticmethod
+    def _complete(future: Future, fn: Callable[[], Any]) -> None:
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+
+    def _push(self, account: str, sender: SenderAccount, now: float) -> None:
+        # Called with the condition held; an account is in the heap at most once.
+        if sender.busy or sender.scheduled or not sender.queue:
+            return
+        sender.scheduled = True
+        heapq.heappush(self.heap, (sender.ready_at(now), next(self.counter), account))
+        self.condition.notify()
+
+    def _drop_cancelled(self) -> None:
+        for sender in self.accounts.values():
+            if not any(job.cancel_event is not None and job.cancel_event.is_set() for job in sender.queue):
+                continue
+            kept = deque()
+            for job in sender.queue:
+                if job.cancel_event is not None and job.cancel_event.is_set():
+                    job.future.cancel()
+                else:
+                    kept.append(job)
+            sender.queue = kept
+
+    def _dispatch(self) -> None:
+        last_sweep = 0.0
+        with self.condition:
+            while not self.stopping:
+                now = time.monotonic()
+                if now - last_sweep >= CANCEL_CHECK_INTERVAL:
+                    self._drop_cancelled()
+                    last_sweep = now
+                if not self.heap:
+                    self.condition.wait(CANCEL_CHECK_INTERVAL)
+                    continue
+                due, _, account = self.heap[0]
+                if due > now:
+                    # Wake up regularly so cancelled campaigns release their queued sends before they fall due.
+                    self.condition.wait(min(due - now, CANCEL_CHECK_INTERVAL))
+                    continue
+                heapq.heappop(self.heap)
+                sender = self.accounts[account]
+                sender.scheduled = False
+
+                # Quota may have been used since the entry was pushed; re-check before sending.
+                ready = sender.ready_at(now)
+                if ready > now:
+                    sender.scheduled = True
+                    heapq.heappush(self.heap, (ready, next(self.counter), account))
+                    continue
+
+                job = None
+                while sender.queue:
+                    candidate = sender.queue.popleft()
+                    if candidate.cancel_event is not None and candidate.cancel_event.is_set():
+                        candidate.future.cancel()
+                        continue
+                    job = candidate
+                    break
+                if job is None:
+                    continue
+
+                for bucket in sender.buckets:
+                    bucket.take(now)
+                sender.busy = True
+                self.pool.submit(self._run, account, sender, job)
+
+    def _run(self, account: str, sender: SenderAccount, job: SendJob) -> None:
+        if job.future.set_running_or_notify_cancel():
+            try:
+                job.future.set_result(job.send())
+            except BaseException as e:
+                logging.error(f"Send for {account} failed: {e}")
+                job.future.set_exception(e)
+        with self.condition:
+            now = time.monotonic()
+            sender.busy = False
+            sender.next_send = now + max(0.0, self.interval + random.uniform(-self.jitter, self.jitter))
+            self._push(account, sender, now)
+
+
+def gather(futures: Iterable[Future]) -> Future:
+    """A future that completes once all of ``futures`` have, whatever their outcome."""
+    futures = list(futures)
+    done = Future()
+    done.set_running_or_notify_cancel()
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def finished(_):
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            done.set_result(futures)
+
+    if not futures:
+        done.set_result(futures)
+    for future in futures:
+        future.add_done_callback(finished)
+    return done
+
+
+_default_scheduler = None
+_default_lock = threading.Lock()
+
+
+def get_send_scheduler() -> SendScheduler:
+    global _default_scheduler
+    with _default_lock:
+        if _default_scheduler is None:
+            _default_scheduler = SendScheduler(sent_today=lead_store.emails_sent_today)
+        return _default_scheduler
@@ -0,0 +1,139 @@
+import logging
+import os
+import smtplib
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+SMTP_POOL_SIZE = int(os.getenv('SMTP_POOL_SIZE', '2'))
+SMTP_MAX_IDLE = int(os.getenv('SMTP_MAX_IDLE', '120'))
+SMTP_TIMEOUT = float(os.getenv('SMTP_TIMEOUT', '30'))
+
+# Errors after which the session is gone and the send can be retried on a fresh login.
+RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+
+class SMTPPool:
+    """Authenticated SMTP sessions for one account, shared by every send that uses it.
+
+    Exposes ``sendmail`` like ``smtplib.SMTP`` so it can stand in for a single connection. Sessions
+    are NOOP-checked when taken from the pool and dropped once idle longer than ``max_idle`` seconds;
+    a send that hits a dropped connection logs in again and is retried once.
+    """
+
+    def __init__(self, host: str, port: int, user: str, password: str, max_size: int = SMTP_POOL_SIZE,
+                 max_idle: int = SMTP_MAX_IDLE, timeout: float = SMTP_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.connections_opened = 0
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+
+    def _connect(self) -> smtplib.SMTP:
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        smtp.starttls()
+        smtp.login(self.user, self.password)
+        with self._lock:
+            self.connections_opened += 1
+        logging.info(f"Opened SMTP session for {self.user}")
+        return smtp
+
+    @staticmethod
+    def _discard(smtp) -> None:
+        try:
+            smtp.quit()
+        except Exception:
+            try:
+                smtp.close()
+            except Exception:
+                pass
+
+    def _checkout(self) -> smtplib.SMTP:
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                smtp, released_at = self._idle.pop()
+            if time.monotonic() - released_at > self.max_idle:
+                self._discard(smtp)
+                continue
+            try:
+                if smtp.noop()[0] == 250:
+                    return smtp
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._discard(smtp)
+        return self._connect()
+
+    def _checkin(self, smtp) -> None:
+        with self._lock:
+            self._idle.append((smtp, time.monotonic()))
+
+    def warm(self) -> None:
+        """Make sure one logged-in session is ready, so bad credentials fail before any send."""
+        with self._slots:
+            self._checkin(self._checkout())
+
+    def sendmail(self, from_addr, to_addrs, msg, mail_options=(), rcpt_options=()):
+        self._slots.acquire()
+        try:
+            for attempt in range(2):
+                smtp = self._checkout()
+                try:
+                    result = smtp.sendmail(from_addr, to_addrs, msg, mail_options, rcpt_options)
+                except RECONNECT_ERRORS as e:
+                    self._discard(smtp)
+                    if attempt:
+                        raise
+                    logging.warning(f"SMTP session for {self.user} dropped ({e}), reconnecting")
+                    continue
+                except smtplib.SMTPRecipientsRefused:
+                    self._checkin(smtp)
+                    raise
+                except smtplib.SMTPResponseException as e:
+                    # 421: the server is closing the channel; other refusals leave the session usable.
+                    if e.smtp_code != 421:
+                        self._checkin(smtp)
+                        raise
+                    self._discard(smtp)
+                    if attempt:
+                        raise
+                    logging.warning(f"SMTP server closed the session for {self.user}, reconnecting")
+                    continue
+                except Exception:
+                    self._discard(smtp)
+                    raise
+                self._checkin(smtp)
+                return result
+        finally:
+            self._slots.release()
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for smtp, _ in idle:
+            self._discard(smtp)
+
+    quit = close
+
+
+_pools: Dict[Tuple[str, int, str], SMTPPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_smtp_pool(user: str, password: str, host: Optional[str] = None, port: Optional[int] = None) -> SMTPPool:
+    host = host or os.getenv('SMTP_SERVER') or 'smtp.gmail.com'
+    port = port or int(os.getenv('SMTP_PORT') or 587)
+    with _pools_lock:
+        pool = _pools.get((host, port, user))
+        if pool is None or pool.password != password:
+            if pool is not None:
+                pool.close()
+            pool = _pools[(host, port, user)] = SMTPPool(host, port, user, password)
+        return pool
@@ -2,6 +2,15 @@ const { chromium } = require('playwright');
 const createCsvWriter = require('csv-writer').createObjectCsvWriter;
 const fs = require('fs');
 
+// With --jsonl each business is written to stdout as one JSON line as soon as it is found, and all
+// progress logging moves to stderr so stdout only carries records.
+const jsonl = process.argv.includes('--jsonl');
+const log = jsonl ? console.error : console.log;
+
+function emitLead(name, website, query) {
+    process.stdout.write(JSON.stringify({ type: 'lead', Name: name, Website: website, query }) + '\n');
+}
+
 function sleep(ms) {
     return new Promise(resolve => setTimeout(resolve, ms));
 }
@@ -11,7 +20,7 @@ async function waitForSelector(page, selector, timeout = 30000, retries = 3) {
         try {
             return await page.waitForSelector(selector, { timeout });
         } catch (error) {
-            console.log(`Attempt ${i + 1} failed. Retrying...`);
+            log(`Attempt ${i + 1} failed. Retrying...`);
             await sleep(2000 + Math.random() * 1000);
         }
     }
@@ -19,7 +28,7 @@ async function waitForSelector(page, selector, timeout = 30000, retries = 3) {
 }
 
 async function scrollAndLoadAllResults(page) {
-    console.log('Scrolling through all results...');
+    log('Scrolling through all results...');
     let isEndOfList = false;
     let lastResultCount = 0;
     let noNewElementsTimeout = false;
@@ -53,43 +62,43 @@ async function scrollAndLoadAllResults(page) {
             }
 
             if (isEndOfList) {
-                console.log('Reached end of list.');
+                log('Reached end of list.');
             }
 
             if (noNewElementsTimeout) {
-                console.log('No new elements loaded, stopping scroll.');
+                log('No new elements loaded, stopping scroll.');
             }
         } catch (error) {
-            console.log('Error during scrolling:', error);
+            log('Error during scrolling:', error);
             break;
         }
     }
 
-    console.log('Finished scrolling through all results.');
+    log('Finished scrolling through all results.');
 }
 
 async function scrapeQuery(query) {
     const { niche, zone } = query;
-    console.log(`Starting scrape for ${niche} in ${zone}...`);
+    log(`Starting scrape for ${niche} in ${zone}...`);
 
     const browser = await chromium.launch({ headless: true });
     const page = await browser.newPage();
     const url = `https://www.google.com/maps/search/${niche}+${zone}/@${zone}&entry=ttu`;
-    console.log(`Navigating to URL: ${url}`);
+    log(`Navigating to URL: ${url}`);
 
     try {
         await page.goto(url, { timeout: 60000 });
 
         try {
             await waitForSelector(page, 'button.VfPpkd-LgbsSe', 10000);
-            console.log('Consent screen detected, clicking "Accept all"');
+            log('Consent screen detected, clicking "Accept all"');
             await page.click('button.VfPpkd-LgbsSe');
             await sleep(2000 + Math.random() * 1000);
         } catch (e) {
-            console.log('No consent screen detected.');
+            log('No consent screen detected.');
         }
 
-        console.log('Waiting for results to load...');
+        log('Waiting for results to load...');
         await waitForSelector(page, '.Nv2PK', 30000);
 
         await scrollAndLoadAllResults(page);
@@ -97,12 +106,12 @@ async function scrapeQuery(query) {
         const businessData = new Map();
         const results = await page.$$('.Nv2PK');
 
-        console.log(`Found ${results.length} results in total.`);
+        log(`Found ${results.length} results in total.`);
 
         for (const result of results) {
             try {
                 const name = await result.$eval('.qBF1Pd.fontHeadlineSmall', el => el.textContent.trim());
-                console.log(`Processing business: ${name}`);
+                log(`Processing business: ${name}`);
 
                 let website = null;
                 const websiteHandle = await result.$('a[href^="http"]');
@@ -114,7 +123,7 @@ async function scrapeQuery(query) {
                 }
 
                 if (!website) {
-                    console.log(`Website not found in main results, clicking on ${name} to find more details.`);
+                    log(`Website not found in main results, clicking on ${name} to find more details.`);
                     await result.click();
                     await sleep(2000 + Math.random() * 1000);
 
@@ -126,9 +135,12 @@ async function scrapeQuery(query) {
 
                 if (name && website && !businessData.has(name)) {
                     businessData.set(name, website);
-                    console.log(`Added: ${name} - ${website}`);
+                    log(`Added: ${name} - ${website}`);
+                    if (jsonl) {
+                        emitLead(name, website, query);
+                    }
                 } else {
-                    console.log(`No website found for ${name}`);
+                    log(`No website found for ${name}`);
                 }
 
                 const closeButton = await page.$('button[jsaction="pane.pageBack"]');
@@ -137,15 +149,15 @@ async function scrapeQuery(query) {
                     await sleep(1000 + Math.random() * 500);
                 }
             } catch (error) {
-                console.log('Error extracting data from result:', error);
+                log('Error extracting data from result:', error);
             }
         }
 
         await browser.close();
-        console.log(`Scraping complete for ${niche} in ${zone}. Found ${businessData.size} businesses.`);
+        log(`Scraping complete for ${niche} in ${zone}. Found ${businessData.size} businesses.`);
         return Array.from(businessData, ([name, website]) => ({ name, website }));
     } catch (error) {
-        console.log(`Error scraping ${niche} in ${zone}:`, error);
+        log(`Error scraping ${niche} in ${zone}:`, error);
         await browser.close();
         return [];
     }
@@ -166,11 +178,13 @@ async function scrapeGoogleMaps(queries) {
         }
     }
 
-    await saveToCsv(results, 'src/lead_scraper/business_leads.csv');
+    if (!jsonl) {
+        await saveToCsv(results, 'src/lead_scraper/business_leads.csv');
+    }
 }
 
 async function saveToCsv(data, filePath) {
-    console.log(`Saving data to ${filePath}...`);
+    log(`Saving data to ${filePath}...`);
 
     const fileExists = fs.existsSync(filePath);
 
@@ -184,19 +198,21 @@ async function saveToCsv(data, filePath) {
     });
 
     await csvWriter.writeRecords(data);
-    console.log('Data saved to CSV successfully');
+    log('Data saved to CSV successfully');
 }
 
 (async () => {
     try {
-        const args = process.argv.slice(2);
-        const queries = JSON.parse(args[0].replace(/'/g, '"'));
-        console.log('Starting the lead scraping process...');
+        const args = process.argv.slice(2).filter(arg => arg !== '--jsonl');
+        // The runner passes the queries as one JSON argument; quotes inside them (O'Brien's) stay as they are
+        const queries = JSON.parse(args[0]);
+        log('Starting the lead scraping process...');
 
         await scrapeGoogleMaps(queries);
 
-        console.log('Lead scraping process complete.');
+        log('Lead scraping process complete.');
     } catch (error) {
         console.error('An error occurred:', error);
+        process.exitCode = 1;
     }
 })();
\ No newline at end of file
@@ -0,0 +1,54 @@
+"""Secrets stay out of the campaign job table."""
+import json
+import threading
+
+import pytest
+
+import lead_store
+from campaign_scheduler import CampaignScheduler
+
+
+@pytest.fixture(autouse=True)
+def db_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(lead_store, 'LEAD_DB_PATH', str(tmp_path / 'leads.sqlite3'))
+
+
+def stored_payload(campaign_id):
+    row = lead_store.connect().execute('SELECT payload FROM campaign_jobs WHERE campaign_id = ?', (campaign_id,)).fetchone()
+    return json.loads(row['payload']) if row['payload'] else None
+
+
+def test_secrets_are_kept_in_memory_and_handed_to_the_runner():
+    ran = threading.Event()
+    seen = {}
+
+    def runner(payload, campaign_id, cancel_event):
+        seen['stored'] = stored_payload(campaign_id)
+        seen['payload'] = payload
+        ran.set()
+
+    scheduler = CampaignScheduler(runner, workers=1, secret_fields=('appPassword',))
+    campaign_id = lead_store.create_campaign('me@example.com', 'dentists', 'Madrid')
+    scheduler.submit(campaign_id, 'me@example.com', {'niche': 'dentists', 'appPassword': 'secret'})
+    assert ran.wait(2)
+    scheduler.stop(1)
+
+    assert seen['stored'] == {'niche': 'dentists'}
+    assert seen['payload'] == {'niche': 'dentists', 'appPassword': 'secret'}
+
+
+def test_jobs_without_secrets_wait_for_resume():
+    ran = threading.Event()
+    campaign_id = lead_store.create_campaign('me@example.com', 'dentists', 'Madrid')
+    # Queued by a previous process, whose memory held the password
+    lead_store.enqueue_job(campaign_id, 'me@example.com', {'niche': 'dentists'})
+
+    scheduler = CampaignScheduler(lambda payload, *_: ran.set() or payload, workers=1, secret_fields=('appPassword',))
+    scheduler.start()
+    assert not ran.wait(0.3)
+    assert scheduler.status(campaign_id)['needs_secrets']
+
+    assert scheduler.resume(campaign_id, {'appPassword': 'secret', 'niche': 'ignored'})
+    assert ran.wait(2)
+    scheduler.stop(1)
+    assert not scheduler.resume(campaign_id, {'appPassword': 'secret'})
@@ -0,0 +1,49 @@
+"""URL normalization and frontier ordering for a business crawl."""
+from crawl_state import BusinessCrawlState, normalize_url, page_rank
+
+
+def test_normalize_url_collapses_equivalent_urls():
+    variants = ['http://www.Example.com/contact/', 'http://example.com/contact#form', 'http://EXAMPLE.com/contact']
+    assert {normalize_url(url) for url in variants} == {'http://example.com/contact'}
+    assert normalize_url('http://example.com') == 'http://example.com/'
+    assert normalize_url('http://example.com/p?b=2&a=1') == normalize_url('http://example.com/p?a=1&b=2')
+
+
+def test_page_rank_puts_contact_then_about_then_team_first():
+    assert page_rank('http://a.com/contacto') == 0
+    assert page_rank('http://a.com/sobre-nosotros') == 1
+    assert page_rank('http://a.com/our-team') == 2
+    assert page_rank('http://a.com/blog/post') == 5
+
+
+def test_frontier_hands_out_ranked_internal_links_once():
+    state = BusinessCrawlState('http://www.a.com/', budget=10, max_in_flight=10)
+    state.claim('http://www.a.com/')
+    state.add_links(['http://a.com/blog', 'http://a.com/team', 'http://other.com/contact', 'mailto:x@a.com',
+                     'http://www.a.com/contact/', 'http://a.com/contact', 'http://a.com/about', 'http://a.com/'])
+
+    assert state.next_urls() == [(0, 'http://www.a.com/contact/'), (1, 'http://a.com/about'),
+                                 (2, 'http://a.com/team'), (5, 'http://a.com/blog')]
+    assert state.next_urls() == []
+
+
+def test_budget_and_in_flight_limit_the_frontier():
+    state = BusinessCrawlState('http://a.com', budget=3, max_in_flight=1)
+    assert state.claim('http://a.com')
+    state.add_links([f'http://a.com/page{i}' for i in range(5)])
+
+    assert state.next_urls() == []  # the homepage is still in flight
+    state.finished_request()
+    assert len(state.next_urls()) == 1
+    state.finished_request()
+    assert len(state.next_urls()) == 1
+    state.finished_request()
+    assert state.next_urls() == []
+    assert not state.claim('http://a.com/retry')
+
+
+def test_resolved_business_stops_handing_out_urls():
+    state = BusinessCrawlState('http://a.com', max_in_flight=5)
+    state.add_links(['http://a.com/contact', 'http://a.com/about'])
+    state.resolved = True
+    assert state.next_urls() == []
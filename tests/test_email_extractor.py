@@ -0,0 +1,49 @@
+"""Address extraction from page HTML, including obfuscated and encoded addresses."""
+import pytest
+
+from email_extractor import decode_cfemail, extract_emails, is_valid_email
+
+
+def cfemail(address: str, key: int = 0x5a) -> str:
+    return f"{key:02x}" + ''.join(f"{ord(c) ^ key:02x}" for c in address)
+
+
+def test_plain_addresses_are_lower_cased_and_deduped_in_order():
+    page = '<p>Mail Info@Dental.es or info@dental.es, then bookings@dental.es</p>'
+    assert extract_emails(page) == ['info@dental.es', 'bookings@dental.es']
+
+
+def test_cloudflare_attribute_and_link_are_decoded():
+    page = (f'<a class="__cf_email__" data-cfemail="{cfemail("hola@clinica.es")}">[email protected]</a>'
+            f'<a href="/cdn-cgi/l/email-protection#{cfemail("citas@clinica.es", 0x21)}">write</a>')
+    assert extract_emails(page) == ['hola@clinica.es', 'citas@clinica.es']
+
+
+def test_malformed_cloudflare_tokens_decode_to_nothing():
+    assert decode_cfemail('zz') == ''
+    assert decode_cfemail('') == ''
+
+
+def test_percent_and_entity_encoded_mailto_links():
+    page = ('<a href="mailto:%69nfo@studio.com?subject=Hi">mail</a>'
+            '<a href="mailto:&#106;ane@studio.com">jane</a>')
+    assert extract_emails(page) == ['info@studio.com', 'jane@studio.com']
+
+
+@pytest.mark.parametrize('address', [
+    'someone@example.com', 'test@clinic.es', 'name@clinic.es', 'example@clinic.es', 'filler@clinic.es',
+    'user@wix.com', 'noreply@google.com', '1info@clinic.es', '_info@clinic.es', 'info22@clinic.es',
+    'info-@clinic.es', 'logo@2x.png', 'banner@3x.webp',
+])
+def test_rejects_placeholders_vendors_odd_local_parts_and_assets(address):
+    assert not is_valid_email(address)
+
+
+@pytest.mark.parametrize('address', ['info@clinic.es', 'dr.garcia@clinic.es', 'ana2@clinic.es', 'j.smith+web@firm.co.uk'])
+def test_accepts_real_addresses(address):
+    assert is_valid_email(address)
+
+
+def test_asset_filenames_in_markup_are_skipped():
+    page = '<img src="/img/logo@2x.png"><p>contact@bakery.fr</p>'
+    assert extract_emails(page) == ['contact@bakery.fr']
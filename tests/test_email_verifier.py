@@ -0,0 +1,32 @@
+"""Bounds on the verifier's in-memory caches."""
+import time
+
+from email_verifier import VALID, EmailVerifier
+
+
+def test_verdicts_are_bounded_and_least_recently_used_go_first():
+    verifier = EmailVerifier(max_entries=2)
+    verifier._remember('a@example.org', VALID)
+    verifier._remember('b@example.org', VALID)
+    assert verifier.cached_verdict('a@example.org') == VALID
+    verifier._remember('c@example.org', VALID)
+
+    assert len(verifier._verdicts) == 2
+    assert verifier.cached_verdict('b@example.org') is None
+    assert verifier.cached_verdict('a@example.org') == VALID
+
+
+def test_expired_verdicts_are_purged_on_access():
+    verifier = EmailVerifier(verdict_ttl=0.05)
+    verifier._remember('a@example.org', VALID)
+    time.sleep(0.1)
+
+    assert verifier.cached_verdict('a@example.org') is None
+    assert len(verifier._verdicts) == 0
+
+
+def test_domain_locks_are_released_after_probing():
+    verifier = EmailVerifier()
+    with verifier._domain_lock('example.org'):
+        assert 'example.org' in verifier._domain_locks
+    assert verifier._domain_locks == {}
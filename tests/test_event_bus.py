@@ -0,0 +1,40 @@
+"""Replay and eviction in the campaign event bus."""
+from event_bus import EventBus
+
+
+def events(bus, campaign_id, last_event_id=0):
+    return [event['message'] for event in bus.subscribe(campaign_id, last_event_id, heartbeat=0.01)
+            if event is not None]
+
+
+def test_resumes_after_last_event_id():
+    bus = EventBus()
+    for message in ('a', 'b', 'c'):
+        bus.publish(1, 'status', message)
+    bus.publish(1, 'status', 'done', finished=True)
+
+    assert events(bus, 1, last_event_id=2) == ['c', 'done']
+
+
+def test_unknown_last_event_id_replays_the_buffer():
+    bus = EventBus()
+    bus.publish(1, 'status', 'a')
+    bus.publish(1, 'status', 'done', finished=True)
+
+    # A client that saw event 40 before the server restarted
+    assert events(bus, 1, last_event_id=40) == ['a', 'done']
+
+
+def test_evicts_only_finished_channels_without_subscribers():
+    bus = EventBus(max_campaigns=2)
+    bus.publish(1, 'status', 'running')
+    bus.publish(2, 'status', 'done', finished=True)
+    listener = bus.subscribe(2, heartbeat=0.01)
+    next(listener)
+
+    bus.publish(3, 'status', 'running')
+    assert set(bus._channels) == {'1', '2', '3'}
+
+    listener.close()
+    bus.publish(4, 'status', 'running')
+    assert set(bus._channels) == {'1', '3', '4'}
@@ -0,0 +1,140 @@
+"""BODYSTRUCTURE parsing and the incremental reply scan against a fake IMAP connection."""
+import re
+
+import pytest
+
+import imap_scan
+from imap_scan import find_text_part, parse_imap_list, scan_replies
+
+PLAIN = b'("text" "plain" ("charset" "iso-8859-1") NIL NIL "quoted-printable" 120 4 NIL NIL NIL)'
+HTML = b'("text" "html" ("charset" "utf-8") NIL NIL "base64" 900 12 NIL NIL NIL)'
+PDF = b'("application" "pdf" ("name" "quote.pdf") NIL NIL "base64" 5000 NIL NIL NIL)'
+
+
+def structure(data: bytes):
+    return parse_imap_list(data)[0]
+
+
+def test_parses_a_single_part_with_nil_and_parameters():
+    parsed = structure(PLAIN)
+    assert parsed[:6] == ['text', 'plain', ['charset', 'iso-8859-1'], None, None, 'quoted-printable']
+    assert find_text_part(parsed) == {'part': '1', 'subtype': 'plain', 'charset': 'iso-8859-1',
+                                      'encoding': 'quoted-printable'}
+
+
+def test_prefers_plain_over_html_in_multipart_alternative():
+    parsed = structure(b'(' + HTML + PLAIN + b' "alternative" ("boundary" "b1") NIL NIL)')
+    assert find_text_part(parsed)['part'] == '2'
+
+
+def test_numbers_parts_of_nested_multiparts():
+    alternative = b'(' + PLAIN + HTML + b' "alternative" ("boundary" "inner") NIL NIL)'
+    parsed = structure(b'(' + alternative + PDF + b' "mixed" ("boundary" "outer") NIL NIL)')
+    assert find_text_part(parsed) == {'part': '1.1', 'subtype': 'plain', 'charset': 'iso-8859-1',
+                                      'encoding': 'quoted-printable'}
+
+
+def test_falls_back_to_html_and_skips_attachments():
+    parsed = structure(b'(' + PDF + HTML + b' "mixed" ("boundary" "b") NIL NIL)')
+    assert find_text_part(parsed) == {'part': '2', 'subtype': 'html', 'charset': 'utf-8', 'encoding': 'base64'}
+    assert find_text_part(structure(PDF)) is None
+
+
+def test_quoted_strings_keep_spaces_parentheses_and_escapes():
+    parsed = parse_imap_list(b'("a (b) c" "say \\"hi\\"" "back\\\\slash" NIL)')
+    assert parsed == [['a (b) c', 'say "hi"', 'back\\slash', None]]
+
+
+def test_literals_are_inlined():
+    parsed = parse_imap_list(b'("text" {5}\r\nplain NIL)')
+    assert parsed == [['text', 'plain', None]]
+
+
+class FakeMail:
+    """Just enough of imaplib.IMAP4 for scan_replies: SELECT, UID SEARCH and UID FETCH."""
+
+    def __init__(self, uidvalidity=b'1'):
+        self.uidvalidity = uidvalidity
+        self.messages = {}
+        self.searches = []
+
+    def add(self, uid, sender, body, in_reply_to=None):
+        headers = f'From: {sender}\r\nDate: Mon, 05 Oct 2026 10:00:00 +0000\r\n'
+        if in_reply_to:
+            headers += f'In-Reply-To: {in_reply_to}\r\n'
+        self.messages[uid] = (headers + '\r\n').encode(), body.encode()
+
+    def select(self, mailbox, readonly=False):
+        return 'OK', [str(len(self.messages)).encode()]
+
+    def response(self, code):
+        return code, [self.uidvalidity]
+
+    def uid(self, command, *args):
+        if command == 'SEARCH':
+            self.searches.append(args[1:])
+            low = int(re.match(r'UID (\d+):\*', args[1]).group(1))
+            uids = [uid for uid in sorted(self.messages) if uid >= low] or sorted(self.messages)[-1:]
+            return 'OK', [' '.join(map(str, uids)).encode()]
+        uids, query = [int(uid) for uid in args[0].split(',')], args[1]
+        data = []
+        for seq, uid in enumerate(uids, 1):
+            headers, body = self.messages[uid]
+            if query == '(BODYSTRUCTURE)':
+                data.append(f'{seq} (UID {uid} BODYSTRUCTURE '.encode() + PLAIN + b')')
+            else:
+                literal = headers if 'HEADER' in query else body
+                data.append((f'{seq} (UID {uid} BODY[] {{{len(literal)}}}'.encode(), literal))
+                data.append(b')')
+        return 'OK', data
+
+
+@pytest.fixture(autouse=True)
+def state_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(imap_scan, 'IMAP_STATE_PATH', str(tmp_path / 'imap_state.json'))
+
+
+def test_scan_prefers_the_latest_real_reply_and_fetches_its_body():
+    mail = FakeMail()
+    mail.add(1, 'Lead <lead@example.org>', 'auto reply')
+    mail.add(2, 'lead@example.org', 'sounds good', in_reply_to='<m1@example.com>')
+    mail.add(3, 'stranger@example.org', 'spam')
+
+    replies = scan_replies(mail, {'lead@example.org': {}}, 'me@example.com')
+
+    assert [(r['uid'], r['sender'], r['body']) for r in replies] == [(2, 'lead@example.org', 'sounds good')]
+
+
+def test_scan_resumes_after_the_last_uid():
+    mail = FakeMail()
+    mail.add(1, 'lead@example.org', 'first')
+    scan_replies(mail, {'lead@example.org': {}}, 'me@example.com')
+    assert scan_replies(mail, {'lead@example.org': {}}, 'me@example.com') == []
+
+    mail.add(2, 'lead@example.org', 'second')
+    replies = scan_replies(mail, {'lead@example.org': {}}, 'me@example.com')
+    assert [r['body'] for r in replies] == ['second']
+    assert mail.searches[-1] == ('UID 2:*',)
+
+
+def test_uidvalidity_change_rescans_from_the_start():
+    mail = FakeMail(uidvalidity=b'1')
+    mail.add(5, 'lead@example.org', 'old mailbox')
+    scan_replies(mail, {'lead@example.org': {}}, 'me@example.com')
+
+    mail.uidvalidity = b'2'
+    mail.messages.clear()
+    mail.add(1, 'lead@example.org', 'renumbered')
+    replies = scan_replies(mail, {'lead@example.org': {}}, 'me@example.com')
+
+    assert mail.searches[-1] == ('UID 1:*',)
+    assert [r['body'] for r in replies] == ['renumbered']
+
+
+def test_campaigns_keep_separate_cursors():
+    mail = FakeMail()
+    mail.add(1, 'lead@example.org', 'hello')
+    scan_replies(mail, {'lead@example.org': {}}, 'me@example.com', campaign_id=1)
+
+    replies = scan_replies(mail, {'lead@example.org': {}}, 'me@example.com', campaign_id=2)
+    assert [r['body'] for r in replies] == ['hello']
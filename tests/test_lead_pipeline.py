@@ -0,0 +1,24 @@
+"""The per-campaign set of seen emails shared by concurrent batch spiders."""
+import pytest
+
+pytest.importorskip('scrapy')
+import lead_pipeline  # noqa: E402
+import lead_store  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def db_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(lead_store, 'LEAD_DB_PATH', str(tmp_path / 'leads.sqlite3'))
+
+
+def test_batches_share_the_set_until_the_last_one_releases_it():
+    first = lead_pipeline.acquire_seen_emails(7)
+    second = lead_pipeline.acquire_seen_emails(7)
+    assert first is second
+    assert first.add('info@a.com')
+    assert not second.add('info@a.com')
+
+    lead_pipeline.release_seen_emails(7)
+    assert 7 in lead_pipeline._seen_emails
+    lead_pipeline.release_seen_emails(7)
+    assert 7 not in lead_pipeline._seen_emails
@@ -0,0 +1,101 @@
+"""Lead dedupe and updates in the SQLite lead store."""
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+import lead_store
+
+
+@pytest.fixture(autouse=True)
+def db_path(tmp_path, monkeypatch):
+    path = str(tmp_path / 'leads.sqlite3')
+    monkeypatch.setattr(lead_store, 'LEAD_DB_PATH', path)
+    return path
+
+
+def test_website_key_ignores_scheme_www_trailing_slash_and_fragment():
+    keys = {lead_store.website_key(url) for url in
+            ('http://a.com', 'https://www.A.com/', 'a.com/', 'http://a.com/#contact')}
+    assert keys == {'a.com'}
+    assert lead_store.website_key('http://a.com/shop/') == 'a.com/shop'
+    assert lead_store.website_key('') is None
+
+
+def test_add_lead_dedupes_variants_of_the_same_website():
+    campaign_id = lead_store.create_campaign('me@example.com', 'dentists', 'Madrid')
+    first = lead_store.add_lead(campaign_id, {'Name': 'A', 'Website': 'http://a.com'})
+
+    assert first['Website'] == 'http://a.com'
+    assert lead_store.add_lead(campaign_id, {'Name': 'A', 'Website': 'https://www.a.com/'}) is None
+    assert len(lead_store.get_leads(campaign_id)) == 1
+
+
+def test_leads_without_a_campaign_dedupe_too():
+    assert lead_store.add_lead(None, {'Name': 'A', 'Website': 'http://a.com'}) is not None
+    assert lead_store.add_lead(None, {'Name': 'A', 'Website': 'http://a.com/'}) is None
+
+
+def test_campaigns_keep_their_own_copy_of_a_business():
+    first = lead_store.create_campaign('me@example.com', 'dentists', 'Madrid')
+    second = lead_store.create_campaign('me@example.com', 'dentists', 'Madrid')
+
+    assert lead_store.add_lead(first, {'Name': 'A', 'Website': 'http://a.com'}) is not None
+    assert lead_store.add_lead(second, {'Name': 'A', 'Website': 'http://a.com'}) is not None
+
+
+def test_save_lead_emails_updates_the_existing_lead():
+    campaign_id = lead_store.create_campaign('me@example.com', 'dentists', 'Madrid')
+    lead = lead_store.add_lead(campaign_id, {'Name': 'A', 'Website': 'http://a.com', 'Decision Maker': 'Ana'})
+    lead_store.add_lead(campaign_id, {'Name': 'B', 'Website': 'http://b.com'})
+
+    lead_store.save_lead_emails([{'Website': 'https://a.com/', 'Email': 'ana@a.com'},
+                                 {'Website': 'http://c.com', 'Email': 'info@c.com', 'Decision Maker': 'Cy'}],
+                                campaign_id)
+    by_site = {row['Website']: row for row in lead_store.get_leads(campaign_id)}
+
+    assert set(by_site) == {'http://a.com', 'http://b.com', 'http://c.com'}
+    assert by_site['http://a.com']['id'] == lead['id']
+    assert (by_site['http://a.com']['Email'], by_site['http://a.com']['Decision Maker']) == ('ana@a.com', 'Ana')
+    assert by_site['http://c.com']['Decision Maker'] == 'Cy'
+
+    lead_store.save_lead_emails([{'id': lead['id'], 'Email': 'boss@a.com'}], campaign_id)
+    assert lead_store.get_leads(campaign_id, with_email=True)[0]['Email'] == 'boss@a.com'
+
+
+def test_update_lead_ignores_unknown_fields():
+    campaign_id = lead_store.create_campaign('me@example.com', 'dentists', 'Madrid')
+    lead = lead_store.add_lead(campaign_id, {'Name': 'A', 'Website': 'http://a.com'})
+    lead_store.update_lead(lead['id'], {'EmailSent': True, 'FollowUpCount': 2, 'Bogus': 1})
+
+    stored = lead_store.get_leads(campaign_id)[0]
+    assert (stored['EmailSent'], stored['FollowUpCount']) == (True, 2)
+
+
+def test_migrates_databases_created_before_website_key(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.executescript('''
+        CREATE TABLE leads (id INTEGER PRIMARY KEY, campaign_id INTEGER, name TEXT, website TEXT, domain TEXT,
+                            email TEXT, decision_maker TEXT, email_sent INTEGER NOT NULL DEFAULT 0,
+                            last_email_date TEXT, follow_up_count INTEGER NOT NULL DEFAULT 0, response TEXT,
+                            response_date TEXT, response_content TEXT, last_email_classification TEXT,
+                            created_at TEXT NOT NULL, UNIQUE (campaign_id, website));
+        INSERT INTO leads (campaign_id, website, created_at) VALUES (1, 'http://a.com', 'x'), (1, 'http://a.com/', 'x');
+    ''')
+    conn.close()
+
+    keys = [row['website_key'] for row in lead_store.connect().execute('SELECT website_key FROM leads ORDER BY id')]
+    assert keys == ['a.com', 'a.com#2']
+    assert lead_store.add_lead(1, {'Name': 'A', 'Website': 'https://a.com'}) is None
+
+
+def test_emails_sent_today_counts_the_senders_leads_emailed_today():
+    mine = lead_store.create_campaign('me@example.com', 'dentists', 'Madrid')
+    other = lead_store.create_campaign('you@example.com', 'dentists', 'Madrid')
+    today, yesterday = datetime.now().isoformat(), (datetime.now() - timedelta(days=1)).isoformat()
+    for campaign_id, website, sent_at in ((mine, 'a.com', today), (mine, 'b.com', yesterday),
+                                          (mine, 'c.com', None), (other, 'a.com', today)):
+        lead = lead_store.add_lead(campaign_id, {'Website': website})
+        lead_store.update_lead(lead['id'], {'LastEmailDate': sent_at})
+
+    assert lead_store.emails_sent_today('me@example.com') == 1
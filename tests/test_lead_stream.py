@@ -0,0 +1,41 @@
+"""Cancellation of the staged lead stream."""
+import threading
+
+from lead_stream import StageQueue
+
+
+def test_setting_stop_ends_an_idle_reader_and_abandons_the_queue():
+    stop = threading.Event()
+    stream = StageQueue(0, stop=stop)
+    received = []
+    reader = threading.Thread(target=lambda: received.extend(stream))
+    reader.start()
+
+    stop.set()
+    reader.join(2)
+
+    assert not reader.is_alive()
+    assert stream.abandoned.is_set()
+    assert not stream.put({'Name': 'late'})
+
+
+
+def test_crawl_stage_stops_once_the_cancelled_stream_is_abandoned():
+    from lead_stream import crawl_stage
+
+    class Worker:
+        def crawl(self, campaign_id, leads, on_lead):
+            raise AssertionError('nothing should be crawled after a cancel')
+
+    stop = threading.Event()
+    inbox, outbox = StageQueue(), StageQueue(0, stop=stop)
+    stage = threading.Thread(target=crawl_stage, args=(inbox, outbox), kwargs={'worker': Worker()})
+    stage.start()
+    reader = threading.Thread(target=lambda: list(outbox))
+    reader.start()
+
+    stop.set()
+    reader.join(2)
+    stage.join(2)
+    assert not stage.is_alive()
+    assert inbox.abandoned.is_set()
@@ -0,0 +1,103 @@
+"""Quotas, per-account pacing and cancellation in the send scheduler."""
+import threading
+import time
+from datetime import timedelta
+
+from send_scheduler import DailyQuota, SendScheduler, TokenBucket, gather
+
+
+def test_token_bucket_refills_over_its_period():
+    bucket = TokenBucket(2, period=1.0)
+    now = time.monotonic()
+    bucket.take(now)
+    bucket.take(now)
+    assert bucket.wait_time(now) > 0.4
+
+    assert bucket.wait_time(now + 0.5) == 0.0
+    assert bucket.wait_time(now + 10) == 0.0
+    assert bucket.tokens == 2  # never above capacity
+
+
+def test_daily_quota_counts_from_the_seed_and_resets_at_midnight():
+    quota = DailyQuota(3, sent=2)
+    assert quota.wait_time(0) == 0.0
+    quota.take(0)
+    wait = quota.wait_time(0)
+    assert 0 < wait <= 24 * 60 * 60
+
+    quota.day -= timedelta(days=1)  # the counter was filled yesterday
+    assert quota.wait_time(0) == 0.0
+    assert quota.sent == 0
+
+
+def test_seeded_quota_holds_back_sends_after_a_restart():
+    scheduler = SendScheduler(daily_quota=5, interval=0, jitter=0, sent_today=lambda account: 5)
+    try:
+        future = scheduler.schedule('me@example.com', lambda: 'sent')
+        time.sleep(0.2)
+        assert not future.done()
+        assert scheduler.pending('me@example.com') == 1
+    finally:
+        scheduler.stop()
+
+
+def test_sends_for_one_account_never_overlap_but_accounts_run_in_parallel():
+    scheduler = SendScheduler(workers=4, interval=0, jitter=0)
+    active, overlaps, lock = {}, [], threading.Lock()
+
+    def send(account):
+        with lock:
+            active[account] = active.get(account, 0) + 1
+            if active[account] > 1:
+                overlaps.append(account)
+            running_accounts = sum(1 for count in active.values() if count)
+        time.sleep(0.05)
+        with lock:
+            active[account] -= 1
+        return running_accounts
+
+    try:
+        futures = [scheduler.schedule(account, lambda account=account: send(account))
+                   for _ in range(3) for account in ('a@example.com', 'b@example.com')]
+        results = [future.result(5) for future in futures]
+    finally:
+        scheduler.stop()
+
+    assert overlaps == []
+    assert max(results) == 2
+
+
+def test_interval_spaces_sends_from_the_same_account():
+    scheduler = SendScheduler(interval=0.2, jitter=0)
+    try:
+        futures = [scheduler.schedule('me@example.com', time.monotonic) for _ in range(3)]
+        times = [future.result(5) for future in futures]
+    finally:
+        scheduler.stop()
+    assert all(later - earlier >= 0.19 for earlier, later in zip(times, times[1:]))
+
+
+def test_cancelled_campaign_releases_its_queued_sends():
+    scheduler = SendScheduler(interval=0.3, jitter=0)
+    cancel_event = threading.Event()
+    sent = []
+    try:
+        futures = [scheduler.schedule('me@example.com', lambda i=i: sent.append(i), cancel_event) for i in range(3)]
+        futures[0].result(5)
+        cancel_event.set()
+        gather(futures).result(5)
+    finally:
+        scheduler.stop()
+
+    assert sent == [0]
+    assert all(future.cancelled() for future in futures[1:])
+
+
+def test_after_runs_once_every_send_is_done():
+    scheduler = SendScheduler(interval=0, jitter=0)
+    sent = []
+    try:
+        futures = [scheduler.schedule('me@example.com', lambda i=i: sent.append(i)) for i in range(3)]
+        assert scheduler.after(futures, lambda: list(sent)).result(5) == [0, 1, 2]
+    finally:
+        scheduler.stop()
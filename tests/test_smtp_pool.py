@@ -0,0 +1,152 @@
+"""SMTPPool against a local aiosmtpd server with STARTTLS and AUTH, like Gmail's submission port."""
+import datetime
+import socket
+import ssl
+import time
+
+import pytest
+
+pytest.importorskip('aiosmtpd')
+from aiosmtpd.controller import Controller  # noqa: E402
+from aiosmtpd.smtp import AuthResult  # noqa: E402
+from cryptography import x509  # noqa: E402
+from cryptography.hazmat.primitives import hashes, serialization  # noqa: E402
+from cryptography.hazmat.primitives.asymmetric import ec  # noqa: E402
+from cryptography.x509.oid import NameOID  # noqa: E402
+
+from smtp_pool import SMTPPool  # noqa: E402
+
+USER = 'sender@example.com'
+PASSWORD = 'app-password'
+MESSAGE = 'Subject: Hello\r\n\r\nHi there'
+
+
+class RecordingHandler:
+    """Stores delivered messages; ``fail_next`` makes the next DATA reply 421 or drop the connection."""
+
+    def __init__(self):
+        self.messages = []
+        self.fail_next = None
+
+    async def handle_DATA(self, server, session, envelope):
+        failure, self.fail_next = self.fail_next, None
+        if failure == 'disconnect':
+            server.transport.close()
+            return '421 Connection dropped'
+        if failure == '421':
+            return '421 Service not available, closing transmission channel'
+        self.messages.append((envelope.mail_from, envelope.rcpt_tos))
+        return '250 OK'
+
+
+def authenticate(server, session, envelope, mechanism, auth_data):
+    return AuthResult(success=auth_data.login == USER.encode() and auth_data.password == PASSWORD.encode())
+
+
+@pytest.fixture(scope='module')
+def tls_context(tmp_path_factory):
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'localhost')])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+                   .serial_number(x509.random_serial_number())
+                   .not_valid_before(now - datetime.timedelta(days=1))
+                   .not_valid_after(now + datetime.timedelta(days=1))
+                   .sign(key, hashes.SHA256()))
+    directory = tmp_path_factory.mktemp('tls')
+    cert_path, key_path = directory / 'cert.pem', directory / 'key.pem'
+    cert_path.write_bytes(certificate.public_bytes(serialization.Encoding.PEM))
+    key_path.write_bytes(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                           serialization.NoEncryption()))
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(str(cert_path), str(key_path))
+    return context
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(tls_context, **kwargs):
+    handler = RecordingHandler()
+    controller = Controller(handler, hostname='127.0.0.1', port=free_port(), tls_context=tls_context,
+                            authenticator=authenticate, auth_require_tls=True, **kwargs)
+    controller.start()
+    return handler, controller
+
+
+@pytest.fixture
+def server(tls_context):
+    handler, controller = start_server(tls_context)
+    yield handler, controller
+    controller.stop()
+
+
+def make_pool(controller, **kwargs):
+    return SMTPPool('127.0.0.1', controller.port, USER, PASSWORD, **kwargs)
+
+
+def test_sends_for_one_account_share_a_session(server):
+    handler, controller = server
+    pool = make_pool(controller)
+    for index in range(3):
+        pool.sendmail(USER, [f'lead{index}@example.org'], MESSAGE)
+    pool.close()
+
+    assert pool.connections_opened == 1
+    assert [rcpt for _, rcpt in handler.messages] == [['lead0@example.org'], ['lead1@example.org'], ['lead2@example.org']]
+
+
+def test_noop_check_replaces_a_session_the_server_timed_out(tls_context):
+    handler, controller = start_server(tls_context, timeout=0.3)
+    try:
+        pool = make_pool(controller)
+        pool.sendmail(USER, ['first@example.org'], MESSAGE)
+        time.sleep(0.8)  # the server closes the idle session; only the NOOP on checkout notices
+        pool.sendmail(USER, ['second@example.org'], MESSAGE)
+        pool.close()
+    finally:
+        controller.stop()
+
+    assert pool.connections_opened == 2
+    assert len(handler.messages) == 2
+
+
+def test_reconnects_and_retries_when_the_server_disconnects_mid_send(server):
+    handler, controller = server
+    pool = make_pool(controller)
+    pool.warm()
+    handler.fail_next = 'disconnect'
+    pool.sendmail(USER, ['lead@example.org'], MESSAGE)
+    pool.close()
+
+    assert pool.connections_opened == 2
+    assert handler.messages == [(USER, ['lead@example.org'])]
+
+
+def test_reconnects_and_retries_after_a_421_reply(server):
+    handler, controller = server
+    pool = make_pool(controller)
+    pool.warm()
+    handler.fail_next = '421'
+    pool.sendmail(USER, ['lead@example.org'], MESSAGE)
+    pool.close()
+
+    assert pool.connections_opened == 2
+    assert handler.messages == [(USER, ['lead@example.org'])]
+
+
+def test_idle_sessions_expire(server):
+    handler, controller = server
+    pool = make_pool(controller, max_idle=0.2)
+    pool.sendmail(USER, ['first@example.org'], MESSAGE)
+    pool.sendmail(USER, ['second@example.org'], MESSAGE)
+    time.sleep(0.4)
+    pool.sendmail(USER, ['third@example.org'], MESSAGE)
+    pool.close()
+
+    assert pool.connections_opened == 2
+    assert len(handler.messages) == 3
+